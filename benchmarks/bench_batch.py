@@ -0,0 +1,63 @@
+'''
+N separate process invocations vs one --batch run of the same N jobs.
+
+    PYTHONPATH=. python benchmarks/bench_batch.py
+'''
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT = """
+from subparser import subparser
+
+subcommand = subparser()
+
+@subcommand
+def job(number, name):
+    return number * 2
+job.add_argument('--number', type=int, default=0)
+job.add_argument('--name', default='job')
+
+subcommand.add_batch('--batch')
+subcommand.dispatch()
+"""
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    try:
+        script = os.path.join(tmp, 'cli.py')
+        with open(script, 'w') as f:
+            f.write(SCRIPT)
+        env = dict(os.environ, PYTHONPATH=os.getcwd())
+        print('%6s %14s %12s %8s' % ('jobs', 'processes (s)', 'batch (s)',
+                                     'speedup'))
+        for count in (10, 50, 200):
+            jobs = os.path.join(tmp, 'jobs.txt')
+            with open(jobs, 'w') as f:
+                for i in range(count):
+                    f.write('job --number %d --name job%d\n' % (i, i))
+
+            start = time.time()
+            for i in range(count):
+                subprocess.check_call([sys.executable, script, 'job',
+                                       '--number', str(i)], env=env)
+            processes = time.time() - start
+
+            start = time.time()
+            subprocess.check_call([sys.executable, script, '--batch', jobs],
+                                  env=env)
+            batch = time.time() - start
+            print('%6d %14.3f %12.3f %7.1fx' % (count, processes, batch,
+                                                processes / batch))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+'''
+startup and parse time of a CLI with N subcommands, through the Subcommand
+vs the parser module generated by subparser.codegen.  dispatch functions are
+registered lazily, so the generated module never imports the CLI.
+
+    PYTHONPATH=. python benchmarks/bench_codegen.py
+'''
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+from subparser.codegen import generate
+
+CLI = '''
+from subparser import subparser
+
+subcommand = subparser(lazy=True)
+subcommand.add_argument('--verbose', action='store_true')
+for i in range(%d):
+    command = subcommand.lazy('command%%d' %% i, 'cli_impl:main')
+    command.add_argument('--name', env='BENCH_NAME')
+    command.add_argument('--value', type=int, default=0)
+    command.add_argument('files', nargs='*')
+'''
+
+ARGV = ['--verbose', 'command0', '--name', 'x', '--value', '3', 'a', 'b']
+
+
+def startup(directory, module):
+    target = 'cli.subcommand' if module == 'cli' else module
+    code = 'import %s; %s.resolve(%r)' % (module, target, ARGV)
+    env = dict(os.environ,
+               PYTHONPATH=os.pathsep.join([directory] + sys.path))
+    # as installed, with compiled modules cached
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    subprocess.check_call([sys.executable, '-c', code], env=env)
+    command = [sys.executable, '-c', code]
+    return min(timeit.repeat(lambda: subprocess.check_call(command, env=env),
+                             number=1, repeat=10))
+
+
+def main():
+    print('%8s %14s %14s %14s %14s' % ('commands', 'startup (ms)', 'generated',
+                                       'parse (us)', 'generated'))
+    for count in (10, 100, 1000):
+        directory = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(directory, 'cli.py'), 'w') as f:
+                f.write(CLI % count)
+            sys.path.insert(0, directory)
+            import cli
+            with open(os.path.join(directory, 'cli_fast.py'), 'w') as f:
+                f.write(generate('cli:subcommand', cli.subcommand))
+            import cli_fast
+            dynamic = min(timeit.repeat(lambda: cli.subcommand.resolve(ARGV),
+                                        number=1000, repeat=3))
+            fast = min(timeit.repeat(lambda: cli_fast.resolve(ARGV),
+                                     number=1000, repeat=3))
+            print('%8d %14.1f %14.1f %14.1f %14.1f' % (
+                count, startup(directory, 'cli') * 1e3,
+                startup(directory, 'cli_fast') * 1e3,
+                dynamic * 1e3, fast * 1e3))
+        finally:
+            sys.path.remove(directory)
+            for module in ('cli', 'cli_fast'):
+                sys.modules.pop(module, None)
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+'''
+per-dispatch cost of mapping a namespace onto a function: the previous
+per-call introspection, ns_dispatch, and a precompiled Binder.
+
+    PYTHONPATH=. python benchmarks/bench_dispatch.py
+'''
+from __future__ import print_function
+
+import argparse
+import inspect
+import timeit
+
+from subparser.subparser import Binder, ns_dispatch
+
+getargspec = getattr(inspect, 'getfullargspec',
+                     getattr(inspect, 'getargspec', None))
+
+
+def introspecting_dispatch(func, ns, pass_ns=True):
+    # ns_dispatch as it was before Binder
+    kwargs = {}
+    args = []
+    values = vars(ns)
+    consumed = []
+    spec = getargspec(func)
+    for arg in spec.args:
+        consumed.append(arg)
+        if arg == 'ns' and pass_ns:
+            args.append(ns)
+        else:
+            args.append(values[arg])
+    if spec.varargs:
+        if isinstance(values[spec.varargs], (list, tuple)):
+            args.extend(values[spec.varargs])
+        else:
+            args.append(values[spec.varargs])
+    if spec[2]:
+        for k, v in values.items():
+            if k not in consumed:
+                kwargs[k] = v
+        if 'ns' not in consumed and pass_ns:
+            kwargs['ns'] = ns
+    return func(*args, **kwargs)
+
+
+def positional(a, b, c, d):
+    pass
+
+
+def with_ns(a, b, ns):
+    pass
+
+
+def with_kwargs(a, b, **kwargs):
+    pass
+
+
+def with_varargs(a, *rest, **kwargs):
+    pass
+
+
+def main():
+    ns = argparse.Namespace(**dict(('opt%d' % i, i) for i in range(30)))
+    ns.a, ns.b, ns.c, ns.d, ns.rest = 1, 2, 3, 4, [5, 6, 7]
+    number = 20000
+    print('%-14s %14s %14s %14s' % ('signature', 'introspect (us)',
+                                    'ns_dispatch (us)', 'Binder (us)'))
+    for func in (positional, with_ns, with_kwargs, with_varargs):
+        binder = Binder(func)
+        calls = [lambda: introspecting_dispatch(func, ns),
+                 lambda: ns_dispatch(func, ns),
+                 lambda: binder(ns)]
+        timings = [min(timeit.repeat(call, number=number, repeat=3))
+                   for call in calls]
+        print('%-14s %14.2f %16.2f %14.2f' % (
+            (func.__name__,) + tuple(t / number * 1e6 for t in timings)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''
+reading a few keys from large json configs with JsonConfig vs LazyJsonConfig,
+with and without a sidecar of the key offsets.  each load runs in a fresh
+process, as on startup, and reports its time and peak python heap usage
+(measured in a separate run, under tracemalloc).
+
+    PYTHONPATH=. python benchmarks/bench_lazyjson.py
+'''
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_sidecar import make_json  # noqa: E402
+
+LOAD = """
+import sys, time, tracemalloc
+from subparser import JsonConfig, LazyJsonConfig, SidecarCache
+kind = LazyJsonConfig if sys.argv[2].startswith('lazy') else JsonConfig
+if sys.argv[2] == 'lazy+sidecar':
+    kind.sidecar = SidecarCache(sys.argv[3])
+if sys.argv[4] == 'memory':
+    tracemalloc.start()
+start = time.time()
+config = kind()
+config.load(sys.argv[1])
+for name in ('host000007', 'host000100', 'missing'):
+    config.get((name, 'address'), None)
+if sys.argv[4] == 'time':
+    print(time.time() - start)
+else:
+    print(tracemalloc.get_traced_memory()[1])
+"""
+
+
+def load(path, mode, cache_dir, measure='time'):
+    out = subprocess.check_output(
+        [sys.executable, '-c', LOAD, path, mode, cache_dir, measure],
+        env=dict(os.environ, PYTHONPATH=os.getcwd()))
+    return float(out)
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    try:
+        print('%6s %14s %10s %12s' % ('size', 'backend', 'time (ms)',
+                                      'heap (KB)'))
+        sizes = (('1MB', 1 << 20), ('10MB', 10 << 20), ('50MB', 50 << 20))
+        for label, size in sizes:
+            path = os.path.join(tmp, 'config-%s.json' % label)
+            make_json(path, size)
+            for mode in ('json', 'lazy', 'lazy+sidecar'):
+                load(path, mode, tmp)  # warm the page cache and the sidecar
+                seconds = min(load(path, mode, tmp) for i in range(3))
+                heap = load(path, mode, tmp, 'memory')
+                print('%6s %14s %10.1f %12d' % (label, mode, seconds * 1e3,
+                                                heap / 1024))
+            os.unlink(path)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+'''
+resolving command-lines of thousands of tokens with a config option, which
+is extracted from a single scan of argv before the main parse.
+
+    PYTHONPATH=. python benchmarks/bench_longargv.py
+'''
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import tempfile
+import timeit
+
+from subparser import subparser
+
+
+def make_subcommand():
+    subcommand = subparser()
+
+    @subcommand
+    def files(paths, verbose):
+        return len(paths)
+    files.add_argument('paths', nargs='*')
+    files.add_argument('--verbose', action='store_true', config='verbose')
+    subcommand.add_config('-c', '--config', dest='config')
+    return subcommand
+
+
+def best(func, number):
+    # seconds per call, from the fastest of three runs
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    try:
+        config = os.path.join(tmp, 'config.json')
+        with open(config, 'w') as f:
+            json.dump({'verbose': True}, f)
+        subcommand = make_subcommand()
+        parser, action = subcommand.config_parser, subcommand.config_action
+        print('%8s %16s %16s %12s' % ('tokens', 'config (ms)', 'scan (ms)',
+                                      'total (ms)'))
+        for count in (100, 1000, 5000, 20000):
+            argv = (['files'] + ['file%d' % i for i in range(count)] +
+                    ['--config', config])
+            number = max(1, 20000 // count)
+            old = best(lambda: parser.parse_known_args(argv), number)
+            new = best(lambda: subcommand.parse_options(parser, [action],
+                                                        argv), number)
+            total = best(lambda: subcommand.dispatch(argv), number)
+            print('%8d %16.2f %16.2f %12.2f' % (count, old * 1e3, new * 1e3,
+                                                total * 1e3))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+'''
+memory held per parsed namespace, and the time to resolve and dispatch one,
+with argparse namespaces vs subparser(slots=True).
+
+    PYTHONPATH=. python benchmarks/bench_namespace.py
+'''
+from __future__ import print_function
+
+import timeit
+import tracemalloc
+
+from subparser import subparser
+
+COUNT = 10000
+
+
+def make_subcommand(slots, options):
+    subcommand = subparser(slots=slots)
+    subcommand.add_argument('--verbose', action='store_true')
+
+    @subcommand
+    def job(ns):
+        return ns
+    for i in range(options):
+        job.add_argument('--option%d' % i, default=i)
+    return subcommand
+
+
+def held(subcommand, argv):
+    subcommand.resolve(argv)  # build the namespace class
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    queued = [subcommand.resolve(argv) for i in range(COUNT)]
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del queued
+    return size / COUNT
+
+
+def best(func, number):
+    # seconds per call, from the fastest of three runs
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main():
+    print('%8s %10s %12s %14s %12s' % ('dests', 'slots', 'bytes/ns',
+                                       'resolve (us)', 'dispatch (us)'))
+    for options in (2, 8, 32):
+        for slots in (False, True):
+            subcommand = make_subcommand(slots, options)
+            argv = ['job', '--option0', 'x']
+            size = held(subcommand, argv)
+            resolve = best(lambda: subcommand.resolve(argv), 2000)
+            dispatch = best(lambda: subcommand.dispatch(argv), 2000)
+            print('%8d %10s %12d %14.1f %12.1f' % (
+                options + 3, slots, size, resolve * 1e6, dispatch * 1e6))
+
+
+if __name__ == '__main__':
+    main()
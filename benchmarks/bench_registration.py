@@ -0,0 +1,46 @@
+'''
+startup cost of registering N subcommands, eager vs lazy.
+
+    PYTHONPATH=. python benchmarks/bench_registration.py
+'''
+from __future__ import print_function
+
+import timeit
+
+from subparser import subparser
+
+
+def register(count, lazy):
+    subcommand = subparser(lazy=lazy)
+    for i in range(count):
+        def command(name, value):
+            pass
+        wrapper = subcommand('command%d' % i)(command)
+        wrapper.add_argument('--name')
+        wrapper.add_argument('--value', type=int, default=0)
+    return subcommand
+
+
+def startup(count, lazy):
+    subcommand = register(count, lazy)
+    subcommand.parse_args(['command0', '--name', 'x'])
+
+
+def best(func, number):
+    # seconds per call, from the fastest of three runs
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+
+def main():
+    print('%8s %12s %12s %8s' % ('commands', 'eager (ms)', 'lazy (ms)',
+                                 'speedup'))
+    for count in (10, 100, 1000):
+        number = max(1, 1000 // count)
+        eager = best(lambda: startup(count, False), number)
+        lazy = best(lambda: startup(count, True), number)
+        print('%8d %12.2f %12.2f %7.1fx' % (count, eager * 1e3, lazy * 1e3,
+                                            eager / lazy))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+'''
+latency of a cold CLI invocation vs the same command through a resident
+dispatch server, from a python client process and from an in-process call.
+
+    PYTHONPATH=. python benchmarks/bench_server.py
+'''
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from subparser import client
+
+SCRIPT = """
+import sys
+from subparser import subparser
+
+subcommand = subparser()
+
+for i in range(%(commands)d):
+    def command(name):
+        pass
+    subcommand('command%%d' %% i)(command).add_argument('--name')
+
+if sys.argv[1:2] == ['--serve']:
+    subcommand.serve(sys.argv[2])
+else:
+    subcommand.dispatch()
+"""
+
+
+def timed(func, repeat):
+    start = time.time()
+    for i in range(repeat):
+        func()
+    return (time.time() - start) / repeat
+
+
+def main(repeat=20):
+    tmp = tempfile.mkdtemp()
+    devnull = open(os.devnull, 'w')
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    print('%9s %12s %16s %14s' % ('commands', 'cold (ms)', 'client proc (ms)',
+                                  'call (ms)'))
+    try:
+        for commands in (10, 200, 1000):
+            script = os.path.join(tmp, 'cli%d.py' % commands)
+            with open(script, 'w') as f:
+                f.write(SCRIPT % {'commands': commands})
+            path = os.path.join(tmp, 'cli%d.sock' % commands)
+            server = subprocess.Popen(
+                [sys.executable, script, '--serve', path], env=env)
+            try:
+                while not os.path.exists(path):
+                    time.sleep(0.01)
+                argv = ['command0', '--name', 'x']
+                direct = [sys.executable, script] + argv
+                proxied = [sys.executable,
+                           client.__file__.replace('.pyc', '.py'),
+                           path] + argv
+                stdio = (0, devnull.fileno(), 2)
+                cold = timed(lambda: subprocess.check_call(direct, env=env),
+                             repeat)
+                proc = timed(lambda: subprocess.check_call(proxied, env=env),
+                             repeat)
+                call = timed(lambda: client.call(path, argv, stdio=stdio),
+                             repeat)
+                print('%9d %12.1f %16.1f %14.1f' % (commands, cold * 1e3,
+                                                    proc * 1e3, call * 1e3))
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        devnull.close()
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+'''
+loading json and ini configs from text vs from a compiled sidecar, across
+config sizes.  each load runs in a fresh process, as on startup.
+
+    PYTHONPATH=. python benchmarks/bench_sidecar.py
+'''
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+LOAD = """
+import sys, time
+from subparser import JsonConfig, IniConfig, SidecarCache
+kind = IniConfig if sys.argv[1].endswith('.ini') else JsonConfig
+if sys.argv[2] == 'sidecar':
+    kind.sidecar = SidecarCache(sys.argv[3])
+start = time.time()
+config = kind()
+config.load(sys.argv[1])
+print(time.time() - start)
+"""
+
+
+def host(i):
+    return {'address': '10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255),
+            'role': ['web', 'db', 'cache'][i % 3], 'port': str(8000 + i % 100),
+            'rack': 'r%d' % (i % 40), 'zone': 'z%d' % (i % 4)}
+
+
+def make_json(path, size):
+    doc = {}
+    total = i = 0
+    while total < size:
+        name = 'host%06d' % i
+        doc[name] = host(i)
+        total += len(name) + len(json.dumps(doc[name])) + 6
+        i += 1
+    with open(path, 'w') as f:
+        json.dump(doc, f)
+
+
+def make_ini(path, size):
+    with open(path, 'w') as f:
+        i = 0
+        while f.tell() < size:
+            f.write('[host%06d]\n' % i)
+            for option, value in sorted(host(i).items()):
+                f.write('%s = %s\n' % (option, value))
+            i += 1
+
+
+def load(path, mode, cache_dir):
+    out = subprocess.check_output(
+        [sys.executable, '-c', LOAD, path, mode, cache_dir],
+        env=dict(os.environ, PYTHONPATH=os.getcwd()))
+    return float(out)
+
+
+def main():
+    tmp = tempfile.mkdtemp()
+    try:
+        print('%6s %10s %12s %14s %8s' % ('format', 'size', 'text (ms)',
+                                          'sidecar (ms)', 'speedup'))
+        sizes = (('10KB', 10 << 10), ('100KB', 100 << 10), ('1MB', 1 << 20),
+                 ('10MB', 10 << 20), ('50MB', 50 << 20))
+        for ext, make in (('json', make_json), ('ini', make_ini)):
+            for label, size in sizes:
+                path = os.path.join(tmp, 'config-%s.%s' % (label, ext))
+                make(path, size)
+                text = min(load(path, 'text', tmp) for i in range(3))
+                load(path, 'sidecar', tmp)  # compile the sidecar
+                sidecar = min(load(path, 'sidecar', tmp) for i in range(3))
+                print('%6s %10s %12.1f %14.1f %7.1fx' % (
+                    ext, label, text * 1e3, sidecar * 1e3, text / sidecar))
+                os.unlink(path)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,471 @@
+'''
+the benchmark suite: registration, import, dispatch, ns_dispatch, config
+backends and env-heavy parsers, each at a few sizes.
+
+    PYTHONPATH=. python benchmarks/suite.py                    # everything
+    PYTHONPATH=. python benchmarks/suite.py -k config --quick  # a subset
+    PYTHONPATH=. python benchmarks/suite.py --save benchmarks/baseline.json
+    PYTHONPATH=. python benchmarks/suite.py --compare benchmarks/baseline.json
+
+each case reports the best time per call over several repeats.  --compare
+prints each case against the stored baseline and exits with 1 if any is
+slower than --threshold times its baseline.  baselines are only comparable
+on the machine (and python) that recorded them.
+'''
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from subparser import subparser, IniConfig, JsonConfig
+from subparser.subparser import Binder, ns_dispatch
+
+clock = getattr(time, 'perf_counter', time.time)
+
+CASES = []
+
+
+def case(name, params=(None,)):
+    '''
+    registers a benchmark.  the decorated function is called with each
+    param, outside the timing, and returns the callable that is timed.
+    '''
+    def register(func):
+        for param in params:
+            label = name if param is None else '%s/%s' % (name, param)
+            CASES.append((label, func, param))
+        return func
+    return register
+
+
+def measure(run, budget, repeat):
+    '''
+    best seconds per call of run, calling it enough times per repeat to
+    fill budget seconds
+    '''
+    number = 1
+    while True:
+        start = clock()
+        for _ in range(number):
+            run()
+        elapsed = clock() - start
+        if elapsed >= budget / 10.0 or number >= 1 << 20:
+            break
+        number *= 10
+    best = elapsed / number
+    number = max(1, int(number * budget / max(elapsed, 1e-9)))
+    for _ in range(repeat - 1):
+        start = clock()
+        for _ in range(number):
+            run()
+        best = min(best, (clock() - start) / number)
+    return best
+
+
+def register(count, lazy):
+    subcommand = subparser(lazy=lazy)
+    for i in range(count):
+        def command(name, value):
+            pass
+        wrapper = subcommand('command%d' % i)(command)
+        wrapper.add_argument('--name')
+        wrapper.add_argument('--value', type=int, default=0)
+    return subcommand
+
+
+@case('register/eager', params=(10, 100, 1000, 5000))
+def register_eager(count):
+    return lambda: register(count, False)
+
+
+@case('register/lazy', params=(10, 100, 1000, 5000))
+def register_lazy(count):
+    return lambda: register(count, True)
+
+
+def python(code):
+    env = dict(os.environ)
+    # as installed, with compiled modules cached
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    env['PYTHONPATH'] = os.pathsep.join(sys.path)
+    command = [sys.executable, '-c', code]
+    subprocess.check_call(command, env=env)
+    return lambda: subprocess.check_call(command, env=env)
+
+
+@case('import/python')
+def import_python(_):
+    return python('pass')
+
+
+@case('import/subparser')
+def import_subparser(_):
+    return python('import subparser')
+
+
+def dispatch_subcommand():
+    subcommand = subparser()
+    subcommand.add_argument('--verbose', action='store_true')
+
+    @subcommand
+    def hello(name, times, ns):
+        return name
+    hello.add_argument('--name', default='John', config='name')
+    hello.add_argument('--times', type=int, default=1, config='times')
+    return subcommand
+
+
+@case('dispatch/plain')
+def dispatch_plain(_):
+    subcommand = dispatch_subcommand()
+    argv = ['--verbose', 'hello', '--name', 'Joe', '--times', '3']
+    return lambda: subcommand.dispatch(argv, env={})
+
+
+@case('dispatch/config')
+def dispatch_config(_):
+    subcommand = dispatch_subcommand()
+    subcommand.add_config('--config')
+    path = temporary('config.json', json.dumps({'name': 'Jane', 'times': 2}))
+    argv = ['--config', path, 'hello', '--times', '3']
+    return lambda: subcommand.dispatch(argv, env={})
+
+
+@case('dispatch/prefetch')
+def dispatch_prefetch(_):
+    subcommand = subparser()
+    subcommand.add_config('--config', prefetch=True)
+
+    @subcommand
+    def hello(name, times, ns):
+        return name
+    hello.add_argument('--name', default='John', config='name')
+    hello.add_argument('--times', type=int, default=1, config='times')
+    path = temporary('config.json', json.dumps({'name': 'Jane', 'times': 2}))
+    argv = ['--config', path, 'hello', '--times', '3']
+    return lambda: subcommand.dispatch(argv, env={})
+
+
+# a config file taking 10ms to open, and a main option taking as long to check
+SLOW = 0.01
+
+
+class SlowConfig(JsonConfig):
+    cache = None
+
+    def parse(self, source):
+        time.sleep(SLOW)
+        return super(SlowConfig, self).parse(source)
+
+
+def slow_check(value):
+    time.sleep(SLOW)
+    return value
+
+
+@case('dispatch/slowfs', params=('sync', 'prefetch'))
+def dispatch_slowfs(mode):
+    subcommand = subparser()
+    subcommand.add_config('--config', config_class=SlowConfig,
+                          prefetch=mode == 'prefetch')
+    subcommand.add_argument('--output', type=slow_check)
+
+    @subcommand
+    def hello(name, ns):
+        return name
+    hello.add_argument('--name', default='John', config='name')
+    path = temporary('slow.json', json.dumps({'name': 'Jane'}))
+    argv = ['--config', path, '--output', 'x', 'hello']
+    return lambda: subcommand.dispatch(argv, env={})
+
+
+def signature_positional(a, b, c):
+    pass
+
+
+def signature_ns(a, b, ns):
+    pass
+
+
+def signature_kwargs(a, **kwargs):
+    pass
+
+
+def signature_varargs(a, *c, **kwargs):
+    pass
+
+
+SIGNATURES = dict((name[len('signature_'):], func)
+                  for name, func in globals().items()
+                  if name.startswith('signature_'))
+if sys.version_info[0] >= 3:
+    exec('def signature_kwonly(a, *, b, d=None):\n    pass\n')
+    SIGNATURES['kwonly'] = signature_kwonly  # noqa: F821
+
+
+def signature_namespace():
+    return argparse.Namespace(a=1, b=2, c=[3, 4], d=5, command='x', func=None)
+
+
+@case('ns_dispatch', params=sorted(SIGNATURES))
+def bench_ns_dispatch(shape):
+    func, ns = SIGNATURES[shape], signature_namespace()
+    return lambda: ns_dispatch(func, ns)
+
+
+@case('binder', params=sorted(SIGNATURES))
+def bench_binder(shape):
+    binder, ns = Binder(SIGNATURES[shape]), signature_namespace()
+    return lambda: binder(ns)
+
+
+def uncached(config_class):
+    return type(config_class.__name__, (config_class,),
+                {'cache': None, 'sidecar': None})
+
+
+def json_config(count):
+    keys = ['key%d' % i for i in range(count)]
+    source = json.dumps(dict((key, key) for key in keys))
+    return temporary('config%d.json' % count, source), keys
+
+
+def ini_config(count):
+    keys = [('section%d' % (i % 10), 'key%d' % i) for i in range(count)]
+    sections = {}
+    for section, key in keys:
+        sections.setdefault(section, []).append('%s = %s' % (key, key))
+    source = ''.join('[%s]\n%s\n' % (section, '\n'.join(lines))
+                     for section, lines in sorted(sections.items()))
+    return temporary('config%d.ini' % count, source), keys
+
+
+CONFIG_SIZES = (10, 1000, 10000)
+
+
+@case('config/json/load', params=CONFIG_SIZES)
+def json_load(count):
+    path, _ = json_config(count)
+    config_class = uncached(JsonConfig)
+    return lambda: config_class().load(path)
+
+
+@case('config/ini/load', params=CONFIG_SIZES)
+def ini_load(count):
+    path, _ = ini_config(count)
+    config_class = uncached(IniConfig)
+    return lambda: config_class().load(path)
+
+
+def first_gets(config, path, keys):
+    config.load(path)
+
+    def run():
+        # every key looked up in the parsed file, as a fresh load would
+        config._index = {}
+        for key in keys:
+            config.get(key, None)
+    return run
+
+
+@case('config/json/get', params=CONFIG_SIZES)
+def json_get(count):
+    path, keys = json_config(count)
+    return first_gets(uncached(JsonConfig)(), path, keys)
+
+
+@case('config/ini/get', params=CONFIG_SIZES)
+def ini_get(count):
+    path, keys = ini_config(count)
+    return first_gets(uncached(IniConfig)(), path, keys)
+
+
+@case('config/layered/get', params=(1, 4, 16))
+def layered_get(layers):
+    from subparser.layered import LayeredConfig
+    paths = [json_config(1000)[0]]
+    for i in range(1, layers):
+        layer = dict(('key%d' % k, i) for k in range(i, 1000, 7))
+        paths.append(temporary('layer%d.json' % i, json.dumps(layer)))
+    config = LayeredConfig(paths)
+    config.refresh()
+    keys = json_config(1000)[1]
+
+    def run():
+        for key in keys:
+            config.get(key, None)
+    return run
+
+
+@case('env', params=(10, 100, 1000))
+def env_heavy(count):
+    subcommand = subparser()
+
+    @subcommand
+    def run(ns):
+        pass
+    for i in range(count):
+        run.add_argument('--option%d' % i, env='BENCH_OPTION%d' % i,
+                         type=int, default=0)
+    env = dict(('BENCH_OPTION%d' % i, str(i)) for i in range(0, count, 2))
+    env.update(('UNRELATED%d' % i, 'x') for i in range(100))
+    argv = ['run']
+    return lambda: subcommand.dispatch(argv, env=env)
+
+
+@case('env/prefix', params=(10, 100, 1000))
+def env_prefix(count):
+    subcommand = subparser(env_prefix='BENCH_')
+
+    @subcommand
+    def run(ns):
+        pass
+    for i in range(count):
+        run.add_argument('--option%d' % i, type=int, default=0)
+    env = dict(('BENCH_OPTION%d' % i, str(i)) for i in range(0, count, 2))
+    env.update(('UNRELATED%d' % i, 'x') for i in range(100))
+    argv = ['run']
+    return lambda: subcommand.dispatch(argv, env=env)
+
+
+def groups(count, abbrev=False):
+    # app cluster node <leaf>, with count leaves
+    subcommand = subparser(abbrev_commands=abbrev)
+    node = subcommand.group('cluster').group('node')
+    for i in range(count):
+        def leaf(name):
+            pass
+        node('%d-leaf' % i)(leaf).add_argument('--name')
+    return subcommand
+
+
+@case('groups/register', params=(10, 1000, 5000))
+def groups_register(count):
+    return lambda: groups(count)
+
+
+@case('groups/dispatch', params=(10, 1000, 5000))
+def groups_dispatch(count):
+    subcommand = groups(count)
+    argv = ['cluster', 'node', '%d-leaf' % (count - 1), '--name', 'x']
+    return lambda: subcommand.dispatch(argv, env={})
+
+
+@case('groups/abbrev', params=(10, 1000, 5000))
+def groups_abbrev(count):
+    subcommand = groups(count, abbrev=True)
+    argv = ['cl', 'no', '%d-' % (count - 1), '--name', 'x']
+    return lambda: subcommand.dispatch(argv, env={})
+
+
+_directory = []
+
+
+def temporary(name, content):
+    if not _directory:
+        _directory.append(tempfile.mkdtemp())
+    path = os.path.join(_directory[0], name)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+    }
+
+
+def run_cases(pattern, budget, repeat):
+    results = {}
+    for name, func, param in CASES:
+        if pattern and pattern not in name:
+            continue
+        results[name] = measure(func(param), budget, repeat)
+        print('%-28s %12s' % (name, format_time(results[name])))
+        sys.stdout.flush()
+    return results
+
+
+def format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return '%.3g %s' % (seconds / scale, unit)
+    return '%.3g ns' % (seconds / 1e-9)
+
+
+def compare(results, baseline, threshold):
+    '''
+    prints results against the baseline, returning the names of the cases
+    slower than threshold times their baseline
+    '''
+    slower = []
+    print('%-28s %12s %12s %8s' % ('case', 'baseline', 'current', 'ratio'))
+    for name in sorted(results):
+        before = baseline['results'].get(name)
+        if before is None:
+            print('%-28s %12s %12s %8s' % (name, '-',
+                                           format_time(results[name]), 'new'))
+            continue
+        ratio = results[name] / before
+        flag = ''
+        if ratio > threshold:
+            flag = '  slower'
+            slower.append(name)
+        elif ratio < 1 / threshold:
+            flag = '  faster'
+        print('%-28s %12s %12s %7.2fx%s' % (
+            name, format_time(before), format_time(results[name]), ratio,
+            flag))
+    if baseline.get('environment') != environment():
+        print('baseline recorded on %(implementation)s %(python)s '
+              '(%(machine)s)' % baseline['environment'])
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='benchmarks/suite.py',
+                                     description=__doc__.split('\n\n')[0])
+    parser.add_argument('-k', dest='pattern',
+                        help='only run cases whose name contains PATTERN')
+    parser.add_argument('--quick', action='store_true',
+                        help='shorter and fewer repeats')
+    parser.add_argument('--save', metavar='FILE',
+                        help='store the results as a baseline')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='compare the results with a baseline')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='ratio to the baseline reported as slower '
+                             '(default: 1.25)')
+    args = parser.parse_args(argv)
+    budget, repeat = (0.05, 3) if args.quick else (0.2, 5)
+    try:
+        results = run_cases(args.pattern, budget, repeat)
+    finally:
+        for directory in _directory:
+            shutil.rmtree(directory)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment(), 'results': results}, f,
+                      indent=1, sort_keys=True)
+            f.write('\n')
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print()
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,2 +1,33 @@
+import importlib
+import sys
+
 from ._version import __version__
-from .subparser import subparser, subcommand, JsonConfig, IniConfig, ns_dispatch
+from .subparser import subparser, JsonConfig, IniConfig, ns_dispatch
+from .cache import ConfigCache, SidecarCache, config_cache
+from .timing import Timings, JsonLinesExporter, PercentileAggregator
+
+__all__ = ['__version__', 'subparser', 'subcommand', 'JsonConfig', 'IniConfig',
+           'ns_dispatch', 'ConfigCache', 'SidecarCache', 'config_cache',
+           'Timings', 'JsonLinesExporter', 'PercentileAggregator',
+           'LazyJsonConfig', 'LayeredConfig']
+
+# imported on first access
+_lazy = {
+    'subcommand': '.subparser',
+    'LazyJsonConfig': '.lazyjson',
+    'LayeredConfig': '.layered',
+}
+
+
+def __getattr__(name):
+    if name not in _lazy:
+        raise AttributeError('module %r has no attribute %r' % (
+            __name__, name))
+    value = getattr(importlib.import_module(_lazy[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+if sys.version_info < (3, 7):
+    for _name in _lazy:
+        __getattr__(_name)
@@ -0,0 +1,58 @@
+from __future__ import absolute_import
+
+import asyncio
+import inspect
+
+from .timing import timed
+
+
+def run(coroutine):
+    '''
+    runs a coroutine to completion on a new event loop
+    '''
+    if hasattr(asyncio, 'run'):
+        return asyncio.run(coroutine)
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def dispatch_async(subcommand, args=None, namespace=None, executor=None):
+    '''
+    process args and dispatch appropriate dispatch function from a running
+    event loop.
+
+    coroutine dispatch functions are awaited; plain ones are called inline.
+    the config file is parsed on executor (the loop's default executor if
+    None) into the config cache, so that loading it does not block the loop.
+    on_dispatch callbacks are called as for dispatch.
+    '''
+    loop = asyncio.get_event_loop()
+    with subcommand._hooked(args) as timings:
+        phase = timed(timings)
+        if subcommand.config_parser:
+            configfile, _, _ = subcommand.resolve_config(args, None)
+            if configfile:
+                with phase('config_load'):
+                    await loop.run_in_executor(
+                        executor, subcommand.preload_config, configfile)
+        ns = subcommand._resolve(args, namespace, None, timings)
+        if timings is not None:
+            timings.command = getattr(ns, 'command', None)
+        profiling = subcommand.profiling
+        options = profiling.pop(ns) if profiling is not None else None
+        with phase('dispatch'):
+            if not options:
+                return await call(ns)
+            # profiles everything the loop runs until the command is done
+            with profiling.running(options):
+                return await call(ns)
+
+
+async def call(ns):
+    result = ns.func(ns)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
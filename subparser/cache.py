@@ -0,0 +1,208 @@
+from __future__ import absolute_import
+
+import collections
+import contextlib
+import gc
+import os
+import sys
+import threading
+
+
+@contextlib.contextmanager
+def paused_gc():
+    '''
+    disables the cyclic garbage collector while building large documents,
+    which would otherwise be traversed over and over as they grow
+    '''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class ConfigCache(object):
+    '''
+    process wide LRU of parsed config files.
+
+    entries are keyed on the file's path, mtime, size and inode, so a file is
+    only parsed again once it changes.  parsed documents are shared between
+    everyone loading the same file and should be treated as read-only.
+    '''
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(kind, source):
+        st = os.stat(source)
+        mtime = getattr(st, 'st_mtime_ns', st.st_mtime)
+        return (kind, os.path.abspath(source), mtime, st.st_size, st.st_ino)
+
+    def get(self, kind, source, parse):
+        '''
+        returns parse(source), reusing the last result if the file has not
+        changed.  kind separates parsers of the same file.
+        '''
+        key = self.key(kind, source)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                value = self._entries[key] = self._entries.pop(key)
+                return value
+            self.misses += 1
+        value = parse(source)
+        with self._lock:
+            # older versions of this file will never be hit again
+            self._discard(lambda k: k[:2] == key[:2])
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, source=None):
+        '''
+        drop the cached entries for source, or all entries
+        '''
+        with self._lock:
+            if source is None:
+                self._entries.clear()
+            else:
+                path = os.path.abspath(source)
+                self._discard(lambda k: k[1] == path)
+
+    def _discard(self, match):
+        for key in [k for k in self._entries if match(k)]:
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+config_cache = ConfigCache()
+
+
+class SidecarCache(object):
+    '''
+    keeps compiled config files on disk, so that later processes load them
+    without parsing the text again.
+
+    a sidecar is written next to its source (as .NAME.subparser-cache) or,
+    given cache_dir, in that directory.  it records the source's path, mtime,
+    size and content hash, and is used while the mtime and size match, or
+    the content hash does.  any problem reading or writing a sidecar falls
+    back to compiling the source.
+
+    sidecars are pickles: only sidecars owned by the current user are loaded,
+    and cache_dir should not be writable by anyone else.  hashlib and pickle
+    are only imported once a SidecarCache is used.
+    '''
+    format = 1
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, source):
+        source = os.path.abspath(source)
+        if self.cache_dir is None:
+            directory, name = os.path.split(source)
+            return os.path.join(directory, '.%s.subparser-cache' % name)
+        import hashlib
+        digest = hashlib.sha1(source.encode('utf-8')).hexdigest()
+        name = '%s-%s.subparser-cache' % (os.path.basename(source), digest)
+        return os.path.join(self.cache_dir, name)
+
+    @staticmethod
+    def digest(source):
+        import hashlib
+        sha1 = hashlib.sha1()
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                sha1.update(chunk)
+        return sha1.hexdigest()
+
+    def header(self, kind, source, st, digest):
+        return {
+            'format': self.format,
+            'python': tuple(sys.version_info[:2]),
+            'kind': '%s.%s' % (kind.__module__, kind.__name__),
+            'source': os.path.abspath(source),
+            'mtime': getattr(st, 'st_mtime_ns', st.st_mtime),
+            'size': st.st_size,
+            'sha1': digest,
+        }
+
+    def get(self, kind, source, compile):
+        '''
+        returns compile(source), from the sidecar if it is still valid
+        '''
+        st = os.stat(source)
+        path = self.path(source)
+        current = self.header(kind, source, st, None)
+        try:
+            value = self.read(path, current, source)
+        except Exception:
+            value = None
+        if value is not None:
+            self.hits += 1
+            if current['sha1'] is not None:
+                # the file was touched but not changed; record the new mtime
+                self.write(path, current, value[0])
+            return value[0]
+        self.misses += 1
+        current['sha1'] = self.digest(source)
+        value = compile(source)
+        self.write(path, current, value)
+        return value
+
+    def read(self, path, current, source):
+        '''
+        returns (value,) from a valid sidecar, or None.  sets current's sha1
+        if the sidecar was validated by hashing the source.
+        '''
+        import pickle
+        with open(path, 'rb') as f:
+            if (hasattr(os, 'getuid') and
+                    os.fstat(f.fileno()).st_uid != os.getuid()):
+                return None
+            header = pickle.load(f)
+            for key in ('format', 'python', 'kind', 'source'):
+                if header.get(key) != current[key]:
+                    return None
+            if (header.get('mtime') != current['mtime'] or
+                    header.get('size') != current['size']):
+                digest = self.digest(source)
+                if header.get('sha1') != digest:
+                    return None
+                current['sha1'] = digest
+            with paused_gc():
+                return (pickle.load(f),)
+
+    def write(self, path, header, value):
+        import pickle
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            if (self.cache_dir is not None and
+                    not os.path.isdir(self.cache_dir)):
+                os.makedirs(self.cache_dir, 0o700)
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+            getattr(os, 'replace', os.rename)(tmp, path)
+        except (EnvironmentError, pickle.PicklingError):
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+
+    def invalidate(self, source):
+        try:
+            os.unlink(self.path(source))
+        except OSError:
+            pass
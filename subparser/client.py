@@ -0,0 +1,88 @@
+'''
+thin client for a subparser dispatch server.
+
+    python -m subparser.client SOCKET [args...]
+
+forwards args, the working directory, the environment and stdin/stdout/stderr
+to the server and exits with the command's exit code.  SUBPARSER_ENV limits
+the forwarded environment to a comma separated list of fnmatch patterns;
+variables matching them are then taken from the client only.
+
+only uses the standard library and nothing else from subparser, so this file
+can also be copied and run on its own.
+'''
+from __future__ import print_function
+
+import array
+import fnmatch
+import json
+import os
+import socket
+import struct
+import sys
+
+
+def recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise EOFError('connection closed by server')
+        data += chunk
+    return data
+
+
+def call(path, argv, env=None, cwd=None, stdio=(0, 1, 2), env_patterns=None):
+    '''
+    run argv on the server listening at path, with stdio file descriptors
+    handed to it.  returns the exit code.
+
+    env replaces the command's environment, or with env_patterns (the
+    patterns env was selected by), only the variables matching them.
+    '''
+    header = json.dumps({
+        'argv': list(argv),
+        'cwd': os.getcwd() if cwd is None else cwd,
+        'env': dict(os.environ) if env is None else env,
+        'env_patterns': env_patterns,
+    }).encode('utf-8')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendmsg([struct.pack('!I', len(header)) + header],
+                     [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                       array.array('i', stdio))])
+        return struct.unpack('!i', recv_exactly(sock, 4))[0]
+    finally:
+        sock.close()
+
+
+def env_patterns(spec):
+    return [p.strip() for p in spec.split(',') if p.strip()]
+
+
+def forwarded_env(patterns):
+    patterns = env_patterns(patterns)
+    return dict((k, v) for k, v in os.environ.items()
+                if any(fnmatch.fnmatchcase(k, p) for p in patterns))
+
+
+def main(args=None):
+    args = sys.argv[1:] if args is None else args
+    if not args:
+        print('usage: %s SOCKET [args...]' % os.path.basename(sys.argv[0]),
+              file=sys.stderr)
+        return 2
+    sys.stdout.flush()
+    sys.stderr.flush()
+    try:
+        spec = os.environ.get('SUBPARSER_ENV', '*')
+        return call(args[0], args[1:], env=forwarded_env(spec),
+                    env_patterns=env_patterns(spec))
+    except (EnvironmentError, EOFError) as e:
+        print('%s: %s' % (args[0], e), file=sys.stderr)
+        return 255
+
+
+if __name__ == '__main__':
+    sys.exit(main())
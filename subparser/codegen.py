@@ -0,0 +1,342 @@
+'''
+generates a standalone parser module for a Subcommand.
+
+the generated module holds the option tables of every parser in the
+subcommand's tree and a copy of subparser.fastparse, which parses argv
+against them without importing argparse or subparser.  command-lines that it
+cannot parse exactly as argparse would (help, errors, abbreviated options,
+...) are handed to the Subcommand itself, imported from its path.
+
+    python -m subparser.codegen package.cli:subcommand -o package/cli_fast.py
+
+regenerate the module whenever the commands or their arguments change.
+'''
+from __future__ import absolute_import
+
+import argparse
+import inspect
+import math
+import sys
+
+from six import integer_types, string_types
+from six.moves import builtins
+
+from . import fastparse
+from .subparser import (Binder, ConfigAction, ConfigArgumentParser,
+                        ImportDispatch, SubcommandsAction, import_target,
+                        parameters)
+
+KINDS = {
+    argparse._StoreAction: 'store',
+    argparse._StoreConstAction: 'const',
+    argparse._StoreTrueAction: 'const',
+    argparse._StoreFalseAction: 'const',
+    argparse._AppendAction: 'append',
+    argparse._AppendConstAction: 'append_const',
+    argparse._CountAction: 'count',
+    argparse._HelpAction: 'help',
+    argparse._VersionAction: 'version',
+    ConfigAction: 'config',
+    SubcommandsAction: 'parsers',
+}
+
+# parsing methods that fastparse reproduces
+PARSING = ('parse_known_args', '_parse_known_args', '_parse_optional',
+           '_get_option_tuples', '_get_values', '_get_value', '_check_value',
+           '_match_argument', '_match_arguments_partial', '_apply_env',
+           '_apply_config')
+
+HEADER = '''\
+# generated by subparser.codegen from %(path)s; do not edit.
+\'\'\'
+fast parser for %(path)s.  command-lines it cannot parse are handed to the
+Subcommand itself.
+\'\'\'
+'''
+
+FOOTER = '''
+
+SPEC = Spec(%(main)s, %(path)r, python=%(python)r, config=%(config)s,
+            batch=%(batch)r, profiling=%(profiling)r)
+
+
+def resolve(args=None, env=None):
+    return SPEC.resolve(args, env)
+
+
+def dispatch(args=None, env=None):
+    return SPEC.dispatch(args, env)
+
+
+if __name__ == '__main__':
+    dispatch()
+'''
+
+
+class Unsupported(ValueError):
+    '''
+    the subcommand uses something the generated parser cannot reproduce
+    '''
+
+
+def function_path(func):
+    '''
+    returns the import path of a module level function or class
+    '''
+    name = getattr(func, '__qualname__', getattr(func, '__name__', None))
+    module = getattr(func, '__module__', None)
+    if not name or not module or '<locals>' in name or module == '__main__':
+        raise Unsupported('%r cannot be imported by path' % (func,))
+    path = '%s:%s' % (module, name)
+    try:
+        target = import_target(path)
+    except (ImportError, AttributeError):
+        raise Unsupported('%r cannot be imported by path' % (func,))
+    # DispatchWrapper leaves its wrapper in the module
+    while target is not func and hasattr(target, '__wrapped__'):
+        target = target.__wrapped__
+    if target is not func:
+        raise Unsupported('%s is not %r' % (path, func))
+    return path
+
+
+class Generator(object):
+    def __init__(self, subcommand, path):
+        self.subcommand = subcommand
+        self.path = path
+        self.names = {}
+        self.lines = []
+
+    def literal(self, value):
+        '''
+        returns source for value, which evaluates to an equal value
+        '''
+        if value is argparse.SUPPRESS:
+            return 'SUPPRESS'
+        scalars = (bool, string_types, bytes) + integer_types
+        if value is None or isinstance(value, scalars):
+            return repr(value)
+        if (isinstance(value, float) and
+                not (math.isinf(value) or math.isnan(value))):
+            return repr(value)
+        if type(value) in (list, tuple, set, frozenset, dict):
+            return self.container(value)
+        if type(value) is range:
+            return repr(value)
+        if isinstance(value, Binder):
+            return 'Target(%r, %r, %s)' % (
+                function_path(value.func), value.pass_ns,
+                self.literal(tuple(parameters(value.func))))
+        if isinstance(value, ImportDispatch):
+            return 'Target(%r)' % (value.target,)
+        raise Unsupported('cannot generate %r' % (value,))
+
+    def container(self, value):
+        '''
+        literal for lists, tuples, sets and dicts
+        '''
+        if type(value) is list:
+            return '[%s]' % ', '.join(self.literal(v) for v in value)
+        if type(value) is tuple:
+            return '(%s)' % ''.join(self.literal(v) + ', ' for v in value)
+        if type(value) is dict:
+            return '{%s}' % ', '.join(
+                '%s: %s' % (self.literal(k), self.literal(v))
+                for k, v in value.items())
+        return '%s([%s])' % (type(value).__name__,
+                             ', '.join(self.literal(v) for v in value))
+
+    def reference(self, func):
+        '''
+        returns source for the argument type func
+        '''
+        if func is None:
+            return 'None'
+        name = getattr(func, '__name__', None)
+        if getattr(builtins, name or '', None) is func:
+            return name
+        return 'Ref(%r)' % function_path(func)
+
+    def check_parser(self, parser):
+        if not isinstance(parser, ConfigArgumentParser):
+            raise Unsupported('%s is not a ConfigArgumentParser' % parser.prog)
+        for method in PARSING:
+            own = getattr(type(parser), method)
+            if own is not getattr(ConfigArgumentParser, method):
+                raise Unsupported('%s overrides %s' % (parser.prog, method))
+        if parser.prefix_chars != '-':
+            raise Unsupported('%s has prefix_chars' % parser.prog)
+        if parser.fromfile_prefix_chars:
+            raise Unsupported('%s reads args from files' % parser.prog)
+        if parser._mutually_exclusive_groups:
+            raise Unsupported('%s has mutually exclusive groups' % parser.prog)
+        if parser._has_negative_number_optionals:
+            raise Unsupported('%s has options that look like negative '
+                              'numbers' % parser.prog)
+        positionals = parser._get_positional_actions()
+        if any(a.nargs == argparse.PARSER for a in positionals[:-1]):
+            raise Unsupported('%s has positionals after its commands' %
+                              parser.prog)
+
+    def action(self, action):
+        kind = KINDS.get(type(action))
+        if kind is None:
+            raise Unsupported('%s actions are not supported' %
+                              type(action).__name__)
+        nargs = action.nargs
+        if nargs in (argparse.REMAINDER, argparse.SUPPRESS):
+            raise Unsupported('nargs=%r is not supported' % (nargs,))
+        dest = action.dest
+        fields = [repr(kind),
+                  'None' if dest is argparse.SUPPRESS else repr(dest),
+                  self.literal(tuple(action.option_strings))]
+        if kind in ('help', 'version'):
+            fields.append('default=%s' % self.literal(action.default))
+            return 'Action(%s)' % ', '.join(fields)
+        fields.extend([
+            'nargs=%s' % self.literal(nargs),
+            'const=%s' % self.literal(action.const),
+            'default=%s' % self.literal(action.default),
+            'type=%s' % self.reference(action.type),
+            'required=%r' % bool(action.required),
+        ])
+        if kind == 'parsers':
+            if action.path:
+                raise Unsupported('nested command groups are not supported')
+            parsers = action._name_parser_map
+            fields.append('parsers={%s}' % ', '.join(
+                '%r: %s' % (name, self.parser(parsers[name]))
+                for name in parsers))
+        elif action.choices is not None:
+            fields.append('choices=%s' % self.literal(action.choices))
+        return 'Action(%s)' % ', '.join(fields)
+
+    def parser(self, parser):
+        '''
+        emits the tables of parser and its commands, and returns its name:
+        MAIN, or the function building a command's parser
+        '''
+        if id(parser) in self.names:
+            return self.names[id(parser)]
+        self.check_parser(parser)
+        actions = [(action, self.action(action)) for action in parser._actions]
+        main = parser is self.subcommand.parser
+        name = 'MAIN' if main else 'parser_%d' % len(self.names)
+        self.names[id(parser)] = name
+        # commands are built on first use, the main parser on import
+        var, indent = (name, '') if main else ('parser', '    ')
+        env = dict((id(action), env) for action, env in parser._env.values())
+        config = dict((id(action), key)
+                      for action, key in parser._config_keys.values())
+        self.lines.extend(['', ''] if main else ['', '', 'def %s():' % name])
+        self.lines.append('%s%s = Parser(defaults=%s, allow_abbrev=%r)' % (
+            indent, var, self.literal(parser._defaults), parser.allow_abbrev))
+        for action, source in actions:
+            extra = ''
+            if id(action) in env:
+                extra += ', env=%r' % env[id(action)]
+            if id(action) in config:
+                key = config[id(action)]
+                # namedtuple keys are looked up as plain tuples
+                key = tuple(key) if isinstance(key, tuple) else key
+                extra += ', config=%s' % self.literal(key)
+            self.lines.append('%s%s.add(%s%s)' % (indent, var, source, extra))
+        if not main:
+            self.lines.append('    return parser')
+        return name
+
+    def config(self):
+        subcommand = self.subcommand
+        action = subcommand.config_action
+        if action is None:
+            return 'None'
+        if subcommand.config_watch:
+            raise Unsupported('watched config files are not supported')
+        if subcommand.config_layers:
+            raise Unsupported('layered config files are not supported')
+        if (action.nargs is not None or action.type is not None or
+                action.required):
+            raise Unsupported('the config option must take a single untyped '
+                              'value')
+        return 'ConfigOption(%s, %r, %s, %r, %s, %r)' % (
+            self.literal(tuple(action.option_strings)), action.dest,
+            self.literal(action.default),
+            action.env, self.literal(tuple(action.check_file_for)),
+            function_path(type(subcommand.config.impl)))
+
+    def batch(self):
+        action = self.subcommand.batch_action
+        if action is None:
+            return ()
+        if (action.nargs is not None or action.type is not None or
+                action.required):
+            raise Unsupported('the batch option must take a single untyped '
+                              'value')
+        return tuple(action.option_strings)
+
+    def profiling(self):
+        if self.subcommand.profiling is None:
+            return ()
+        return self.subcommand.profiling.dests
+
+    def generate(self):
+        source = inspect.getsource(fastparse)
+        # the runtime's own docstring
+        source = source.split("'''", 2)[2].lstrip('\n')
+        main = self.parser(self.subcommand.parser)
+        return ''.join([
+            HEADER % {'path': self.path},
+            source,
+            '\n'.join(self.lines) + '\n',
+            FOOTER % {'main': main, 'path': self.path,
+                      'python': tuple(sys.version_info[:2]),
+                      'config': self.config(), 'batch': self.batch(),
+                      'profiling': self.profiling()},
+        ])
+
+
+def generate(path, subcommand=None):
+    '''
+    returns the source of a fast parser module for the subcommand at path
+    ('package.module:attr'), which the module imports when it falls back to
+    it.  subcommand, if given, is used instead of importing it now.
+
+    raises Unsupported if the subcommand uses anything the generated parser
+    cannot reproduce.
+    '''
+    if subcommand is None:
+        subcommand = import_target(path)
+    return Generator(subcommand, path).generate()
+
+
+def write(path, output, subcommand=None):
+    '''
+    writes the fast parser module for the subcommand at path to output
+    '''
+    source = generate(path, subcommand)
+    with open(output, 'w') as f:
+        f.write(source)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m subparser.codegen',
+        description='generate a fast parser module for a subcommand')
+    parser.add_argument('path',
+                        help="the subcommand, as 'package.module:attr'")
+    parser.add_argument('-o', '--output',
+                        help='the module to write (default: stdout)')
+    args = parser.parse_args(argv)
+    try:
+        source = generate(args.path)
+    except Unsupported as e:
+        parser.error(str(e))
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(source)
+    else:
+        sys.stdout.write(source)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+'''
+shell completion from a cache written by subparser.completion.
+
+    python path/to/subparser/complete.py CACHE TARGET CWORD WORDS...
+
+prints the candidates for WORDS[CWORD], one per line.  the cache is rebuilt
+(importing TARGET, 'package.module:subcommand') when it is missing or when
+a module that registers commands has changed since it was written.
+
+only uses the standard library and nothing else from subparser, so that
+answering from the cache never imports the application.
+'''
+from __future__ import print_function
+
+import json
+import os
+import sys
+
+FORMAT = 1
+
+
+def stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size]
+
+
+def load(cache):
+    '''
+    returns (cache, fresh), or (None, False) if there is no cache
+    '''
+    try:
+        with open(cache) as f:
+            data = json.load(f)
+    except (EnvironmentError, ValueError):
+        return None, False
+    if data.get('format') != FORMAT:
+        return None, False
+    fresh = all(stat(path) == st for path, st in data['modules'].items())
+    return data, fresh
+
+
+def rebuild(cache, target):
+    '''
+    writes the cache for target in a separate process, which imports it
+    '''
+    import subprocess
+    with open(os.devnull, 'w') as devnull:
+        subprocess.call([sys.executable, '-m', 'subparser.completion',
+                         target, '--cache', cache],
+                        stdout=devnull, stderr=devnull)
+
+
+def count(nargs):
+    '''
+    the number of values an option takes, -1 for any number
+    '''
+    if nargs is None or nargs == '?':
+        return 1
+    if isinstance(nargs, int):
+        return nargs
+    return -1
+
+
+def is_option(word):
+    return word[:1] == '-' and word != '-'
+
+
+def join_words(words, cword):
+    '''
+    rejoins the '=' that bash splits options at
+    '''
+    joined = []
+    for i, word in enumerate(words):
+        if (joined and (word == '=' or joined[-1].endswith('=')) and
+                is_option(joined[-1])):
+            joined[-1] += word
+        else:
+            joined.append(word)
+        if i == cword:
+            cword = len(joined) - 1
+    return joined, cword
+
+
+def complete(data, words, cword):
+    '''
+    returns the candidates for words[cword], where words[0] is the program
+    '''
+    words, cword = join_words(words, cword)
+    current = words[cword] if cword < len(words) else ''
+    choices = candidates(current, *walk(data['parsers'], words[1:cword]))
+    # an option's value is completed after its '='
+    prefix = current
+    if is_option(current) and '=' in current:
+        prefix = current.partition('=')[2]
+    return [c for c in choices or () if c.startswith(prefix)]
+
+
+def walk(parsers, words):
+    '''
+    follows the words before the one completed through parsers and their
+    commands.  returns (parser, option, remaining, positional): the parser
+    reached, the option still taking values and how many, and the index of
+    the next positional
+    '''
+    parser = parsers[0]
+    option, remaining, positional = None, 0, 0
+    for word in words:
+        if remaining and not is_option(word):
+            remaining -= 1
+            continue
+        if is_option(word):
+            name, explicit, _ = word.partition('=')
+            option = parser['options'].get(name)
+            remaining = 0 if option is None or explicit else count(option[0])
+            continue
+        option, remaining = None, 0
+        if positional < len(parser['positionals']):
+            nargs = parser['positionals'][positional][0]
+            if nargs == 'A...':
+                if word in parser['commands']:
+                    parser = parsers[parser['commands'][word]]
+                    positional = 0
+            elif nargs not in ('*', '+'):
+                positional += 1
+    return parser, option, remaining, positional
+
+
+def candidates(current, parser, option, remaining, positional):
+    '''
+    all the values the word being completed could take, or None
+    '''
+    if is_option(current) and '=' in current:
+        option = parser['options'].get(current.partition('=')[0])
+        return option[1] if option else None
+    if remaining and not is_option(current):
+        return option[1]
+    if is_option(current):
+        return sorted(parser['options'])
+    if positional < len(parser['positionals']):
+        nargs, choices = parser['positionals'][positional]
+        return sorted(parser['commands']) if nargs == 'A...' else choices
+    return None
+
+
+def main(args=None):
+    args = sys.argv[1:] if args is None else args
+    if len(args) < 3:
+        print('usage: %s CACHE TARGET CWORD WORDS...' %
+              os.path.basename(sys.argv[0]), file=sys.stderr)
+        return 2
+    cache, target, cword, words = args[0], args[1], int(args[2]), args[3:]
+    data, fresh = load(cache)
+    if not fresh:
+        rebuild(cache, target)
+        data = load(cache)[0] or data
+    if data is None:
+        return 1
+    for candidate in complete(data, words, cword):
+        print(candidate)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
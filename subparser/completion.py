@@ -0,0 +1,182 @@
+'''
+writes the completion caches read by subparser/complete.py.
+
+    python -m subparser.completion package.cli:subcommand --cache CACHE
+        [--prog PROG] [--shell zsh]
+
+writes the cache for the subcommand and prints the shell code completing
+PROG from it.  the cache holds the subcommand names, option strings, choices
+and nargs of every parser, and the modules that register commands, so that
+complete.py rebuilds it once they change.
+'''
+from __future__ import absolute_import, print_function
+
+import argparse
+import json
+import os
+import sys
+
+from six import string_types
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+from . import complete
+from .subparser import Binder, LazyParser, SubcommandsAction, import_target
+
+BASH = '''\
+_%(name)s_complete() {
+    local IFS=$'\\n'
+    COMPREPLY=($(%(python)s %(complete)s %(cache)s %(target)s \\
+        "$COMP_CWORD" "${COMP_WORDS[@]}" 2>/dev/null))
+}
+complete -o default -F _%(name)s_complete %(prog)s
+'''
+
+ZSH = '''\
+autoload -U +X bashcompinit && bashcompinit
+''' + BASH
+
+
+def module_file(name):
+    module = sys.modules.get(name)
+    path = getattr(module, '__file__', None)
+    if not path:
+        return None
+    if path.endswith(('.pyc', '.pyo')) and os.path.exists(path[:-1]):
+        path = path[:-1]
+    return os.path.abspath(path)
+
+
+def registering_modules(subcommand, target):
+    '''
+    the modules that define the subcommand, its dispatch functions and the
+    functions declaring arguments of lazily imported commands
+    '''
+    names = [target.partition(':')[0]]
+    for declare in subcommand.declares:
+        if isinstance(declare, string_types):
+            names.append(declare.partition(':')[0])
+        else:
+            names.append(declare.__module__)
+    # the commands of groups are walked without building their parsers
+    actions = [subcommand.subparser]
+    while actions:
+        for parser in dict.values(actions.pop()._name_parser_map):
+            calls = []
+            if isinstance(parser, LazyParser):
+                calls, parser = list(parser.calls or ()), parser.parser
+            if parser is not None:
+                calls.append(('set_defaults', (), parser._defaults))
+                actions.extend(a for a in parser._actions
+                               if isinstance(a, SubcommandsAction))
+            for method, args, kwargs in calls:
+                owner = getattr(method, '__self__', None)
+                if (method == 'set_defaults' and
+                        isinstance(kwargs.get('func'), Binder)):
+                    names.append(kwargs['func'].func.__module__)
+                elif isinstance(owner, SubcommandsAction):
+                    actions.append(owner)
+    return names
+
+
+def export_parser(parser, parsers, indexes):
+    '''
+    appends the completion data of parser, and of the parsers of its
+    commands, to parsers and returns its index
+    '''
+    if id(parser) in indexes:
+        return indexes[id(parser)]
+    index = indexes[id(parser)] = len(parsers)
+    data = {'options': {}, 'positionals': [], 'commands': {}}
+    parsers.append(data)
+    for action in parser._actions:
+        if action.help is argparse.SUPPRESS:
+            continue
+        nargs = action.nargs
+        choices = None
+        if isinstance(action, argparse._SubParsersAction):
+            for name, subparser in action._name_parser_map.items():
+                data['commands'][name] = export_parser(subparser, parsers,
+                                                       indexes)
+        elif action.choices is not None:
+            choices = [str(choice) for choice in action.choices]
+        if action.option_strings:
+            for option_string in action.option_strings:
+                data['options'][option_string] = [nargs, choices]
+        else:
+            data['positionals'].append([nargs, choices])
+    return index
+
+
+def export(subcommand):
+    '''
+    returns the completion data of every parser of subcommand, building
+    any lazy parsers
+    '''
+    parsers = []
+    export_parser(subcommand.parser, parsers, {})
+    return parsers
+
+
+def write_cache(subcommand, cache, target, modules=()):
+    '''
+    writes the completion cache of subcommand, which is imported from
+    target ('package.module:attr') when the cache is rebuilt.  the cache is
+    rebuilt when the registering modules, or any of modules, change.
+    '''
+    names = registering_modules(subcommand, target)
+    parsers = export(subcommand)
+    paths = [module_file(name) for name in names + list(modules)]
+    data = {
+        'format': complete.FORMAT,
+        'target': target,
+        'modules': dict((path, complete.stat(path)) for path in paths if path),
+        'parsers': parsers,
+    }
+    directory = os.path.dirname(os.path.abspath(cache))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp = '%s.%d.tmp' % (cache, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+    getattr(os, 'replace', os.rename)(tmp, cache)
+    return data
+
+
+def script(prog, cache, target, shell='bash'):
+    '''
+    returns the shell code completing prog from cache
+    '''
+    return (ZSH if shell == 'zsh' else BASH) % {
+        'name': ''.join(c if c.isalnum() else '_'
+                        for c in os.path.basename(prog)),
+        'prog': quote(prog),
+        'python': quote(sys.executable),
+        'complete': quote(os.path.splitext(complete.__file__)[0] + '.py'),
+        'cache': quote(os.path.abspath(cache)),
+        'target': quote(target),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m subparser.completion',
+        description='write the completion cache of a subcommand')
+    parser.add_argument('target',
+                        help="the subcommand, as 'package.module:attr'")
+    parser.add_argument('--cache', required=True,
+                        help='the cache file to write')
+    parser.add_argument('--prog', help='print the shell code completing prog')
+    parser.add_argument('--shell', choices=['bash', 'zsh'], default='bash')
+    args = parser.parse_args(argv)
+    write_cache(import_target(args.target), args.cache, args.target)
+    if args.prog:
+        sys.stdout.write(script(args.prog, args.cache, args.target,
+                                args.shell))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,674 @@
+'''
+runtime of the parser modules generated by subparser.codegen.
+
+parses argv against precomputed option tables the same way argparse and
+ConfigArgumentParser would, without importing either.  anything it does not
+reproduce exactly (help, errors, abbreviations, '--', ...) raises Fallback,
+and the generated module hands the command-line to the Subcommand itself.
+
+only uses the standard library and nothing else from subparser (config files
+excepted), as it is copied into each generated module.
+'''
+import os
+import sys
+import types
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+SUPPRESS = '==SUPPRESS=='
+PARSER = 'A...'
+
+_missing = object()
+
+
+class Fallback(Exception):
+    '''
+    the command-line needs the dynamic parser
+    '''
+
+
+def import_target(path):
+    module_name, _, attrs = path.partition(':')
+    __import__(module_name)
+    obj = sys.modules[module_name]
+    for attr in attrs.split('.') if attrs else ():
+        obj = getattr(obj, attr)
+    return obj
+
+
+class Ref(object):
+    '''
+    a callable (such as an argument type) imported on first use
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.obj = None
+
+    def __call__(self, *args, **kwargs):
+        if self.obj is None:
+            self.obj = import_target(self.path)
+        return self.obj(*args, **kwargs)
+
+
+class Target(object):
+    '''
+    the dispatch function at path, bound to namespaces like a Binder.
+    signature is its (args, varargs, kwonly, varkw), read from the function
+    if not given.
+    '''
+    def __init__(self, path, pass_ns=True, signature=None):
+        self.path = path
+        self.pass_ns = pass_ns
+        self.signature = signature
+        self.binder = None
+
+    def __call__(self, ns):
+        if self.binder is None:
+            func = import_target(self.path)
+            signature = self.signature or code_signature(func)
+            if signature is None:
+                from subparser.subparser import Binder as Binder_
+                self.binder = Binder_(func, self.pass_ns)
+            else:
+                self.binder = Binder(func, self.pass_ns, *signature)
+        return self.binder(ns)
+
+
+def code_signature(func):
+    '''
+    subparser.subparser.parameters for plain functions, read from their code
+    without inspect.  None for anything else.
+    '''
+    while hasattr(func, '__wrapped__') and not hasattr(func, '__signature__'):
+        func = func.__wrapped__
+    if (hasattr(func, '__signature__') or
+            not isinstance(func, types.FunctionType)):
+        return None
+    code = func.__code__
+    names = code.co_varnames
+    count, kwcount = code.co_argcount, getattr(code, 'co_kwonlyargcount', 0)
+    rest = list(names[count + kwcount:])
+    varargs = rest.pop(0) if code.co_flags & 0x04 else None
+    varkw = rest.pop(0) if code.co_flags & 0x08 else None
+    return names[:count], varargs, names[count:count + kwcount], varkw
+
+
+class Binder(object):
+    '''
+    subparser.subparser.Binder, given the function's signature
+    '''
+    def __init__(self, func, pass_ns, args, varargs, kwonly, varkw):
+        self.func = func
+        self.args = tuple(None if arg == 'ns' and pass_ns else arg
+                          for arg in args)
+        self.varargs = varargs
+        self.kwonly = tuple(None if arg == 'ns' and pass_ns else arg
+                            for arg in kwonly)
+        self.varkw = varkw is not None
+        self.consumed = frozenset(args) | frozenset(kwonly)
+        self.kwargs_ns = (pass_ns and varkw is not None and
+                          'ns' not in self.consumed)
+
+    def __call__(self, ns):
+        args = [ns if arg is None else getattr(ns, arg) for arg in self.args]
+        if self.varargs:
+            value = getattr(ns, self.varargs)
+            if isinstance(value, (list, tuple)):
+                args.extend(value)
+            else:
+                args.append(value)
+        kwargs = {}
+        if self.varkw:
+            consumed = self.consumed
+            kwargs = dict((k, v) for k, v in vars(ns).items()
+                          if k not in consumed)
+        for arg in self.kwonly:
+            if arg is None:
+                kwargs['ns'] = ns
+            elif hasattr(ns, arg):
+                kwargs[arg] = getattr(ns, arg)
+        if self.kwargs_ns:
+            kwargs['ns'] = ns
+        return self.func(*args, **kwargs)
+
+
+class Namespace(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __eq__(self, other):
+        if not hasattr(other, '__dict__'):
+            return NotImplemented
+        return vars(self) == vars(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __contains__(self, key):
+        return key in self.__dict__
+
+    def __repr__(self):
+        return 'Namespace(%s)' % ', '.join(
+            '%s=%r' % item for item in sorted(vars(self).items()))
+
+
+class EnvSnapshot(object):
+    def __init__(self, environ):
+        self._environ = environ
+        self._values = {}
+
+    def get(self, key, default=None):
+        try:
+            value = self._values[key]
+        except KeyError:
+            value = self._values[key] = self._environ.get(key)
+        return default if value is None else value
+
+
+class Action(object):
+    '''
+    an argparse action: kind is store, const, append, append_const, count,
+    config, parsers, help or version.  dest is None for SUPPRESS.
+    '''
+    def __init__(self, kind, dest, option_strings=(), nargs=None, const=None,
+                 default=None, type=None, choices=None, required=False,
+                 parsers=None):
+        # parsers maps command names to Parsers, or to functions building them
+        self.kind = kind
+        self.dest = dest
+        self.option_strings = option_strings
+        self.nargs = nargs
+        self.const = const
+        self.default = default
+        self.type = type
+        self.choices = choices
+        self.required = required
+        self.parsers = parsers
+        if nargs is None:
+            self.min, self.max = 1, 1
+        elif nargs == '?':
+            self.min, self.max = 0, 1
+        elif nargs == '*':
+            self.min, self.max = 0, None
+        elif nargs == '+' or nargs == PARSER:
+            self.min, self.max = 1, None
+        else:
+            self.min, self.max = nargs, nargs
+
+    def convert(self, string):
+        if self.type is None:
+            return string
+        try:
+            return self.type(string)
+        except Exception:
+            raise Fallback()
+
+    def check(self, value):
+        if self.choices is not None and value not in self.choices:
+            raise Fallback()
+
+    def values(self, strings):
+        # ArgumentParser._get_values
+        if not strings and self.nargs == '?':
+            value = self.const if self.option_strings else self.default
+            if isinstance(value, string_types):
+                value = self.convert(value)
+                self.check(value)
+        elif not strings and self.nargs == '*' and not self.option_strings:
+            value = strings if self.default is None else self.default
+            self.check(value)
+        elif len(strings) == 1 and self.nargs in (None, '?'):
+            value = self.convert(strings[0])
+            self.check(value)
+        elif self.nargs == PARSER:
+            value = strings
+            if value[0] not in self.parsers:
+                raise Fallback()
+        else:
+            value = [self.convert(string) for string in strings]
+            for v in value:
+                self.check(v)
+        return value
+
+    def __call__(self, ns, values, context):
+        call = self.calls.get(self.kind)
+        if call is None:
+            raise Fallback()
+        call(self, ns, values, context)
+
+    def store(self, ns, values, context):
+        setattr(ns, self.dest, values)
+
+    def store_const(self, ns, values, context):
+        setattr(ns, self.dest, self.const)
+
+    def append(self, ns, values, context):
+        items = getattr(ns, self.dest, None)
+        if items is None:
+            items = []
+        elif type(items) is list:
+            items = items[:]
+        else:
+            import copy
+            items = copy.copy(items)
+        items.append(values if self.kind == 'append' else self.const)
+        setattr(ns, self.dest, items)
+
+    def count(self, ns, values, context):
+        count = getattr(ns, self.dest, None)
+        setattr(ns, self.dest, (0 if count is None else count) + 1)
+
+    def parse_command(self, ns, values, context):
+        if self.dest is not None:
+            setattr(ns, self.dest, values[0])
+        parser = self.parsers[values[0]]
+        if not isinstance(parser, Parser):
+            # generated commands are built on first use
+            parser = self.parsers[values[0]] = parser()
+        subnamespace, extras = parser.parse_known_args(
+            values[1:], Namespace(), context)
+        ns.__dict__.update(vars(subnamespace))
+        if extras:
+            raise Fallback()
+
+    # what each kind does with its values; help and version fall back
+    calls = {
+        'store': store,
+        'config': store,
+        'const': store_const,
+        'append': append,
+        'append_const': append,
+        'count': count,
+        'parsers': parse_command,
+    }
+
+    def match(self, pattern):
+        # ArgumentParser._match_argument, for an option
+        count = len(pattern) - len(pattern.lstrip('A'))
+        if count < self.min:
+            raise Fallback()
+        return count if self.max is None else min(count, self.max)
+
+
+def match_positionals(actions, pattern):
+    '''
+    ArgumentParser._match_arguments_partial, for patterns of A and O only
+    '''
+    run = len(pattern) - len(pattern.lstrip('A'))
+    for end in range(len(actions), 0, -1):
+        counts = []
+        available = run
+        minimums = [action.min for action in actions[:end]]
+        for i, action in enumerate(actions[:end]):
+            if action.nargs == PARSER:
+                if available < 1:
+                    break
+                counts.append(len(pattern) - (run - available))
+                return counts
+            count = available - sum(minimums[i + 1:])
+            if action.max is not None:
+                count = min(count, action.max)
+            if count < action.min:
+                break
+            counts.append(count)
+            available -= count
+        else:
+            return counts
+    return []
+
+
+def negative_number(arg):
+    body = arg[1:]
+    if body.endswith('\n'):
+        body = body[:-1]
+    head, dot, tail = body.partition('.')
+    isdecimal = getattr(type(body), 'isdecimal', type(body).isdigit)
+    if not dot:
+        return isdecimal(head)
+    return (not head or isdecimal(head)) and isdecimal(tail)
+
+
+class Parser(object):
+    def __init__(self, defaults=None, allow_abbrev=True):
+        self.actions = []
+        self.positionals = []
+        self.options = {}
+        self.env = []
+        self.config = []
+        self.defaults = defaults or {}
+        self.allow_abbrev = allow_abbrev
+
+    def add(self, action, env=None, config=None):
+        self.actions.append(action)
+        if not action.option_strings:
+            self.positionals.append(action)
+        for option_string in action.option_strings:
+            self.options[option_string] = action
+        if env:
+            self.env.append((action, env))
+        if config:
+            self.config.append((action, config))
+        return action
+
+    def classify(self, arg):
+        '''
+        ArgumentParser._parse_optional: None for an argument, else the
+        (action, option_string, explicit_arg) of an option
+        '''
+        if not arg or arg[0] != '-':
+            return None
+        options = self.options
+        if arg in options:
+            return options[arg], arg, None
+        if len(arg) == 1:
+            return None
+        if '=' in arg:
+            option_string, explicit = arg.split('=', 1)
+            if option_string in options:
+                return options[option_string], option_string, explicit
+        option = self.classify_prefix(arg)
+        if option is not None:
+            return option
+        if negative_number(arg) or ' ' in arg:
+            return None
+        return None, arg, None
+
+    def classify_prefix(self, arg):
+        '''
+        the option of a short option with its value attached, or None.
+        raises Fallback for abbreviations, which argparse resolves
+        '''
+        options = self.options
+        if arg[1] == '-':
+            prefix = arg.split('=', 1)[0]
+            if (self.allow_abbrev and
+                    any(s.startswith(prefix) for s in options)):
+                raise Fallback()
+            return None
+        matches = [s for s in options if s == arg[:2] or s.startswith(arg)]
+        if len(matches) == 1 and matches[0] == arg[:2]:
+            return options[arg[:2]], arg[:2], arg[2:]
+        if matches:
+            raise Fallback()
+        return None
+
+    def parse_known_args(self, args, ns, context):
+        config, environ, defaults = context
+        for dest, value in defaults.items():
+            if not hasattr(ns, dest):
+                setattr(ns, dest, value)
+        self.apply_env(ns, environ)
+        if config is not None:
+            self.apply_config(ns, config)
+        self.apply_defaults(ns)
+        return self.parse(args, ns, context)
+
+    def apply_env(self, ns, environ):
+        for action, env_var in self.env:
+            if not hasattr(ns, action.dest):
+                value = environ.get(env_var, None)
+                if value:
+                    setattr(ns, action.dest, action.convert(value))
+
+    def apply_config(self, ns, config):
+        for action, key in self.config:
+            if not hasattr(ns, action.dest):
+                value = config.get(key, _missing)
+                if value is not _missing:
+                    if isinstance(value, string_types):
+                        value = action.convert(value)
+                    setattr(ns, action.dest, value)
+
+    def apply_defaults(self, ns):
+        for action in self.actions:
+            if (action.dest is not None and not hasattr(ns, action.dest) and
+                    action.default is not SUPPRESS):
+                setattr(ns, action.dest, action.default)
+        for dest, value in self.defaults.items():
+            if not hasattr(ns, dest):
+                setattr(ns, dest, value)
+
+    def parse(self, args, ns, context):
+        # ArgumentParser._parse_known_args
+        if '--' in args:
+            raise Fallback()
+        seen = Parse(self, args, ns, context).run()
+        for action in self.actions:
+            if action not in seen:
+                if action.required:
+                    raise Fallback()
+                default = action.default
+                if (isinstance(default, string_types) and
+                        action.dest is not None and
+                        getattr(ns, action.dest, _missing) is default):
+                    setattr(ns, action.dest, action.convert(default))
+        return ns, []
+
+
+class Parse(object):
+    '''
+    one run of Parser.parse over args: the option and positional matching
+    of ArgumentParser._parse_known_args
+    '''
+    def __init__(self, parser, args, ns, context):
+        self.parser = parser
+        self.args = args
+        self.ns = ns
+        self.context = context
+        self.options = {}
+        pattern = []
+        for i, arg in enumerate(args):
+            option = parser.classify(arg)
+            if option is None:
+                pattern.append('A')
+            else:
+                self.options[i] = option
+                pattern.append('O')
+        self.pattern = ''.join(pattern)
+        self.seen = set()
+        self.positionals = list(parser.positionals)
+
+    def run(self):
+        '''
+        consumes every arg and returns the actions seen
+        '''
+        options = self.options
+        index = 0
+        last = max(options) if options else -1
+        while index <= last:
+            following = min(i for i in options if i >= index)
+            if index != following:
+                end = self.consume_positionals(index)
+                if end > index:
+                    index = end
+                    continue
+                index = end
+            if index not in options:
+                raise Fallback()
+            index = self.consume_optional(index)
+        if self.consume_positionals(index) != len(self.args):
+            raise Fallback()
+        return self.seen
+
+    def take(self, action, strings):
+        self.seen.add(action)
+        values = action.values(strings)
+        if values is not SUPPRESS:
+            action(self.ns, values, self.context)
+
+    def consume_optional(self, index):
+        action, option_string, explicit = self.options[index]
+        taken = []
+        while True:
+            if action is None:
+                raise Fallback()
+            if explicit is None:
+                start = index + 1
+                stop = start + action.match(self.pattern[start:])
+                taken.append((action, self.args[start:stop]))
+                break
+            count = action.match('A')
+            if count == 1:
+                stop = index + 1
+                taken.append((action, [explicit]))
+                break
+            if count != 0 or option_string[1] == '-' or explicit == '':
+                raise Fallback()
+            # single-dash flags run together: -xyz
+            taken.append((action, []))
+            option_string = '-' + explicit[0]
+            explicit = explicit[1:] or None
+            action = self.parser.options.get(option_string)
+        for action, strings in taken:
+            self.take(action, strings)
+        return stop
+
+    def consume_positionals(self, index):
+        positionals = self.positionals
+        counts = match_positionals(positionals, self.pattern[index:])
+        for action, count in zip(positionals, counts):
+            self.take(action, self.args[index:index + count])
+            index += count
+        positionals[:] = positionals[len(counts):]
+        return index
+
+
+def scan_options(args, option_strings):
+    '''
+    subparser.scan_options for one option: returns (value, remaining args),
+    value None if the option is not given
+    '''
+    longs = [s for s in option_strings if len(s) > 2]
+    value = None
+    rest = []
+    i, count = 0, len(args)
+    while i < count:
+        arg = args[i]
+        i += 1
+        if arg == '--':
+            rest.extend(args[i - 1:])
+            break
+        if arg[:1] != '-' or arg == '-':
+            rest.append(arg)
+            continue
+        if arg in option_strings:
+            if i == count or (args[i][:1] == '-' and args[i] != '-'):
+                raise Fallback()
+            value = args[i]
+            i += 1
+            continue
+        option_string, explicit, explicit_value = arg.partition('=')
+        if explicit and option_string in option_strings:
+            value = explicit_value
+            continue
+        if any(s.startswith(option_string) for s in longs):
+            raise Fallback()
+        if arg[1] != '-' and arg[:2] in option_strings:
+            value = arg[2:]
+            continue
+        rest.append(arg)
+    return value, rest
+
+
+class ConfigOption(object):
+    '''
+    the option added by Subcommand.add_config
+    '''
+    def __init__(self, option_strings, dest, default, env, check_file_for,
+                 kind):
+        self.option_strings = option_strings
+        self.dest = dest
+        self.default = default
+        self.env = env
+        self.check_file_for = check_file_for
+        self.kind = kind
+
+    def resolve(self, args, environ):
+        '''
+        returns the config file, whether it must exist and the other args
+        '''
+        value, args = scan_options(args, self.option_strings)
+        configfile = self.default if value is None else value
+        if configfile and configfile is not SUPPRESS:
+            return configfile, 'command' in self.check_file_for, args
+        if self.env:
+            configfile = environ.get(self.env, None)
+            if configfile:
+                return configfile, 'env' in self.check_file_for, args
+        return self.default, 'default' in self.check_file_for, args
+
+    def load(self, configfile, required):
+        config = import_target(self.kind)()
+        try:
+            config.load(configfile)
+        except Exception:
+            if required:
+                raise Fallback()
+            return None, {}
+        ConfigFile = import_target('subparser.subparser:ConfigFile')
+        return config, {self.dest: ConfigFile(configfile, config)}
+
+
+class Spec(object):
+    '''
+    a generated Subcommand: its main parser, config and batch options, the
+    dests of its profiling options and the import path of the Subcommand to
+    fall back to
+    '''
+    def __init__(self, parser, subcommand, python, config=None, batch=(),
+                 profiling=()):
+        self.parser = parser
+        self.subcommand_path = subcommand
+        self.python = python
+        self.config = config
+        self.batch = batch
+        self.profiling = profiling
+        self.fallbacks = 0
+
+    def subcommand(self):
+        self.fallbacks += 1
+        return import_target(self.subcommand_path)
+
+    def parse(self, args, env):
+        if tuple(sys.version_info[:2]) != self.python:
+            raise Fallback()
+        args = sys.argv[1:] if args is None else list(args)
+        environ = EnvSnapshot(os.environ if env is None else env)
+        config, defaults = None, {}
+        if self.config is not None:
+            configfile, required, args = self.config.resolve(args, environ)
+            if configfile:
+                config, defaults = self.config.load(configfile, required)
+        ns, _ = self.parser.parse_known_args(args, Namespace(),
+                                             (config, environ, defaults))
+        # profiled dispatches are handled by the Subcommand
+        for dest in self.profiling:
+            if hasattr(ns, dest):
+                raise Fallback()
+        return ns
+
+    def resolve(self, args=None, env=None):
+        try:
+            return self.parse(args, env)
+        except Fallback:
+            return self.subcommand().resolve(args, None, env)
+
+    def dispatch(self, args=None, env=None):
+        try:
+            argv = sys.argv[1:] if args is None else list(args)
+            if self.batch and scan_options(argv, self.batch)[0]:
+                raise Fallback()
+            ns = self.parse(args, env)
+        except Fallback:
+            return self.subcommand().dispatch(args, None, env)
+        result = ns.func(ns)
+        if isinstance(result, getattr(types, 'CoroutineType', ())):
+            from subparser.aio import run
+            result = run(result)
+        return result
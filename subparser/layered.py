@@ -0,0 +1,132 @@
+from __future__ import absolute_import
+
+import collections
+import os
+import threading
+
+from .subparser import JsonConfig, _missing
+
+
+class LayeredConfig(object):
+    '''
+    config merged from several files, such as system, user, project and
+    per-run files, with later paths overriding earlier ones.  paths that do
+    not exist are skipped.
+
+    the layers are merged once, by the config class's merge, into a view
+    mapping each key to its value, so get is a single lookup whatever the
+    number of layers.  refresh only parses the layers that changed (several
+    at once on a pool of threads) and merges again.  each merge swaps in a
+    new view, so readers never see a half-merged config.
+    '''
+    def __init__(self, paths, config_class=JsonConfig):
+        self.paths = tuple(paths)
+        self.config_class = config_class
+        self.loaded = False
+        # [stat, document] of each path
+        self._layers = [[None, None] for _ in self.paths]
+        # (merged document, view, sources)
+        self._state = (None, {}, {})
+        self._normalize = config_class().normalize
+        self._lock = threading.Lock()
+
+    @property
+    def config(self):
+        '''
+        the merged document
+        '''
+        return self._state[0]
+
+    @property
+    def source(self):
+        '''
+        the path of the topmost layer that exists
+        '''
+        layers = zip(reversed(self.paths), reversed(self._layers))
+        for path, (stat, document) in layers:
+            if document is not None:
+                return path
+        return None
+
+    def get(self, key, default):
+        value = self._state[1].get(self._normalize(key), _missing)
+        return default if value is _missing else value
+
+    def source_of(self, key):
+        '''
+        the path of the layer key's value comes from, or None
+        '''
+        return self._state[2].get(self._normalize(key))
+
+    @staticmethod
+    def stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size, st.st_ino)
+
+    def parse(self, path):
+        config = self.config_class()
+        try:
+            config.load(path)
+        except EnvironmentError:
+            # removed since it was checked
+            return None
+        return config.config
+
+    def refresh(self):
+        '''
+        parse the layers that changed since the last refresh, and merge them
+        again.  returns True if the config changed.
+        '''
+        with self._lock:
+            stats = [self.stat(path) for path in self.paths]
+            changed = [i for i, stat in enumerate(stats)
+                       if stat != self._layers[i][0]]
+            if self.loaded and not changed:
+                return False
+            pending = [i for i in changed if stats[i] is not None]
+            paths = [self.paths[i] for i in pending]
+            if len(paths) > 1:
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+                    documents = list(executor.map(self.parse, paths))
+            else:
+                documents = [self.parse(path) for path in paths]
+            for i in changed:
+                self._layers[i] = [stats[i], None]
+            for i, document in zip(pending, documents):
+                self._layers[i][1] = document
+            self._state = self.config_class.merge([
+                (path, document)
+                for path, (stat, document) in zip(self.paths, self._layers)
+                if document is not None])
+            self.loaded = True
+            return True
+
+    def __reduce__(self):
+        return (layered_config, (self.paths, self.config_class))
+
+
+# the LayeredConfigs of this process, by (paths, config_class)
+_layered = collections.OrderedDict()
+_layered_lock = threading.Lock()
+_layered_size = 16
+
+
+def layered_config(paths, config_class=JsonConfig):
+    '''
+    returns the LayeredConfig of paths shared by this process, refreshed
+    '''
+    paths = tuple(os.path.abspath(os.path.expanduser(path)) for path in paths)
+    key = (paths, config_class)
+    with _layered_lock:
+        config = _layered.pop(key, None)
+        if config is None:
+            config = LayeredConfig(key[0], config_class)
+        _layered[key] = config
+        while len(_layered) > _layered_size:
+            _layered.popitem(last=False)
+    config.refresh()
+    return config
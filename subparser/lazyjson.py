@@ -0,0 +1,192 @@
+from __future__ import absolute_import
+
+import json
+import mmap
+import re
+
+from .subparser import JsonConfig, _missing
+
+WHITESPACE = re.compile(br'[ \t\n\r]*')
+STRING = re.compile(br'"[^"\\]*(?:\\.[^"\\]*)*"')
+# everything up to the next bracket that is not inside a string
+FILLER = re.compile(br'[^"{}\[\]]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"{}\[\]]*)*')
+# a key and, unless it holds nested brackets, its value and the separator
+MEMBER = re.compile(br'''
+    [ \t\n\r]*("[^"\\]*(?:\\.[^"\\]*)*")[ \t\n\r]*:[ \t\n\r]*
+    (?:(
+        "[^"\\]*(?:\\.[^"\\]*)*"
+        | [{\[][^"{}\[\]]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"{}\[\]]*)*[}\]]
+        | [^,{}\[\]"\s]+
+    )[ \t\n\r]*([,}]))?''', re.VERBOSE)
+SEPARATOR = re.compile(br'[ \t\n\r]*([,}])')
+SCALAR = re.compile(br'[^,}\]\s]*')
+
+
+def skip_value(buf, pos):
+    '''
+    returns the offset just past the json value starting at pos
+    '''
+    c = buf[pos:pos + 1]
+    if c == b'"':
+        match = STRING.match(buf, pos)
+        if match is None:
+            raise ValueError('unterminated string at %d' % pos)
+        return match.end()
+    if c == b'{' or c == b'[':
+        depth = 0
+        while True:
+            c = buf[pos:pos + 1]
+            if c == b'{' or c == b'[':
+                depth += 1
+            elif c == b'}' or c == b']':
+                depth -= 1
+                if depth == 0:
+                    return pos + 1
+            else:
+                raise ValueError('unterminated json value at %d' % pos)
+            pos = FILLER.match(buf, pos + 1).end()
+    return SCALAR.match(buf, pos).end()
+
+
+def scan_object(buf, pos):
+    '''
+    returns {key: (start, end)} for the members of the json object at pos,
+    without decoding their values
+    '''
+    members = {}
+    pos = WHITESPACE.match(buf, pos + 1).end()
+    if buf[pos:pos + 1] == b'}':
+        return members
+    while True:
+        match = MEMBER.match(buf, pos)
+        if match is None:
+            raise ValueError('expected a member at %d' % pos)
+        key, value, separator = match.groups()
+        if b'\\' in key:
+            key = json.loads(key.decode('utf-8'))
+        else:
+            key = key[1:-1].decode('utf-8')
+        if value is not None:
+            members[key] = match.span(2)
+            pos = match.end()
+        else:
+            start = match.end()
+            end = skip_value(buf, start)
+            members[key] = (start, end)
+            match = SEPARATOR.match(buf, end)
+            if match is None:
+                raise ValueError("expected ',' or '}' at %d" % end)
+            separator = match.group(1)
+            pos = match.end()
+        if separator == b'}':
+            return members
+
+
+class LazyDocument(object):
+    '''
+    a json file that is memory-mapped and only decoded where it is read.
+
+    the members of an object are scanned (not decoded) the first time a
+    lookup passes through it, and their offsets kept in objects.  pickling
+    keeps the offsets but not the mapping, which is reopened on first use.
+
+    the file must not be modified in place while it is mapped; replace it
+    instead.
+    '''
+    def __init__(self, source):
+        self.source = source
+        self._buffer = None
+        # the end of the root is only needed to decode all of it
+        self.root = (WHITESPACE.match(self.buffer, 0).end(), None)
+        self.objects = {}
+
+    @property
+    def buffer(self):
+        if self._buffer is None:
+            with open(self.source, 'rb') as f:
+                try:
+                    self._buffer = mmap.mmap(f.fileno(), 0,
+                                             access=mmap.ACCESS_READ)
+                except ValueError:
+                    # empty files cannot be mapped
+                    self._buffer = f.read()
+        return self._buffer
+
+    def members(self, path, span):
+        try:
+            return self.objects[path]
+        except KeyError:
+            pass
+        start, end = span
+        members = None
+        if self.buffer[start:start + 1] == b'{':
+            members = scan_object(self.buffer, start)
+        self.objects[path] = members
+        return members
+
+    def decode(self, span):
+        start, end = span
+        if end is None:
+            end = skip_value(self.buffer, start)
+        return json.loads(self.buffer[start:end].decode('utf-8'))
+
+    def lookup(self, key):
+        '''
+        decodes the value at the key path, or returns a missing marker
+        '''
+        span = self.root
+        for i, k in enumerate(key):
+            members = self.members(key[:i], span)
+            if members is None or k not in members:
+                return _missing
+            span = members[k]
+        return self.decode(span)
+
+    def __getitem__(self, key):
+        value = self.lookup((key,))
+        if value is _missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        members = self.members((), self.root)
+        return members is not None and key in members
+
+    def keys(self):
+        return list(self.members((), self.root) or ())
+
+    def __getstate__(self):
+        return {'source': self.source, 'root': self.root,
+                'objects': self.objects}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._buffer = None
+
+
+class LazyJsonConfig(JsonConfig):
+    '''
+    JsonConfig for large files, where each run only reads a few keys.
+
+    the file is memory-mapped and only the values that get() touches are
+    decoded.  config is a LazyDocument rather than the decoded document.
+    with a SidecarCache, the scanned key offsets are kept between runs.
+    '''
+    def parse(self, source):
+        document = LazyDocument(source)
+        # scan the top level now, so that a sidecar keeps it
+        document.members((), document.root)
+        return document
+
+    def lookup(self, key):
+        return self._config.lookup(key)
+
+    @classmethod
+    def merge(cls, layers):
+        '''
+        JsonConfig.merge of the decoded documents.  merging reads every
+        value of every layer, so layered files gain nothing from being lazy
+        '''
+        return super(LazyJsonConfig, cls).merge([
+            (source, document.decode(document.root))
+            for source, document in layers])
@@ -0,0 +1,97 @@
+from __future__ import absolute_import
+
+import collections
+import multiprocessing
+import shlex
+
+from six import string_types
+
+from .subparser import (BaseConfig, BatchResult, ConfigFacade, ConfigFile,
+                        invoke)
+
+# stands in for a ConfigFile while a namespace is sent to a worker
+ConfigRef = collections.namedtuple('ConfigRef', 'configfile kind')
+
+# configs loaded by this worker process, by (kind, configfile)
+_configs = {}
+
+
+def load_config(ref):
+    key = (ref.kind, ref.configfile)
+    if key not in _configs:
+        config = ref.kind()
+        config.load(ref.configfile)
+        _configs[key] = ConfigFile(ref.configfile, config)
+    return _configs[key]
+
+
+def run(job):
+    '''
+    runs one job in a worker and returns its BatchResult
+    '''
+    argv, ns, dest, error = job
+    if error is not None:
+        return BatchResult(argv, None, error)
+    try:
+        if dest is not None:
+            setattr(ns, dest, load_config(getattr(ns, dest)))
+        return BatchResult(argv, invoke(ns), None)
+    except (Exception, SystemExit) as e:
+        return BatchResult(argv, None, e)
+
+
+def jobs(subcommand, argvs):
+    '''
+    parses each argv in this process and yields the job sent to a worker
+    '''
+    for argv in argvs:
+        if isinstance(argv, string_types):
+            argv = shlex.split(argv)
+        try:
+            ns = subcommand._resolve(argv)
+            profiling = subcommand.profiling
+            if profiling is not None and profiling.pop(ns):
+                raise ValueError('profiling options are not supported by '
+                                 'dispatch_parallel')
+        except (Exception, SystemExit) as e:
+            yield argv, None, None, e
+            continue
+        dest = subcommand.config_action and subcommand.config_action.dest
+        value = getattr(ns, dest, None) if dest else None
+        config = value.config if isinstance(value, ConfigFile) else None
+        if isinstance(config, ConfigFacade) and config.valid:
+            # watched and prefetched configs are read through a facade
+            config = config.impl
+        if isinstance(config, BaseConfig):
+            # workers load the config themselves, once each
+            setattr(ns, dest, ConfigRef(value.configfile, type(config)))
+        else:
+            dest = None
+        yield argv, ns, dest, None
+
+
+def dispatch_parallel(subcommand, argvs, processes=None, chunksize=1,
+                      ordered=True, context=None):
+    '''
+    dispatch argvs across a pool of processes, yielding a BatchResult for
+    each.
+
+    argvs are parsed in this process; workers only receive the parsed
+    namespace, with dispatch functions referenced by import path, and load
+    the config file once per worker rather than once per argv.  processes
+    defaults to the number of cpus.  results are yielded in the order of
+    argvs unless ordered is False.  context selects the multiprocessing start
+    method ('fork', 'spawn', ...); dispatch functions must be importable
+    module level functions under spawn.
+    '''
+    if context is None:
+        pool = multiprocessing.Pool(processes)
+    else:
+        pool = multiprocessing.get_context(context).Pool(processes)
+    try:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for result in imap(run, jobs(subcommand, argvs), chunksize):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,121 @@
+from __future__ import absolute_import, print_function
+
+import argparse
+import contextlib
+import sys
+
+from .subparser import invoke
+
+
+class Profiling(object):
+    '''
+    the options added by Subcommand.add_profiling.  their values are taken
+    out of the namespace before it is dispatched, and dispatch functions run
+    under cProfile and/or tracemalloc when they are given.
+    '''
+    dests = ('_profile', '_profile_output', '_profile_sort', '_tracemalloc',
+             '_tracemalloc_top')
+    # lines of profile printed to stderr
+    limit = 40
+
+    # the main parser's options come before the command, so optional values
+    # (nargs='?') would take the command: the values are separate options
+    def __init__(self, parser, profile='--profile', output='--profile-output',
+                 sort='--profile-sort', tracemalloc='--tracemalloc',
+                 top='--tracemalloc-top'):
+        suppress = argparse.SUPPRESS
+        if profile:
+            parser.add_argument(
+                profile, dest='_profile', action='store_true',
+                default=suppress,
+                help='profile the command, printing the stats')
+        if output:
+            parser.add_argument(
+                output, dest='_profile_output', default=suppress,
+                metavar='FILE',
+                help='profile the command, writing the stats to FILE')
+        if sort:
+            parser.add_argument(
+                sort, dest='_profile_sort', default=suppress, metavar='KEY',
+                help='sort printed profile stats by KEY '
+                     '(default: cumulative)')
+        if tracemalloc:
+            parser.add_argument(
+                tracemalloc, dest='_tracemalloc', action='store_true',
+                default=suppress,
+                help='trace allocations of the command, printing the top '
+                     'lines')
+        if top:
+            parser.add_argument(
+                top, dest='_tracemalloc_top', type=int, default=suppress,
+                metavar='N',
+                help='trace allocations of the command, printing the top N '
+                     'lines')
+
+    def pop(self, ns):
+        '''
+        removes the options from ns, returning {dest: value} of those given
+        '''
+        options = {}
+        for dest in self.dests:
+            if hasattr(ns, dest):
+                options[dest] = getattr(ns, dest)
+                delattr(ns, dest)
+        return options
+
+    def invoke(self, ns, options, stream=None):
+        '''
+        invoke ns under the profilers requested by options
+        '''
+        with self.running(options, stream):
+            return invoke(ns)
+
+    @contextlib.contextmanager
+    def running(self, options, stream=None):
+        '''
+        runs the block under the profilers requested by options, reporting
+        on stream (stderr) at its end
+        '''
+        stream = sys.stderr if stream is None else stream
+        profile = options.get('_profile_output',
+                              '-' if options.get('_profile') else None)
+        limit = options.get('_tracemalloc_top',
+                            10 if options.get('_tracemalloc') else None)
+        if limit is not None:
+            import tracemalloc
+            tracemalloc.start()
+        if profile is not None:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profiler.disable()
+                sort = options.get('_profile_sort', 'cumulative')
+                self.report_profile(profiler, profile, sort, stream)
+            if limit is not None:
+                snapshot = tracemalloc.take_snapshot()
+                tracemalloc.stop()
+                self.report_allocations(snapshot, limit, stream)
+
+    def report_profile(self, profiler, output, sort, stream):
+        if output != '-':
+            profiler.dump_stats(output)
+            return
+        import pstats
+        stats = pstats.Stats(profiler, stream=stream)
+        stats.sort_stats(sort).print_stats(self.limit)
+
+    def report_allocations(self, snapshot, limit, stream):
+        import tracemalloc
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'),
+        ))
+        stats = snapshot.statistics('lineno')
+        print('top %d allocations by line (of %.1f KiB):' % (
+            limit, sum(stat.size for stat in stats) / 1024.0), file=stream)
+        for index, stat in enumerate(stats[:limit], 1):
+            print('#%d: %s' % (index, stat), file=stream)
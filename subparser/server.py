@@ -0,0 +1,243 @@
+'''
+resident dispatch server: keeps a Subcommand's parsers, imports and config
+warm in one process and runs command-lines sent by subparser.client.
+
+each connection is handled in a child forked from the server, which runs
+with the client's argv, working directory, environment and stdio and reports
+the exit code back to the client.  requires a unix platform.
+
+the socket is only accessible to the user running the server (and, where
+the platform reports the peer's credentials, other users' connections are
+refused), since clients hand the server their environment.
+'''
+from __future__ import absolute_import, print_function
+
+import array
+import errno
+import fnmatch
+import io
+import json
+import os
+import select
+import signal
+import socket
+import stat
+import struct
+import sys
+import traceback
+
+from .client import recv_exactly
+from .subparser import ImportDispatch
+
+
+def receive_request(conn):
+    '''
+    reads a request and its stdio file descriptors from a client
+    '''
+    fds = array.array('i')
+    data, ancdata, _, _ = conn.recvmsg(
+        4096, socket.CMSG_SPACE(3 * fds.itemsize))
+    for level, kind, cmsg_data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            size = len(cmsg_data) - (len(cmsg_data) % fds.itemsize)
+            fds.frombytes(cmsg_data[:size])
+    if len(data) < 4:
+        data += recv_exactly(conn, 4 - len(data))
+    size = struct.unpack('!I', data[:4])[0]
+    body = data[4:]
+    if len(body) < size:
+        body += recv_exactly(conn, size - len(body))
+    return json.loads(body.decode('utf-8')), list(fds)
+
+
+def apply_env(env, patterns=None):
+    '''
+    gives the command the environment a cold run would see: env replaces
+    os.environ, or with patterns, the variables matching them
+    '''
+    if patterns is None:
+        os.environ.clear()
+    else:
+        for name in list(os.environ):
+            if any(fnmatch.fnmatchcase(name, p) for p in patterns):
+                del os.environ[name]
+    os.environ.update(env)
+
+
+def remove_socket(path):
+    '''
+    removes the unix socket at path, if there is one.  anything else at path
+    is left alone and raises EEXIST
+    '''
+    try:
+        mode = os.lstat(path).st_mode
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return
+        raise
+    if not stat.S_ISSOCK(mode):
+        raise OSError(errno.EEXIST, 'not a socket, refusing to replace it',
+                      path)
+    os.unlink(path)
+
+
+def peer_uid(conn):
+    '''
+    the uid of the process at the other end of conn, or None where the
+    platform does not tell
+    '''
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                            struct.calcsize('3i'))
+    return struct.unpack('3i', creds)[1]
+
+
+def exit_code(e):
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    print(e.code, file=sys.stderr)
+    return 1
+
+
+class DispatchServer(object):
+    def __init__(self, subcommand, path, warm=True, backlog=64):
+        self.subcommand = subcommand
+        self.path = path
+        self.backlog = backlog
+        self.sock = None
+        self.children = set()
+        self._running = False
+        if warm:
+            self.warm()
+
+    def warm(self):
+        '''
+        build every subcommand's parser and import lazily registered
+        subcommands so children start with them ready
+        '''
+        for parser in self.subcommand.subparser._name_parser_map.values():
+            func = parser.get_default('func')
+            if isinstance(func, ImportDispatch):
+                func.resolve()
+
+    def serve_forever(self, poll_interval=0.5):
+        remove_socket(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # created 0600: only this user may connect
+        umask = os.umask(0o177)
+        try:
+            self.sock.bind(self.path)
+        finally:
+            os.umask(umask)
+        self.sock.listen(self.backlog)
+        previous = signal.signal(signal.SIGTERM,
+                                 lambda signum, frame: self.shutdown())
+        self._running = True
+        try:
+            while self._running:
+                try:
+                    readable, _, _ = select.select([self.sock], [], [],
+                                                   poll_interval)
+                except (OSError, select.error) as e:
+                    if e.args[0] != errno.EINTR:
+                        raise
+                    readable = []
+                if readable:
+                    conn, _ = self.sock.accept()
+                    self.handle(conn)
+                self.reap()
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+            self.sock.close()
+            try:
+                remove_socket(self.path)
+            except OSError:
+                # replaced by something else since
+                pass
+
+    def shutdown(self):
+        self._running = False
+
+    def reap(self):
+        for pid in list(self.children):
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except OSError:
+                done = pid
+            if done:
+                self.children.discard(pid)
+
+    def handle(self, conn):
+        fds = []
+        try:
+            uid = peer_uid(conn)
+            if uid is not None and uid != os.getuid():
+                print('refused a connection from uid %d' % uid,
+                      file=sys.stderr)
+                return
+            conn.settimeout(5)
+            request, fds = receive_request(conn)
+            self.refresh_config(request['argv'])
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                code = 1
+                try:
+                    code = self.run(conn, request, fds)
+                finally:
+                    os._exit(code)
+            self.children.add(pid)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            for fd in fds:
+                os.close(fd)
+            conn.close()
+
+    def refresh_config(self, argv):
+        # reparse a changed config file once here rather than in every child
+        if self.subcommand.config_parser:
+            try:
+                configfile, _, _ = self.subcommand.resolve_config(argv)
+            except (Exception, SystemExit):
+                return
+            if configfile:
+                self.subcommand.preload_config(configfile)
+
+    def run(self, conn, request, fds):
+        '''
+        runs a request in the forked child and returns its exit code
+        '''
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        self.sock.close()
+        os.chdir(request['cwd'])
+        apply_env(request['env'], request.get('env_patterns'))
+        for target, fd in zip((0, 1, 2), fds):
+            os.dup2(fd, target)
+        # the server's own streams may have been redirected elsewhere
+        sys.stdin = io.open(0, 'r', closefd=False)
+        sys.stdout = io.open(1, 'w', closefd=False)
+        sys.stderr = io.open(2, 'w', closefd=False)
+        try:
+            self.subcommand.dispatch(request['argv'])
+            code = 0
+        except SystemExit as e:
+            code = exit_code(e)
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        conn.sendall(struct.pack('!i', code))
+        return code
+
+
+def serve(subcommand, path, warm=True):
+    '''
+    serve subcommand on a unix socket at path until SIGTERM
+    '''
+    DispatchServer(subcommand, path, warm=warm).serve_forever()
@@ -2,14 +2,25 @@ from __future__ import absolute_import
 
 import argparse
 import collections
+import contextlib
 import functools
-import json
-import inspect
+import importlib
 import os
+import re
+import shlex
+import sys
+import threading
+import types
 
-import decorator
-from six import string_types
-from six.moves import configparser
+from .cache import config_cache, paused_gc
+from .timing import Timings, timed
+
+# inspect, json, configparser and six are imported when first needed, to
+# keep importing subparser cheap for short-lived command-lines
+if sys.version_info[0] >= 3:
+    string_types = (str,)
+else:
+    string_types = (basestring,)  # noqa: F821
 
 
 def ns_dispatch(func, ns, pass_ns=True):
@@ -39,61 +50,561 @@ def ns_dispatch(func, ns, pass_ns=True):
         arg2 in the ns
         args1 in the ns gets passed as varargs
         all other dests in ns goes into kwargs
+
+    def foo(arg1, *, arg2):
+        arg1 and arg2 in the ns
+        arg2 is left to its default if it is not in the ns
+
+    for coroutine functions, the coroutine is returned to be awaited.
+
+    to dispatch the same function repeatedly, build a Binder once instead.
     '''
-    kwargs = {}
-    args = []
-    values = vars(ns)
-    consumed = []
-    spec = inspect.getargspec(func)
-    for arg in spec.args:
-        consumed.append(arg)
-        if arg == 'ns' and pass_ns:
-            args.append(ns)
-        else:
-            args.append(values[arg])
-    if spec.varargs:
-        if isinstance(values[spec.varargs], (list, tuple)):
-            args.extend(values[spec.varargs])
+    return Binder(func, pass_ns)(ns)
+
+
+CoroutineType = getattr(types, 'CoroutineType', ())
+
+
+def invoke(ns):
+    '''
+    calls the namespace's dispatch function, running it to completion on a
+    new event loop if it is a coroutine function
+    '''
+    result = ns.func(ns)
+    if isinstance(result, CoroutineType):
+        from .aio import run
+        result = run(result)
+    return result
+
+
+def parameters(func):
+    '''
+    returns the (args, varargs, kwonlyargs, varkw) names of func's signature
+    '''
+    names = code_parameters(func)
+    if names is not None:
+        return names
+    import inspect
+    try:
+        signature = inspect.signature
+    except AttributeError:
+        spec = inspect.getargspec(func)
+        return spec.args, spec.varargs, [], spec.keywords
+    args, varargs, kwonly, varkw = [], None, [], None
+    for param in signature(func).parameters.values():
+        if param.kind == param.VAR_POSITIONAL:
+            varargs = param.name
+        elif param.kind == param.KEYWORD_ONLY:
+            kwonly.append(param.name)
+        elif param.kind == param.VAR_KEYWORD:
+            varkw = param.name
         else:
-            args.append(values[spec.varargs])
-    if spec.keywords:
-        for k, v in values.items():
-            if k not in consumed:
-                kwargs[k] = v
-        if 'ns' not in consumed and pass_ns:
+            args.append(param.name)
+    return args, varargs, kwonly, varkw
+
+
+def code_parameters(func):
+    '''
+    parameters for plain functions, read from their code without inspect.
+    None for anything else.
+    '''
+    while hasattr(func, '__wrapped__') and not hasattr(func, '__signature__'):
+        func = func.__wrapped__
+    if (hasattr(func, '__signature__') or
+            not isinstance(func, types.FunctionType)):
+        return None
+    code = func.__code__
+    names = code.co_varnames
+    count, kwcount = code.co_argcount, getattr(code, 'co_kwonlyargcount', 0)
+    rest = list(names[count + kwcount:])
+    varargs = rest.pop(0) if code.co_flags & 0x04 else None
+    varkw = rest.pop(0) if code.co_flags & 0x08 else None
+    kwonly = list(names[count:count + kwcount])
+    return list(names[:count]), varargs, kwonly, varkw
+
+
+class Binder(object):
+    '''
+    ns_dispatch with the function's signature compiled ahead of time.
+
+    calling the binder with a namespace maps it onto the function and calls
+    it, the same way ns_dispatch does.
+    '''
+    def __init__(self, func, pass_ns=True):
+        self.func = func
+        self.pass_ns = pass_ns
+        args, varargs, kwonly, varkw = parameters(func)
+        # None marks where the namespace itself is passed
+        self.args = tuple(None if arg == 'ns' and pass_ns else arg
+                          for arg in args)
+        self.varargs = varargs
+        self.kwonly = tuple(None if arg == 'ns' and pass_ns else arg
+                            for arg in kwonly)
+        self.varkw = varkw is not None
+        self.consumed = frozenset(args) | frozenset(kwonly)
+        self.kwargs_ns = (pass_ns and varkw is not None and
+                          'ns' not in self.consumed)
+
+    def __call__(self, ns):
+        args = [ns if arg is None else getattr(ns, arg) for arg in self.args]
+        if self.varargs:
+            value = getattr(ns, self.varargs)
+            if isinstance(value, (list, tuple)):
+                args.extend(value)
+            else:
+                args.append(value)
+        kwargs = {}
+        if self.varkw:
+            consumed = self.consumed
+            kwargs = {k: v for k, v in vars(ns).items() if k not in consumed}
+        for arg in self.kwonly:
+            if arg is None:
+                kwargs['ns'] = ns
+            elif hasattr(ns, arg):
+                kwargs[arg] = getattr(ns, arg)
+        if self.kwargs_ns:
             kwargs['ns'] = ns
-    return func(*args, **kwargs)
+        return self.func(*args, **kwargs)
+
+    def __reduce__(self):
+        # plain functions are pickled by import path: under DispatchWrapper,
+        # the module attribute is the wrapper rather than func itself
+        func = self.func
+        name = getattr(func, '__qualname__', getattr(func, '__name__', ''))
+        if isinstance(func, types.FunctionType) and '<locals>' not in name:
+            path = '%s:%s' % (func.__module__, name)
+            return (bind_target, (path, self.pass_ns))
+        return (Binder, (self.func, self.pass_ns))
+
+
+def bind_target(path, pass_ns=True):
+    '''
+    returns a Binder for the function at a dotted path
+    '''
+    return Binder(import_target(path), pass_ns)
+
+
+def import_target(path):
+    '''
+    imports a 'package.module:attr' path and returns the attribute.  without
+    an attr, the module itself is returned.
+    '''
+    module_name, _, attrs = path.partition(':')
+    obj = importlib.import_module(module_name)
+    for attr in attrs.split('.') if attrs else ():
+        obj = getattr(obj, attr)
+    return obj
 
 
-def DispatchWrapper(subparser, func, name=None):
+def entry_points(group):
+    '''
+    returns (name, path) for every setuptools entry point in group
+    '''
+    try:
+        from importlib import metadata
+    except ImportError:
+        import pkg_resources
+        return [(ep.name, '%s:%s' % (ep.module_name, '.'.join(ep.attrs)))
+                for ep in pkg_resources.iter_entry_points(group)]
+    eps = metadata.entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group=group)
+    else:
+        eps = eps.get(group, ())
+    # drop any [extras] from the value
+    return [(ep.name, ep.value.split()[0]) for ep in eps]
+
+
+class ImportDispatch(object):
+    '''
+    dispatch function for a subcommand whose implementation is only imported
+    when it is dispatched
+    '''
+    def __init__(self, target):
+        self.target = target
+        self.binder = None
+
+    def resolve(self):
+        if self.binder is None:
+            self.binder = Binder(import_target(self.target))
+        return self.binder.func
+
+    def __call__(self, ns):
+        if self.binder is None:
+            self.resolve()
+        return self.binder(ns)
+
+    def __reduce__(self):
+        return (ImportDispatch, (self.target,))
+
+
+def declare_arguments(declare, parser):
+    '''
+    calls declare (or the function at its dotted path) with parser
+    '''
+    if isinstance(declare, string_types):
+        declare = import_target(declare)
+    return declare(parser)
+
+
+def DispatchWrapper(subparser, func, name=None, lazy=False):
     '''
     creates a wrapper function that behaves both as the original function as
     well as a subparser
+
+    when lazy is set, the subparser is not built until its command is
+    selected.  only add_argument and set_defaults are exposed on the wrapper
+    (they are recorded and replayed, and return None); everything else is
+    reachable through wrapper.parser.
     '''
     name = name or func.__name__
-    parser = subparser.add_parser(name)
-    parser.set_defaults(func=functools.partial(ns_dispatch, func))
-    @decorator.decorator
-    def _wrapper(f, *args, **kwargs):
-        return f(*args, **kwargs)
-    wrapper = _wrapper(func)
-    for name, attr in inspect.getmembers(parser, inspect.ismethod):
-        setattr(wrapper, name, attr)
+    if lazy:
+        parser = subparser.add_lazy_parser(name)
+    else:
+        parser = subparser.add_parser(name)
+    parser.set_defaults(func=Binder(func))
+    wrapper = copy_function(func)
+    if lazy:
+        for attr in LazyParser.recorded:
+            setattr(wrapper, attr, getattr(parser, attr))
+    else:
+        for attr in dir(parser):
+            method = getattr(parser, attr)
+            if isinstance(method, types.MethodType):
+                setattr(wrapper, attr, method)
+    wrapper.parser = parser
+    return wrapper
+
+
+def copy_function(func):
+    '''
+    returns a copy of func, sharing its code, globals, defaults and closure,
+    to hang a parser's methods on.  the copy keeps func's signature without
+    compiling a wrapper for it.  other callables get a plain wrapper.
+    '''
+    if isinstance(func, types.FunctionType):
+        wrapper = types.FunctionType(func.__code__, func.__globals__,
+                                     func.__name__, func.__defaults__,
+                                     func.__closure__)
+        if hasattr(func, '__kwdefaults__'):
+            wrapper.__kwdefaults__ = func.__kwdefaults__
+    else:
+        def wrapper(*args, **kwargs):
+            return func(*args, **kwargs)
+    functools.update_wrapper(wrapper, func)
+    wrapper.__wrapped__ = func
     return wrapper
 
 
+class LazyParser(object):
+    '''
+    stand-in for a subcommand's parser that has not been built yet.
+
+    add_argument and set_defaults calls are recorded and replayed onto the
+    real parser when it is built.  any other attribute access builds the
+    parser and forwards to it.
+
+    until the parser is built, add_argument returns None rather than the
+    Action argparse would; use apply to reach the Actions.
+    '''
+    recorded = ('add_argument', 'set_defaults')
+
+    def __init__(self, action, name, kwargs):
+        self.action = action
+        self.name = name
+        self.kwargs = kwargs
+        self.calls = []
+        self.parser = None
+        # held while building, so concurrent dispatches build it once
+        self.lock = threading.RLock()
+
+    def _record(self, method, args, kwargs):
+        with self.lock:
+            if self.parser is None:
+                self.calls.append((method, args, kwargs))
+                return None
+        return getattr(self.parser, method)(*args, **kwargs)
+
+    def apply(self, func):
+        '''
+        call func with the parser once it is built
+        '''
+        with self.lock:
+            if self.parser is None:
+                self.calls.append((func, (), {}))
+                return None
+        return func(self.parser)
+
+    def add_argument(self, *args, **kwargs):
+        return self._record('add_argument', args, kwargs)
+
+    def set_defaults(self, **kwargs):
+        return self._record('set_defaults', (), kwargs)
+
+    def build(self):
+        if self.parser is not None:
+            return self.parser
+        with self.lock:
+            if self.parser is None:
+                parser = self.action._parser_class(**self.kwargs)
+                for method, args, kwargs in self.calls:
+                    if callable(method):
+                        method(parser, *args, **kwargs)
+                    else:
+                        getattr(parser, method)(*args, **kwargs)
+                self.parser = parser
+                self.calls = None
+        return self.parser
+
+    def __getattr__(self, attr):
+        return getattr(self.action._name_parser_map[self.name], attr)
+
+
+class CommandTrie(object):
+    '''
+    prefix tree of command names.  matches walks one node per character of
+    the prefix however many names there are, and only walks the subtree
+    when the prefix is ambiguous.
+    '''
+    def __init__(self, names=()):
+        # node: [children by character, number of names under it,
+        #        the last name added under it, the name ending at it]
+        self.root = [{}, 0, None, None]
+        for name in names:
+            self.insert(name)
+
+    def insert(self, name):
+        node = self.root
+        node[1] += 1
+        for char in name:
+            node = node[0].setdefault(char, [{}, 0, None, None])
+            node[1] += 1
+            node[2] = name
+        node[3] = name
+
+    def matches(self, prefix):
+        '''
+        the names starting with prefix, sorted
+        '''
+        node = self.root
+        for char in prefix:
+            node = node[0].get(char)
+            if node is None:
+                return []
+        if node[1] == 1:
+            return [node[2]]
+        names, stack = [], [node]
+        while stack:
+            node = stack.pop()
+            if node[3] is not None:
+                names.append(node[3])
+            stack.extend(node[0].values())
+        return sorted(names)
+
+
+class ParserMap(dict):
+    '''
+    name -> parser map that builds LazyParsers on first lookup
+    '''
+    def __init__(self):
+        super(ParserMap, self).__init__()
+        self._trie = None
+
+    @property
+    def trie(self):
+        '''
+        a CommandTrie of the names, built on first use
+        '''
+        if self._trie is None:
+            self._trie = CommandTrie(self)
+        return self._trie
+
+    def __setitem__(self, name, parser):
+        if self._trie is not None and name not in self:
+            self._trie.insert(name)
+        dict.__setitem__(self, name, parser)
+
+    def __getitem__(self, name):
+        parser = dict.__getitem__(self, name)
+        if isinstance(parser, LazyParser):
+            with parser.lock:
+                parser = parser.build()
+                dict.__setitem__(self, name, parser)
+        return parser
+
+    def get(self, name, default=None):
+        if name in self:
+            return self[name]
+        return default
+
+    def values(self):
+        return [self[name] for name in self]
+
+    def items(self):
+        return [(name, self[name]) for name in self]
+
+
+class SubcommandsAction(argparse._SubParsersAction):
+    '''
+    subparsers action that can also register parsers lazily.
+
+    path is the names of the groups above the action's commands: dest is
+    set to the command's full path ('cluster node drain').  with abbrev,
+    unambiguous prefixes of command names are accepted.
+    '''
+    def __init__(self, *args, **kwargs):
+        self.path = kwargs.pop('path', ())
+        self.abbrev = kwargs.pop('abbrev', False)
+        super(SubcommandsAction, self).__init__(*args, **kwargs)
+        self._name_parser_map = self.choices = ParserMap()
+
+    def resolve(self, name):
+        '''
+        returns the command name is an abbreviation of, or name itself
+        '''
+        if not self.abbrev or name in self._name_parser_map:
+            return name
+        matches = self._name_parser_map.trie.matches(name)
+        if len(matches) > 1:
+            raise argparse.ArgumentError(
+                self, 'ambiguous choice: %r could match %s' % (
+                    name, ', '.join(matches)))
+        return matches[0] if matches else name
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        name = values[0]
+        super(SubcommandsAction, self).__call__(parser, namespace, values,
+                                                option_string)
+        # a group's action has already set the path of its own command
+        if (self.path and self.dest is not argparse.SUPPRESS and
+                getattr(namespace, self.dest) == name):
+            setattr(namespace, self.dest, ' '.join(self.path + (name,)))
+
+    def attach(self, parser):
+        '''
+        add the action to parser, as add_subparsers does with the actions it
+        makes
+        '''
+        parser._subparsers = parser._positionals
+        parser._subparsers._add_action(self)
+
+    def add_lazy_parser(self, name, **kwargs):
+        '''
+        add_parser, registering a LazyParser under name and its aliases
+        '''
+        if kwargs.get('prog') is None:
+            kwargs['prog'] = '%s %s' % (self._prog_prefix, name)
+        aliases = kwargs.pop('aliases', ())
+        if name in self._name_parser_map:
+            raise argparse.ArgumentError(self,
+                                         'conflicting subparser: %s' % name)
+        for alias in aliases:
+            if alias in self._name_parser_map:
+                raise argparse.ArgumentError(
+                    self, 'conflicting subparser alias: %s' % alias)
+        if 'help' in kwargs:
+            metavar = name
+            if aliases:
+                metavar = '%s (%s)' % (name, ', '.join(aliases))
+            self._choices_actions.append(argparse.Action(
+                option_strings=[], dest=name, help=kwargs.pop('help'),
+                metavar=metavar))
+        parser = LazyParser(self, name, kwargs)
+        self._name_parser_map[name] = parser
+        # the aliases build and share the same parser
+        for alias in aliases:
+            self._name_parser_map[alias] = parser
+        return parser
+
+
+# a \0 followed by an arg that looks like an option, in \0-joined args
+OPTION_LIKE = re.compile(r'\0(-[^\0]*)')
+
+
+def scan_options(args, actions):
+    '''
+    removes the options of actions from args in a single scan, as
+    parse_known_args of a parser holding only those actions would.
+
+    returns ({dest: value}, remaining args), or None if an action or an arg
+    needs more of argparse than the scan handles (types, nargs, abbreviated
+    options, values that look like options); parse those instead.
+    '''
+    strings = {}
+    for action in actions:
+        if (action.nargs is not None or action.type is not None or
+                action.required):
+            return None
+        for option_string in action.option_strings:
+            strings[option_string] = action
+    longs = [s for s in strings if len(s) > 2]
+    # only args that look like options are looked at one by one
+    joined = '\0' + '\0'.join(args)
+    if joined.count('\0') != len(args):
+        return None
+    values = {}
+    rest = []
+    index = offset = start = 0
+    for match in OPTION_LIKE.finditer(joined):
+        index += joined.count('\0', offset, match.start())
+        offset = match.start()
+        arg = match.group(1)
+        if index < start or arg == '-':
+            continue
+        if arg == '--':
+            break
+        matched = match_option(args, index, strings, longs)
+        if matched is None:
+            return None
+        action, value, width = matched
+        if action is None:
+            continue
+        values[action.dest] = value
+        rest.extend(args[start:index])
+        start = index + width
+    rest.extend(args[start:])
+    return values, rest
+
+
+# match_option's result for args that are not the scanned options
+NO_OPTION = (None, None, 0)
+
+
+def match_option(args, index, strings, longs):
+    '''
+    matches args[index], an arg that looks like an option, against the
+    option strings of scan_options.  returns (action, value, number of args
+    taken), NO_OPTION if it is none of them, or None if it needs argparse.
+    '''
+    arg = args[index]
+    action = strings.get(arg)
+    option_string, explicit, value = arg.partition('=')
+    if action is not None:
+        following = args[index + 1] if index + 1 < len(args) else None
+        if following is None or (following[:1] == '-' and following != '-'):
+            return None
+        return action, args[index + 1], 2
+    if explicit and option_string in strings:
+        return strings[option_string], value, 1
+    if any(s.startswith(option_string) for s in longs):
+        return None
+    if arg[1] != '-' and arg[:2] in strings:
+        return strings[arg[:2]], arg[2:], 1
+    return NO_OPTION
+
+
 class ConfigAction(argparse.Action):
     def __init__(self, *args, **kwargs):
         self.env = kwargs.pop('env', None)
         self.check_file_for = kwargs.pop('check_file_for', ('command',))
         super(ConfigAction, self).__init__(*args, **kwargs)
 
-    def resolve_config(self, ns):
+    def resolve_config(self, ns, env=os.environ):
         configfile = getattr(ns, self.dest, None)
         if configfile:
             return configfile, 'command' in self.check_file_for
         if self.env:
-            configfile = os.getenv(self.env, None)
+            configfile = env.get(self.env, None)
             if configfile:
                 return configfile, 'env' in self.check_file_for
         return self.default, 'default' in self.check_file_for
@@ -102,26 +613,20 @@ class ConfigAction(argparse.Action):
         setattr(namespace, self.dest, values)
 
 
-class Subcommand(object):
+class CommandGroup(object):
     '''
-    multi-use object:
+    registers commands on a subparsers action:
         - can be called to be used as a decorator to wrap dispatch functions
-        - dispatch allows us to process the command-line and run the dispatch
-          function
-        - add_config adds an option to loads a config file prior to handling
-          command-line options
-        - all other methods are passed to the main parser
+        - lazy and load_entry_points register commands imported on dispatch
+        - group adds a nested group of commands
+        - all other methods are passed to the group's parser
     '''
-    def __init__(self, parser, config):
+    def __init__(self, parser, subparser, lazy=False, declares=None):
         self.parser = parser
-        self.subparser = parser.add_subparsers(dest='command',
-                                               parser_class=parser_factory(
-                                                   type(parser),
-                                                   config))
-        self.subparser.required = True
-        self.config_parser = None
-        self.config_action = None
-        self.config = config
+        self.subparser = subparser
+        self.lazy_parsers = lazy
+        # declare functions (or their paths) passed to lazy
+        self.declares = [] if declares is None else declares
 
     def __call__(self, name_or_func=None):
         '''
@@ -129,10 +634,12 @@ class Subcommand(object):
         '''
         if isinstance(name_or_func, string_types):
             def _decorator(f):
-                return DispatchWrapper(self.subparser, f, name_or_func)
+                return DispatchWrapper(self.subparser, f, name_or_func,
+                                       lazy=self.lazy_parsers)
             return _decorator
         elif callable(name_or_func):
-            return DispatchWrapper(self.subparser, name_or_func)
+            return DispatchWrapper(self.subparser, name_or_func,
+                                   lazy=self.lazy_parsers)
         raise Exception('unrecognized argument to Subcommand')
 
     def __getattr__(self, attr):
@@ -141,35 +648,687 @@ class Subcommand(object):
         '''
         return getattr(self.parser, attr)
 
+    def lazy(self, name, target, declare=None, **kwargs):
+        '''
+        register a subcommand by dotted path ('package.module:func').  the
+        module is only imported when the command is dispatched.
+
+        arguments can be declared on the returned parser, or by declare: a
+        function (or dotted path to one) that is called with the parser when
+        it is built.  keep declare in a module that is cheap to import.
+        '''
+        if self.lazy_parsers:
+            parser = self.subparser.add_lazy_parser(name, **kwargs)
+        else:
+            parser = self.subparser.add_parser(name, **kwargs)
+        parser.set_defaults(func=ImportDispatch(target))
+        if declare is not None:
+            self.declares.append(declare)
+            declare = functools.partial(declare_arguments, declare)
+            if self.lazy_parsers:
+                parser.apply(declare)
+            else:
+                declare(parser)
+        return parser
+
+    def load_entry_points(self, group, declare_group=None):
+        '''
+        register every entry point in group as a lazily imported subcommand.
+
+        if declare_group is given, its entry points declare the arguments of
+        the subcommand with the same name.
+        '''
+        declares = dict(entry_points(declare_group)) if declare_group else {}
+        return dict((name, self.lazy(name, target, declare=declares.get(name)))
+                    for name, target in entry_points(group))
+
+    def group(self, name, **kwargs):
+        '''
+        add a group of commands under name (app cluster node drain), and
+        return it.  commands, lazy commands and nested groups are registered
+        on the group as on the Subcommand, and its own options are added
+        with add_argument.
+
+        the group's parser, and each of its commands' parsers, are built
+        only once the command-line reaches them.
+        '''
+        parser = self.subparser.add_lazy_parser(name, **kwargs)
+        outer = self.subparser
+        action = SubcommandsAction(option_strings=[],
+                                   prog=parser.kwargs['prog'],
+                                   parser_class=outer._parser_class,
+                                   dest=outer.dest, path=outer.path + (name,),
+                                   abbrev=outer.abbrev)
+        action.required = True
+        parser.apply(action.attach)
+        return CommandGroup(parser, action, lazy=True, declares=self.declares)
+
+
+class Subcommand(CommandGroup):
+    '''
+    multi-use object:
+        - can be called to be used as a decorator to wrap dispatch functions
+        - dispatch allows us to process the command-line and run the dispatch
+          function
+        - add_config adds an option to loads a config file prior to handling
+          command-line options
+        - all other methods are passed to the main parser
+    '''
+    def __init__(self, parser, config, lazy=False, slots=False, abbrev=False):
+        super(Subcommand, self).__init__(parser, parser.add_subparsers(
+            dest='command',
+            action=SubcommandsAction,
+            abbrev=abbrev,
+            parser_class=parser_factory(
+                type(parser),
+                config,
+                env_prefix=getattr(parser, '_env_prefix', None))), lazy=lazy)
+        self.slots = slots
+        self.namespace_types = {}
+        self.subparser.required = True
+        self.config_parser = None
+        self.config_action = None
+        self.config = config
+        self.config_watch = None
+        self.config_watcher = None
+        self.config_layers = ()
+        self.config_prefetch = False
+        self.config_lock = threading.Lock()
+        self.config_callbacks = []
+        self.batch_parser = None
+        self.batch_action = None
+        self.dispatch_hooks = []
+        self.profiling = None
+
     def add_config(self, *args, **kwargs):
         '''
         add a config option to load config files prior to command-line
+
+        with watch=True (or a polling interval in seconds), the loaded file
+        is reloaded in the background when it changes, and the config passed
+        to dispatch functions always reads from the latest version.
+
+        layers is a list of config files (such as system, user and project
+        files) merged under the one given to the option, later files
+        overriding earlier ones.  see layered.LayeredConfig.
+
+        with prefetch=True, the config file is loaded on a background thread
+        while args are parsed, starting from the option's env or default
+        path before args are even scanned.  parsing waits for it when a
+        value from the config is needed.  worth it where opening the file is
+        slow (such as on network filesystems).
         '''
         self.config.impl = kwargs.pop('config_class', JsonConfig)()
+        watch = kwargs.pop('watch', False)
+        self.config_layers = tuple(kwargs.pop('layers', ()))
+        self.config_prefetch = kwargs.pop('prefetch', False)
+        if watch and self.config_layers:
+            raise ValueError('layered configs are refreshed on every '
+                             'dispatch and cannot be watched')
+        if self.config_prefetch and (watch or self.config_layers):
+            raise ValueError('only single, unwatched config files can be '
+                             'prefetched')
+        if watch:
+            self.config_watch = 1.0 if watch is True else watch
         self.config_parser = argparse.ArgumentParser(add_help=False)
         self.config_action = self.config_parser.add_argument(*args, action=ConfigAction, **kwargs)
         kwargs.pop('check_file_for', None)
         self.parser.add_argument(*args, action=ConfigAction, check_file_for=[], **kwargs)
 
-    def dispatch(self, args=None, namespace=None):
+    def add_batch(self, *args, **kwargs):
+        '''
+        add an option naming a file (- for stdin) of command-lines to dispatch
+        in turn.  any other options given with it are prepended to each line.
+        '''
+        kwargs.setdefault('metavar', 'FILE')
+        kwargs.pop('default', None)
+        self.batch_parser = argparse.ArgumentParser(add_help=False)
+        self.batch_action = self.batch_parser.add_argument(*args, **kwargs)
+        self.parser.add_argument(*args, default=argparse.SUPPRESS, env=False,
+                                 **kwargs)
+
+    def add_profiling(self, profile='--profile', output='--profile-output',
+                      sort='--profile-sort', tracemalloc='--tracemalloc',
+                      top='--tracemalloc-top'):
+        '''
+        add options running the dispatch function under cProfile (printing
+        the stats, or writing them to a file for pstats/snakeviz) and
+        tracemalloc (printing the top allocating lines).  pass None for an
+        option to leave it out.  the options are removed from the namespace
+        before it is dispatched, and only dispatch acts on them.
+        '''
+        from .profiling import Profiling
+        self.profiling = Profiling(self.parser, profile, output, sort,
+                                   tracemalloc, top)
+        return self.profiling
+
+    def dispatch(self, args=None, namespace=None, env=None):
         '''
-        process args and dispatch appropriate dispatch function
+        process args and dispatch appropriate dispatch function.
+
+        env replaces os.environ for this dispatch.  dispatch does not modify
+        the Subcommand, so it can be called from several threads at once.
         '''
+        if self.batch_parser:
+            args = sys.argv[1:] if args is None else list(args)
+            ns, rest = self.parse_options(self.batch_parser,
+                                          [self.batch_action], args)
+            source = getattr(ns, self.batch_action.dest)
+            if source:
+                return self.dispatch_batch(source, rest, namespace, env)
+        return self._dispatch(args, namespace, env)
+
+    def dispatch_many(self, argvs, namespace=None, env=None):
+        '''
+        dispatch each argv in turn and yield a BatchResult for each.
+
+        argvs may be lists of args or command-line strings, and is consumed
+        lazily.  the parsers and config cache are reused between argvs.  an
+        argv that fails, including on argparse errors, is reported in its
+        result and does not stop the batch.  env replaces os.environ for
+        every argv, as in dispatch.
+        '''
+        import copy
+        for argv in argvs:
+            if isinstance(argv, string_types):
+                argv = shlex.split(argv)
+            try:
+                result = self._dispatch(argv, copy.copy(namespace), env)
+            except (Exception, SystemExit) as e:
+                yield BatchResult(argv, None, e)
+            else:
+                yield BatchResult(argv, result, None)
+
+    def dispatch_batch(self, source, prefix=(), namespace=None, env=None):
+        '''
+        dispatch every command-line in the file source (- for stdin), with
+        prefix prepended to each.  failures are reported on stderr.  returns
+        the list of BatchResults.
+        '''
+        prefix = list(prefix)
+        results = []
+        argvs = (prefix + argv for argv in read_batch(source))
+        for result in self.dispatch_many(argvs, namespace, env):
+            # argparse reports its own errors before exiting
+            error = result.error
+            if error is not None and not isinstance(error, SystemExit):
+                sys.stderr.write('%s: %s\n' % (' '.join(result.argv), error))
+            results.append(result)
+        return results
+
+    def dispatch_async(self, args=None, namespace=None, executor=None):
+        '''
+        coroutine version of dispatch, to be awaited from a running event
+        loop.  see aio.dispatch_async.
+        '''
+        from .aio import dispatch_async
+        return dispatch_async(self, args, namespace, executor)
+
+    def serve(self, path, warm=True):
+        '''
+        serve command-lines from subparser.client on a unix socket at path
+        until SIGTERM.  see server.DispatchServer.
+        '''
+        from .server import serve
+        serve(self, path, warm=warm)
+
+    def write_completion(self, cache, target, modules=()):
+        '''
+        write the shell completion cache read by subparser/complete.py.
+        target is this subcommand's import path.  see completion.write_cache.
+        '''
+        from .completion import write_cache
+        return write_cache(self, cache, target, modules)
+
+    def _dispatch(self, args=None, namespace=None, env=None):
+        if not self.dispatch_hooks:
+            return self._invoke(self._resolve(args, namespace, env))
+        with self._hooked(args) as timings:
+            ns = self._resolve(args, namespace, env, timings)
+            timings.command = getattr(ns, 'command', None)
+            with timings.phase('dispatch'):
+                return self._invoke(ns)
+
+    @contextlib.contextmanager
+    def _hooked(self, args):
+        '''
+        times a dispatch of args and passes its Timings to the on_dispatch
+        callbacks.  yields the Timings, or None if there are no callbacks.
+        '''
+        if not self.dispatch_hooks:
+            yield None
+            return
+        timings = Timings(sys.argv[1:] if args is None else list(args))
+        try:
+            yield timings
+        except BaseException as e:
+            timings.error = e
+            raise
+        finally:
+            timings.finish()
+            for hook in self.dispatch_hooks:
+                hook(timings)
+
+    def on_dispatch(self, callback):
+        '''
+        call callback(timings) after every dispatch, with the Timings of its
+        phases: config_scan (finding the config option), config_load, env,
+        config (reading values from the config), coerce (argument types),
+        parse (argparse itself) and dispatch (the dispatch function).
+        dispatches are only timed while there are callbacks.
+        '''
+        self.dispatch_hooks.append(callback)
+        return callback
+
+    def _invoke(self, ns):
+        if self.profiling is not None:
+            options = self.profiling.pop(ns)
+            if options:
+                return self.profiling.invoke(ns, options)
+        return invoke(ns)
+
+    def resolve(self, args=None, namespace=None, env=None, timings=None):
+        '''
+        process args (loading any config) into the namespace that would be
+        dispatched, without dispatching it.  timings, if given, records the
+        time spent in each phase.
+        '''
+        ns = self._resolve(args, namespace, env, timings)
+        if self.profiling is not None:
+            self.profiling.pop(ns)
+        return ns
+
+    def _resolve(self, args=None, namespace=None, env=None, timings=None):
+        phase = timed(timings)
+        env = EnvSnapshot(os.environ if env is None else env)
+        context = DispatchContext(ConfigFacade(), env, {}, timings)
+        prefetched = None
         if self.config_parser:
-            self.config.reset()
-            ns, args = self.config_parser.parse_known_args(args, namespace)
-            configfile, required = self.config_action.resolve_config(ns)
-            if configfile:
-                try:
-                    self.config.load(configfile)
-                except Exception:
-                    if required:
-                        raise
+            if self.config_prefetch:
+                # speculatively, from the env or default path
+                configfile = self.config_action.resolve_config(
+                    argparse.Namespace(), env)[0]
+                prefetched = self.prefetch(configfile)
+            with phase('config_scan'):
+                configfile, required, args = self.resolve_config(
+                    args, namespace, env)
+            if configfile or self.config_layers:
+                with phase('config_load'):
+                    context = self.load_context(configfile, required, env,
+                                                timings, prefetched)
+        with dispatch_context(context), phase('parse'):
+            preset = (namespace is not None and
+                      self.config_action is not None and
+                      hasattr(namespace, self.config_action.dest))
+            ns = self.parser.parse_args(args, namespace)
+            if isinstance(context.config, PrefetchFacade) and not preset:
+                # waits for the config if no value needed it
+                if context.config.valid:
+                    setattr(ns, self.config_action.dest,
+                            ConfigFile(configfile, context.config.impl))
+            if self.slots and namespace is None:
+                ns = self.compact(ns)
+        return ns
+
+    def prefetch(self, configfile, prefetched=None):
+        '''
+        returns a PrefetchedConfig loading configfile, reusing prefetched if
+        it is loading the same file
+        '''
+        if not configfile:
+            return None
+        if prefetched is not None and prefetched.configfile == configfile:
+            return prefetched
+        return PrefetchedConfig(type(self.config.impl), configfile)
+
+    def command_parsers(self, command):
+        '''
+        returns the parsers from the main parser down to command's, for a
+        command name or the path of a command in groups ('cluster node drain')
+        '''
+        parsers, action = [self.parser], self.subparser
+        for name in command.split(' '):
+            parser = action._name_parser_map[name]
+            parsers.append(parser)
+            action = next((a for a in parser._actions
+                           if isinstance(a, SubcommandsAction)), None)
+        return parsers
+
+    def namespace_type(self, command, extra=()):
+        '''
+        returns the slotted namespace class for command, with a field for
+        each dest of the parsers from the main parser to command's, and for
+        extra
+        '''
+        cls, fields = self.namespace_types.get(command, (None, frozenset()))
+        if cls is None or not fields.issuperset(extra):
+            names = []
+            for parser in self.command_parsers(command):
+                names.extend(a.dest for a in parser._actions
+                             if a.dest is not argparse.SUPPRESS)
+                names.extend(parser._defaults)
+            names.extend(extra)
+            names = tuple(name
+                          for name in collections.OrderedDict.fromkeys(names)
+                          if isinstance(name, string_types) and
+                          IDENTIFIER.match(name))
+            cls, fields = namespace_type(names), frozenset(names)
+            self.namespace_types[command] = (cls, fields)
+        return cls
+
+    def compact(self, ns):
+        '''
+        returns ns as an instance of its command's slotted namespace class,
+        or ns itself if its dests cannot be slots
+        '''
+        values = vars(ns)
+        cls, fields = self.namespace_types.get(ns.command, (None, frozenset()))
+        if not fields.issuperset(values):
+            if not all(isinstance(k, string_types) and IDENTIFIER.match(k)
+                       for k in values):
+                return ns
+            cls = self.namespace_type(ns.command, values)
+        compact = cls.__new__(cls)
+        for name, value in values.items():
+            setattr(compact, name, value)
+        return compact
+
+    def resolve_config(self, args=None, namespace=None, env=None):
+        '''
+        returns the config file to load, whether it must exist, and args
+        without the config option
+        '''
+        args = sys.argv[1:] if args is None else list(args)
+        ns, args = self.parse_options(self.config_parser, [self.config_action],
+                                      args, namespace)
+        configfile, required = self.config_action.resolve_config(
+            ns, os.environ if env is None else env)
+        return configfile, required, args
+
+    @staticmethod
+    def parse_options(parser, actions, args, namespace=None):
+        '''
+        parser.parse_known_args for a parser holding only actions, taking
+        options from a single scan of args where possible
+        '''
+        scanned = scan_options(args, actions)
+        if scanned is None:
+            return parser.parse_known_args(args, namespace)
+        values, args = scanned
+        ns = argparse.Namespace() if namespace is None else namespace
+        for action in actions:
+            if (action.default is not argparse.SUPPRESS and
+                    not hasattr(ns, action.dest)):
+                setattr(ns, action.dest, action.default)
+            if action.dest in values:
+                action(parser, ns, values[action.dest], None)
+        return ns, args
+
+    def preload_config(self, configfile):
+        '''
+        parse configfile into the config cache, ignoring errors.  safe to
+        call from any thread.
+        '''
+        try:
+            type(self.config.impl)().load(configfile)
+        except Exception:
+            pass
+
+    def load_context(self, configfile, required, env, timings=None,
+                     prefetched=None):
+        '''
+        returns the DispatchContext for a dispatch with configfile and env.
+        with prefetch, the config is still loading: the ConfigFile default
+        is set once it is loaded.
+        '''
+        if self.config_prefetch:
+            config = PrefetchFacade(self.prefetch(configfile, prefetched),
+                                    required)
+            return DispatchContext(config, env, {}, timings)
+        if self.config_layers:
+            config = self.layered_config(configfile, required)
+            configfile = config.impl.source
+        elif self.config_watch:
+            config = self.watched_config(configfile, required)
+        else:
+            config = ConfigFacade()
+            impl = type(self.config.impl)()
+            try:
+                impl.load(configfile)
+            except Exception:
+                if required:
+                    raise
+            else:
+                config.impl = impl
+        defaults = {}
+        if config.valid:
+            defaults[self.config_action.dest] = ConfigFile(
+                configfile, config if self.config_watch else config.impl)
+        return DispatchContext(config, env, defaults, timings)
+
+    def layered_config(self, configfile, required):
+        '''
+        returns a facade of the LayeredConfig of the config layers with
+        configfile on top, refreshed from the layers that changed
+        '''
+        from .layered import layered_config
+        paths = list(self.config_layers)
+        if configfile:
+            if required:
+                # raises if it is missing
+                os.stat(configfile)
+            paths.append(configfile)
+        return ConfigFacade(layered_config(paths, type(self.config.impl)))
+
+    def watched_config(self, configfile, required):
+        '''
+        returns the facade of the watcher of configfile, replacing the running
+        watcher if it watches another file
+        '''
+        with self.config_lock:
+            watcher = self.config_watcher
+            if watcher and watcher.running and watcher.source == configfile:
+                return watcher.facade
+            if watcher:
+                watcher.stop()
+                self.config_watcher = None
+            impl = type(self.config.impl)()
+            try:
+                impl.load(configfile)
+            except Exception:
+                if required:
+                    raise
+                return ConfigFacade()
+            from .watch import ConfigWatcher
+            self.config_watcher = ConfigWatcher(
+                ConfigFacade(impl), self.config_watch,
+                self.config_callbacks).start()
+            return self.config_watcher.facade
+
+    def on_config_change(self, callback):
+        '''
+        call callback(old, new) whenever a watched config file is reloaded
+        '''
+        self.config_callbacks.append(callback)
+        if self.config_watcher:
+            self.config_watcher.subscribe(callback)
+        return callback
+
+    def dispatch_parallel(self, argvs, processes=None, chunksize=1,
+                          ordered=True, context=None):
+        '''
+        dispatch argvs across a pool of processes, yielding a BatchResult for
+        each.  see parallel.dispatch_parallel.
+        '''
+        from .parallel import dispatch_parallel
+        return dispatch_parallel(self, argvs, processes=processes,
+                                 chunksize=chunksize, ordered=ordered,
+                                 context=context)
+
+
+ConfigFile = collections.namedtuple('ConfigFile', 'configfile config')
+
+BatchResult = collections.namedtuple('BatchResult', 'argv result error')
+
+# dests that can be slots; dunder names would be mangled
+IDENTIFIER = re.compile(r'(?!__)[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class SlottedNamespace(object):
+    '''
+    base of the compact namespaces made by namespace_type.  behaves like
+    argparse.Namespace, except that only its fields can be set.
+    '''
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+    @property
+    def __dict__(self):
+        # keeps vars(ns) working
+        return dict((name, getattr(self, name)) for name in self.__slots__
+                    if hasattr(self, name))
+
+    def __eq__(self, other):
+        if not isinstance(other, (SlottedNamespace, argparse.Namespace)):
+            return NotImplemented
+        return vars(self) == vars(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __contains__(self, key):
+        return hasattr(self, key)
+
+    def __repr__(self):
+        return 'Namespace(%s)' % ', '.join(
+            '%s=%r' % item for item in sorted(vars(self).items()))
+
+    def __reduce__(self):
+        return (restore_namespace, (self.__slots__, vars(self)))
+
+
+_namespace_types = {}
+
+
+def namespace_type(fields):
+    '''
+    returns the SlottedNamespace class with fields, creating it once
+    '''
+    try:
+        return _namespace_types[fields]
+    except KeyError:
+        cls = type('Namespace', (SlottedNamespace,), {'__slots__': fields})
+        return _namespace_types.setdefault(fields, cls)
+
+
+def restore_namespace(fields, values):
+    return namespace_type(fields)(**values)
+
+
+class EnvSnapshot(object):
+    '''
+    read-only view of an environment that keeps the first value read of each
+    variable, so every parser in a dispatch sees the same values.  cheaper
+    than copying os.environ up front.
+    '''
+    def __init__(self, environ):
+        self._environ = environ
+        self._values = {}
+        self._items = None
+
+    def get(self, key, default=None):
+        try:
+            value = self._values[key]
+        except KeyError:
+            value = self._values[key] = self._environ.get(key)
+        return default if value is None else value
+
+    def items(self):
+        '''
+        every variable, read in a single pass over the environment the first
+        time, and agreeing with the values already read
+        '''
+        if self._items is None:
+            items = dict(self._environ)
+            for key, value in self._values.items():
+                if value is None:
+                    items.pop(key, None)
                 else:
-                    self.parser.set_defaults(**{
-                        self.config_action.dest: collections.namedtuple('config', 'configfile config')(configfile, self.config.impl)})
-        ns = self.parser.parse_args(args, namespace)
-        return ns.func(ns)
+                    items[key] = value
+            self._items = items
+            self._values = dict(items)
+            self._environ = {}
+        return self._items
+
+    def matching(self, names):
+        '''
+        yields (name, value) for each of names that is set.  when there are
+        more names than variables, the environment is scanned once (for
+        every parser of the dispatch) rather than each name looked up.
+        '''
+        if self._items is None and len(names) > len(self._environ):
+            self.items()
+        if self._items is not None and len(names) > len(self._items):
+            for name, value in self._items.items():
+                if name in names:
+                    yield name, value
+            return
+        for name in names:
+            value = self.get(name)
+            if value is not None:
+                yield name, value
+
+
+# what a dispatch reads besides its args: a ConfigFacade, an EnvSnapshot and
+# namespace defaults (such as the ConfigFile), and the Timings of a timed
+# dispatch
+DispatchContext = collections.namedtuple('DispatchContext',
+                                         'config env defaults timings')
+
+_local = threading.local()
+
+
+def current_context():
+    '''
+    returns the DispatchContext of the dispatch running on this thread
+    '''
+    return getattr(_local, 'context', None)
+
+
+@contextlib.contextmanager
+def dispatch_context(context):
+    '''
+    makes context the current context on this thread.  parsers read it from
+    there, as argparse calls subparsers without any way to pass it on.
+    '''
+    previous = current_context()
+    _local.context = context
+    try:
+        yield context
+    finally:
+        _local.context = previous
+
+
+def read_batch(source):
+    '''
+    yields the args of each command-line in the file source (- for stdin),
+    skipping blank lines and # comments
+    '''
+    f = sys.stdin if source == '-' else open(source, 'r')
+    try:
+        for line in f:
+            argv = shlex.split(line, comments=True)
+            if argv:
+                yield argv
+    finally:
+        if f is not sys.stdin:
+            f.close()
 
 
 class ConfigArgumentParser(argparse.ArgumentParser):
@@ -181,6 +1340,8 @@ class ConfigArgumentParser(argparse.ArgumentParser):
         self._config = None
         self._config_keys = {}
         self._env = {}
+        self._env_names = None
+        self._env_prefix = kwargs.pop('env_prefix', None)
         super(ConfigArgumentParser, self).__init__(*args, **kwargs)
 
     def _set_config(self, config):
@@ -194,74 +1355,285 @@ class ConfigArgumentParser(argparse.ArgumentParser):
             self._config_keys[action.dest] = (action, config_key)
         if env:
             self._env[action.dest] = (action, env)
+        elif env is None and self._env_prefix and self._prefixed(action):
+            env = self._env_prefix + action.dest.upper()
+            self._env.setdefault(action.dest, (action, env))
+        self._env_names = None
+        return action
+
+    @staticmethod
+    def _prefixed(action):
+        '''
+        whether env_prefix maps a variable to action: options taking a
+        value, other than the config option and options with private dests
+        '''
+        return (action.option_strings and action.nargs != 0 and
+                action.dest is not argparse.SUPPRESS and
+                not action.dest.startswith('_') and
+                not isinstance(action, ConfigAction))
+
+    def _env_table(self):
+        # {variable: (dest, action)}, rebuilt after add_argument
+        if self._env_names is None:
+            self._env_names = dict(
+                (env, (dest, action))
+                for dest, (action, env) in self._env.items())
+        return self._env_names
+
+    def parse_known_args(self, args=None, namespace=None, context=None):
+        # the context of the current dispatch, or this parser's own config
+        if context is None:
+            context = current_context()
+        if context is None:
+            config, environ = self._config, EnvSnapshot(os.environ)
+            defaults, timings = {}, None
+        else:
+            config, environ, defaults, timings = context
+        phase = timed(timings)
 
-    def parse_known_args(self, args=None, namespace=None):
         # default Namespace built from parser defaults
         if namespace is None:
             namespace = argparse.Namespace()
+        for dest, value in defaults.items():
+            if not hasattr(namespace, dest):
+                setattr(namespace, dest, value)
 
         # add environment variables to namespace if not already set
-        for dest, (action, env_var) in self._env.items():
-            if not hasattr(namespace, dest):
-                env = os.getenv(env_var, None)
-                if env:
-                    # values from env are always string types
-                    setattr(namespace, dest, self._get_value(action, env))
-
-        # if i have a valid config object, retrieve values and
-        # add them to the namespace if they don't already exist
-        if self._config and self._config.valid and self._config.loaded:
-            for dest, (action, config_key) in self._config_keys.items():
-                if not hasattr(namespace, dest):
-                    value = self._config.get(config_key, argparse.SUPPRESS)
-                    if value is not argparse.SUPPRESS:
-                        # coerce type if its a string
-                        if isinstance(value, string_types):
-                            value = self._get_value(action, value)
-                        setattr(namespace, dest, value)
+        with phase('env'):
+            self._apply_env(namespace, environ)
+
+        # then values from the config, if there is one
+        if config is not None and self._config_keys:
+            with phase('config'):
+                self._apply_config(namespace, config)
 
         # call parse_known_args on parent
         return super(ConfigArgumentParser, self).parse_known_args(args, namespace)
 
+    def _apply_env(self, namespace, environ):
+        '''
+        sets the dests without a value in namespace from environ
+        '''
+        table = self._env_table()
+        for env_var, env in environ.matching(table):
+            dest, action = table[env_var]
+            if env and not hasattr(namespace, dest):
+                # values from env are always string types
+                setattr(namespace, dest, self._get_value(action, env))
+
+    def _apply_config(self, namespace, config):
+        '''
+        sets the dests without a value in namespace from config.  the config
+        is only checked (waiting for it, if it is loading) once a value is
+        needed from it
+        '''
+        usable = None
+        for dest, (action, config_key) in self._config_keys.items():
+            if hasattr(namespace, dest):
+                continue
+            if usable is None:
+                usable = config.valid and config.loaded
+            if not usable:
+                return
+            value = config.get(config_key, argparse.SUPPRESS)
+            if value is not argparse.SUPPRESS:
+                # coerce type if its a string
+                if isinstance(value, string_types):
+                    value = self._get_value(action, value)
+                setattr(namespace, dest, value)
+
+    def _get_value(self, action, arg_string):
+        context = current_context()
+        get_value = super(ConfigArgumentParser, self)._get_value
+        if context is None or context.timings is None:
+            return get_value(action, arg_string)
+        with context.timings.phase('coerce'):
+            return get_value(action, arg_string)
+
+    def _get_values(self, action, arg_strings):
+        # expand an abbreviated command before argparse checks its choices
+        if isinstance(action, SubcommandsAction) and arg_strings:
+            arg_strings = ([action.resolve(arg_strings[0])] +
+                           list(arg_strings[1:]))
+        return super(ConfigArgumentParser, self)._get_values(action,
+                                                             arg_strings)
+
 
 class ConfigFacade(object):
-    def __init__(self):
-        self.impl = None
+    def __init__(self, impl=None):
+        self.impl = impl
 
     @property
     def valid(self):
         return self.impl is not None
 
     def __getattr__(self, key):
+        # impl and special names are not forwarded, so a facade being
+        # unpickled (before its __dict__ is restored) does not recurse
+        if key == 'impl' or key.startswith('__'):
+            raise AttributeError(key)
         if self.valid:
             return getattr(self.impl, key)
         raise Exception('getattr of %s called on an invalid facade' % key)
 
+    def __reduce__(self):
+        return (ConfigFacade, (self.impl,))
+
+
+class PrefetchedConfig(object):
+    '''
+    a config file loading on a background thread
+    '''
+    def __init__(self, config_class, configfile):
+        self.configfile = configfile
+        self._impl = None
+        self._error = None
+        self._thread = threading.Thread(target=self._load,
+                                        args=(config_class,),
+                                        name='subparser-prefetch')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _load(self, config_class):
+        impl = config_class()
+        try:
+            impl.load(self.configfile)
+        except Exception as e:
+            self._error = e
+        else:
+            self._impl = impl
+
+    def result(self, required):
+        '''
+        waits for the load and returns the config, or None if it failed.
+        raises the failure if the file is required.
+        '''
+        self._thread.join()
+        if self._error is not None and required:
+            raise self._error
+        return self._impl
+
+
+class PrefetchFacade(ConfigFacade):
+    '''
+    ConfigFacade of a PrefetchedConfig, waiting for it on first use
+    '''
+    def __init__(self, prefetched, required):
+        self.prefetched = prefetched
+        self.required = required
+
+    @property
+    def impl(self):
+        return self.prefetched.result(self.required)
+
+
+# marks keys missing from a config in its index
+_missing = object()
+
+
+class BaseConfig(object):
+    '''
+    loading, caching and indexing shared by the config file classes.
+
+    values are looked up in the parsed config once per key, then served from
+    an index mapping each key to its value (or to a marker for keys that are
+    missing).  the index is shared by everyone loading the same file through
+    the cache.
+
+    subclasses implement parse, to read a file, normalize, to turn a key
+    into a hashable index key, lookup, to find a normalized key in the
+    parsed config, and reset.
+    '''
+    # parsed files are shared through this cache; None disables it
+    cache = config_cache
+    # a SidecarCache keeps compiled files on disk between runs; None
+    # disables it
+    sidecar = None
 
-class JsonConfig(object):
     def __init__(self):
         self.reset()
 
+    @property
+    def config(self):
+        return self._config
+
+    @config.setter
+    def config(self, config):
+        self._config = config
+        self._index = {}
+
     def load(self, source):
         self.source = source
         self.fetch(source)
         self.loaded = True
 
     def fetch(self, source):
-        with open(source, 'r') as f:
-            self.config = json.load(f)
+        compile = self.compile
+        if self.sidecar is not None:
+            compile = functools.partial(self.sidecar.get, type(self),
+                                        compile=compile)
+        if self.cache is None:
+            self.config, self._index = compile(source)
+        else:
+            self.config, self._index = self.cache.get(type(self), source,
+                                                      compile)
+
+    def compile(self, source):
+        with paused_gc():
+            return self.parse(source), {}
 
     def get(self, key, default):
-        if not isinstance(key, (tuple, list)):
-            key = (key,)
+        key = self.normalize(key)
+        try:
+            value = self._index[key]
+        except KeyError:
+            value = self._index[key] = self.lookup(key)
+        return default if value is _missing else value
 
-        d = self.config
-        for k in key[:-1]:
-            if k in d:
-                d = d[k]
-            else:
-                return default
-        return d.get(key[-1], default)
+
+class JsonConfig(BaseConfig):
+    '''
+    config from a json file.  keys are a key or a tuple of keys into nested
+    objects.  the parsed document is kept in config, and should be treated
+    as read-only.
+    '''
+    def parse(self, source):
+        import json
+        with open(source, 'r') as f:
+            return json.load(f)
+
+    def normalize(self, key):
+        if isinstance(key, list):
+            return tuple(key)
+        elif not isinstance(key, tuple):
+            return (key,)
+        return key
+
+    def lookup(self, key):
+        d = self._config
+        for k in key:
+            if not isinstance(d, dict) or k not in d:
+                return _missing
+            d = d[k]
+        return d
+
+    @classmethod
+    def merge(cls, layers):
+        '''
+        deep merges the documents of layers, [(source, document)] with later
+        layers overriding earlier ones.  returns the merged document,
+        {key: value} for every key lookup finds in it, and {key: source} of
+        the layer each value came from.
+        '''
+        merged, sources = {}, {}
+        for source, document in layers:
+            if not isinstance(document, dict):
+                raise TypeError('%s: only json objects can be layered' %
+                                source)
+            merge_object(merged, document, source, (), sources)
+        view = {(): merged}
+        flatten_object(merged, (), view)
+        return merged, view, sources
 
     def reset(self):
         self.config = None
@@ -269,34 +1641,83 @@ class JsonConfig(object):
         self.source = None
 
 
-class IniConfig(object):
-    def __init__(self):
-        self.reset()
+def merge_object(merged, document, source, path, sources):
+    # merged only holds dicts made here, never those of the documents
+    for key, value in document.items():
+        key_path = path + (key,)
+        if isinstance(merged.get(key), dict) and not isinstance(value, dict):
+            depth = len(key_path)
+            for nested in [k for k in sources if k[:depth] == key_path]:
+                del sources[nested]
+        sources[key_path] = source
+        if isinstance(value, dict):
+            if not isinstance(merged.get(key), dict):
+                merged[key] = {}
+            merge_object(merged[key], value, source, key_path, sources)
+        else:
+            merged[key] = value
 
-    def load(self, source):
-        self.source = source
-        self.fetch(source)
-        self.loaded = True
 
-    def fetch(self, source):
+def flatten_object(document, path, view):
+    for key, value in document.items():
+        key_path = path + (key,)
+        view[key_path] = value
+        if isinstance(value, dict):
+            flatten_object(value, key_path, view)
+
+
+class IniConfig(BaseConfig):
+    '''
+    config from an ini file.  keys are (section, option) tuples.  the parsed
+    RawConfigParser is kept in config, and should be treated as read-only.
+    '''
+    def parse(self, source):
+        from six.moves import configparser
+        config = configparser.RawConfigParser()
         with open(source, 'r') as f:
-            self.config.readfp(f)
+            getattr(config, 'read_file', getattr(config, 'readfp', None))(f)
+        return config
 
-    def get(self, key, default):
-        try:
-            section, option = key
-            return self.config.get(section, option)
-        except (configparser.NoSectionError, configparser.NoOptionError):
-            return default
+    def normalize(self, key):
+        section, option = key
+        return section, self._config.optionxform(option)
+
+    def lookup(self, key):
+        if self._config.has_option(*key):
+            return self._config.get(*key)
+        return _missing
+
+    @classmethod
+    def merge(cls, layers):
+        '''
+        JsonConfig.merge for ini files: options of later layers override the
+        same options of earlier ones
+        '''
+        from six.moves import configparser
+        view, sources = {}, {}
+        for source, config in layers:
+            for section in config.sections():
+                for option in config.options(section):
+                    view[section, option] = config.get(section, option)
+                    sources[section, option] = source
+        merged = configparser.RawConfigParser()
+        for (section, option), value in sorted(view.items()):
+            if not merged.has_section(section):
+                merged.add_section(section)
+            merged.set(section, option, value)
+        return merged, view, sources
 
     def reset(self):
+        from six.moves import configparser
         self.config = configparser.RawConfigParser()
         self.loaded = False
         self.source = None
 
 
-def parser_factory(parser_class, config):
+def parser_factory(parser_class, config, **defaults):
     def _factory(*args, **kwargs):
+        for key, value in defaults.items():
+            kwargs.setdefault(key, value)
         parser = parser_class(*args, **kwargs)
         parser._set_config(config)
         return parser
@@ -304,9 +1725,20 @@ def parser_factory(parser_class, config):
 
 
 def subparser(*args, **kwargs):
+    lazy = kwargs.pop('lazy', False)
+    slots = kwargs.pop('slots', False)
+    abbrev = kwargs.pop('abbrev_commands', False)
     _config = ConfigFacade()
     _parser = parser_factory(ConfigArgumentParser, _config)(*args, **kwargs)
-    return Subcommand(_parser, _config)
+    return Subcommand(_parser, _config, lazy=lazy, slots=slots, abbrev=abbrev)
 
 
-subcommand = subparser()
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        # the module's subcommand is only made once it is used
+        if name == 'subcommand':
+            return globals().setdefault('subcommand', subparser())
+        raise AttributeError('module %r has no attribute %r' %
+                             (__name__, name))
+else:
+    subcommand = subparser()
@@ -0,0 +1,168 @@
+from __future__ import absolute_import, division
+
+import collections
+import sys
+import threading
+import time
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Timings(object):
+    '''
+    the time a dispatch spent in each of its phases.
+
+    phases nest (type coercion runs while argparse parses, for instance), and
+    each records the time spent in it outside of the phases nested in it, so
+    the phases add up to at most total.  phases maps each phase to
+    [seconds, times entered].
+    '''
+    def __init__(self, argv=None):
+        self.argv = argv
+        self.command = None
+        self.error = None
+        self.phases = {}
+        self.total = None
+        self._stack = []
+        self._start = clock()
+
+    def enter(self, name):
+        self._stack.append([name, clock(), 0.0])
+
+    def exit(self):
+        name, start, nested = self._stack.pop()
+        elapsed = clock() - start
+        entry = self.phases.get(name)
+        if entry is None:
+            entry = self.phases[name] = [0.0, 0]
+        entry[0] += elapsed - nested
+        entry[1] += 1
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def phase(self, name):
+        '''
+        context manager timing the phase name
+        '''
+        return Phase(self, name)
+
+    def finish(self):
+        self.total = clock() - self._start
+
+    def as_dict(self):
+        return {
+            'argv': self.argv,
+            'command': self.command,
+            'error': None if self.error is None else repr(self.error),
+            'total': self.total,
+            'phases': dict((name, {'seconds': seconds, 'count': count})
+                           for name, (seconds, count) in self.phases.items()),
+        }
+
+
+class Phase(object):
+    __slots__ = ('timings', 'name')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.timings.enter(self.name)
+
+    def __exit__(self, *exc_info):
+        self.timings.exit()
+
+
+class NoPhase(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_no_phase = NoPhase()
+
+
+def no_phase(name):
+    '''
+    Timings.phase for dispatches that are not timed
+    '''
+    return _no_phase
+
+
+def timed(timings):
+    '''
+    returns timings.phase, or a no-op if timings is None
+    '''
+    return no_phase if timings is None else timings.phase
+
+
+class JsonLinesExporter(object):
+    '''
+    dispatch hook writing the timings of each dispatch to a file, as a line
+    of json
+    '''
+    def __init__(self, file):
+        self.file = file
+        self._lock = threading.Lock()
+
+    def __call__(self, timings):
+        import json
+        line = json.dumps(timings.as_dict(), default=repr) + '\n'
+        with self._lock:
+            self.file.write(line)
+            self.file.flush()
+
+
+class PercentileAggregator(object):
+    '''
+    dispatch hook collecting the timings of many dispatches (a batch run, for
+    instance), to report percentiles of each phase
+    '''
+    def __init__(self):
+        self.samples = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    def __call__(self, timings):
+        with self._lock:
+            for name, (seconds, count) in timings.phases.items():
+                self.samples[name].append(seconds)
+            self.samples['total'].append(timings.total)
+
+    @staticmethod
+    def percentile(values, p):
+        # nearest rank
+        rank = int(len(values) * p / 100.0 + 0.5) - 1
+        index = max(0, min(len(values) - 1, rank))
+        return values[index]
+
+    def summary(self, percentiles=(50, 90, 99)):
+        '''
+        returns {phase: {'count': dispatches, 'p50': seconds, ...}}
+        '''
+        with self._lock:
+            samples = dict((name, sorted(values))
+                           for name, values in self.samples.items())
+        summary = {}
+        for name, values in samples.items():
+            summary[name] = dict(('p%g' % p, self.percentile(values, p))
+                                 for p in percentiles)
+            summary[name]['count'] = len(values)
+        return summary
+
+    def report(self, file=None, percentiles=(50, 90, 99)):
+        '''
+        writes a table of the percentiles of each phase, in milliseconds
+        '''
+        file = sys.stderr if file is None else file
+        summary = self.summary(percentiles)
+        columns = ['p%g' % p for p in percentiles]
+        file.write('%-12s %8s' % ('phase', 'count') +
+                   ''.join(' %9s' % c for c in columns) + '\n')
+        for name in sorted(summary, key=lambda name: (name == 'total', name)):
+            row = summary[name]
+            file.write('%-12s %8d' % (name, row['count']) +
+                       ''.join(' %9.3f' % (row[c] * 1e3) for c in columns) +
+                       '\n')
@@ -0,0 +1,116 @@
+from __future__ import absolute_import
+
+import os
+import threading
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+
+class ConfigWatcher(object):
+    '''
+    reloads a ConfigFacade's config file in a background thread when the file
+    changes.
+
+    each reload parses into a new config object which is then swapped into
+    the facade in one assignment, so readers never see a half-loaded config.
+    configs are never modified once they are swapped in; hold on to
+    facade.impl to keep reading from one consistent snapshot.
+
+    changes are picked up through inotify when inotify_simple is installed,
+    otherwise by polling os.stat every interval seconds.
+    '''
+    def __init__(self, facade, interval=1.0, callbacks=()):
+        self.facade = facade
+        self.source = facade.impl.source
+        self.interval = interval
+        self.callbacks = list(callbacks)
+        self.error = None
+        self._stat = self._signature()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _signature(self):
+        try:
+            st = os.stat(self.source)
+        except OSError:
+            return None
+        return (getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size, st.st_ino)
+
+    def subscribe(self, callback):
+        '''
+        call callback(old, new) with the previous and new config after every
+        reload
+        '''
+        self.callbacks.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self.callbacks.remove(callback)
+
+    def check(self):
+        '''
+        reload now if the file changed.  returns True if it was reloaded.
+        '''
+        stat = self._signature()
+        if stat is None or stat == self._stat:
+            return False
+        old = self.facade.impl
+        new = type(old)()
+        try:
+            new.load(self.source)
+        except Exception as e:
+            # keep serving the last good config, and retry on the next check
+            self.error = e
+            return False
+        self._stat = stat
+        self.error = None
+        self.facade.impl = new
+        for callback in list(self.callbacks):
+            callback(old, new)
+        return True
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run,
+                                            name='config-watcher')
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def _run(self):
+        inotify = self._inotify()
+        try:
+            while not self._stopped.is_set():
+                if inotify is None:
+                    self._stopped.wait(self.interval)
+                else:
+                    inotify.read(timeout=int(self.interval * 1000))
+                if not self._stopped.is_set():
+                    self.check()
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _inotify(self):
+        if inotify_simple is None:
+            return None
+        inotify = inotify_simple.INotify()
+        flags = inotify_simple.flags
+        # watch the directory so that files replaced by a rename are seen
+        inotify.add_watch(os.path.dirname(os.path.abspath(self.source)),
+                          flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE)
+        return inotify
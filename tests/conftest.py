@@ -0,0 +1,30 @@
+import json
+import os
+import sys
+
+import pytest
+
+# coroutine syntax
+collect_ignore = ['test_aio.py'] if sys.version_info < (3, 5) else []
+
+
+def write_json(path, document, bump=0):
+    with open(path, 'w') as f:
+        json.dump(document, f)
+    if bump:
+        # make sure the change is visible on filesystems with coarse mtimes
+        st = os.stat(path)
+        os.utime(path, (st.st_atime, st.st_mtime + bump))
+
+
+@pytest.fixture
+def jsonfile(tmpdir):
+    p = str(tmpdir.join('config.json'))
+    write_json(p, {'name': 'Joe',
+                   'animal': 'pig',
+                   'nested': {
+                       'dict': {
+                           'test': 'value',
+                       }
+                   }})
+    return p
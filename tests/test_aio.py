@@ -0,0 +1,70 @@
+from __future__ import print_function
+
+import asyncio
+import inspect
+import threading
+
+from subparser import subparser, JsonConfig, ConfigCache
+
+
+def async_subcommand():
+    subcommand = subparser()
+
+    @subcommand
+    async def hello(name, delay):
+        await asyncio.sleep(delay)
+        return 'Hello %s!' % name
+    hello.add_argument('--name', config='name', default='John')
+    hello.add_argument('--delay', type=float, default=0)
+
+    @subcommand
+    def shout(name):
+        return name.upper()
+    shout.add_argument('--name', default='John')
+
+    subcommand.add_config('-c', dest='config')
+    return subcommand, hello
+
+
+def test_async_dispatch():
+    subcommand, hello = async_subcommand()
+    # the wrapper is still callable as the original coroutine function
+    assert asyncio.run(hello('Joe', 0)) == 'Hello Joe!'
+    assert inspect.iscoroutinefunction(hello.__wrapped__)
+
+    # plain dispatch runs coroutines to completion
+    assert subcommand.dispatch(['hello', '--name', 'Joe']) == 'Hello Joe!'
+    assert subcommand.dispatch(['shout']) == 'JOHN'
+
+
+def test_dispatch_async_concurrently(jsonfile, monkeypatch):
+    cache = ConfigCache()
+    monkeypatch.setattr(JsonConfig, 'cache', cache)
+    subcommand, hello = async_subcommand()
+    parse_threads = []
+    original = JsonConfig.parse
+
+    def parse(self, source):
+        parse_threads.append(threading.current_thread())
+        return original(self, source)
+    monkeypatch.setattr(JsonConfig, 'parse', parse)
+
+    async def main():
+        loop = asyncio.get_event_loop()
+
+        started = loop.time()
+        results = await asyncio.gather(*[
+            subcommand.dispatch_async(['hello', '--delay', '0.2',
+                                       '-c', jsonfile])
+            for i in range(10)])
+        return results, loop.time() - started
+
+    results, elapsed = asyncio.run(main())
+    assert results == ['Hello Joe!'] * 10
+    # the commands ran concurrently
+    assert elapsed < 1.0
+    # the config file was parsed off the event loop's thread, and the loads
+    # on the loop were served from the cache
+    assert parse_threads
+    assert threading.current_thread() not in parse_threads
+    assert cache.hits >= 10
@@ -0,0 +1,138 @@
+from __future__ import print_function
+
+import json
+import os
+
+from conftest import write_json
+from subparser import ConfigCache, SidecarCache, JsonConfig, IniConfig
+
+
+def test_cache_hits_until_changed(tmpdir):
+    cache = ConfigCache()
+    path = str(tmpdir.join('config.json'))
+    write_json(path, {'name': 'Joe'})
+    parses = []
+
+    def parse(source):
+        parses.append(source)
+        with open(source) as f:
+            return json.load(f)
+
+    assert cache.get('json', path, parse) == {'name': 'Joe'}
+    assert cache.get('json', path, parse) == {'name': 'Joe'}
+    assert (cache.hits, cache.misses, len(parses)) == (1, 1, 1)
+
+    write_json(path, {'name': 'Robert'})
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + 10))
+    assert cache.get('json', path, parse) == {'name': 'Robert'}
+    assert (cache.hits, cache.misses, len(parses)) == (1, 2, 2)
+    # the stale version was replaced rather than kept around
+    assert len(cache) == 1
+
+    cache.invalidate(path)
+    assert len(cache) == 0
+    cache.get('json', path, parse)
+    assert cache.misses == 3
+
+
+def test_cache_is_bounded(tmpdir):
+    cache = ConfigCache(maxsize=2)
+    paths = []
+    for i in range(3):
+        paths.append(str(tmpdir.join('config%d.json' % i)))
+        write_json(paths[-1], {'i': i})
+        cache.get('json', paths[-1], lambda source: i)
+    assert len(cache) == 2
+    cache.get('json', paths[0], lambda source: 'reparsed')
+    assert cache.misses == 4
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+def test_configs_share_cache(tmpdir, monkeypatch):
+    cache = ConfigCache()
+    monkeypatch.setattr(JsonConfig, 'cache', cache)
+    monkeypatch.setattr(IniConfig, 'cache', cache)
+    path = str(tmpdir.join('config.json'))
+    write_json(path, {'name': 'Joe'})
+    inipath = str(tmpdir.join('config.ini'))
+    with open(inipath, 'w') as f:
+        f.write('[hello]\nname = Joe\n')
+
+    for i in range(3):
+        config = JsonConfig()
+        config.load(path)
+        assert config.get('name', None) == 'Joe'
+        config = IniConfig()
+        config.load(inipath)
+        assert config.get(('hello', 'name'), None) == 'Joe'
+    assert (cache.hits, cache.misses) == (4, 2)
+
+    monkeypatch.setattr(JsonConfig, 'cache', None)
+    JsonConfig().load(path)
+    assert (cache.hits, cache.misses) == (4, 2)
+
+
+def test_sidecar(tmpdir, monkeypatch):
+    monkeypatch.setattr(JsonConfig, 'cache', None)
+    sidecar = SidecarCache(cache_dir=str(tmpdir.join('cache')))
+    monkeypatch.setattr(JsonConfig, 'sidecar', sidecar)
+    path = str(tmpdir.join('config.json'))
+    write_json(path, {'nested': {'name': 'Joe'}})
+    parses = []
+    original = JsonConfig.parse
+
+    def parse(self, source):
+        parses.append(source)
+        return original(self, source)
+    monkeypatch.setattr(JsonConfig, 'parse', parse)
+
+    def load():
+        config = JsonConfig()
+        config.load(path)
+        return config.get(('nested', 'name'), None)
+
+    assert load() == 'Joe'
+    assert os.path.exists(sidecar.path(path))
+    assert load() == 'Joe'
+    assert (sidecar.hits, sidecar.misses, len(parses)) == (1, 1, 1)
+
+    # touched but unchanged files are validated by their hash
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + 10))
+    assert load() == 'Joe'
+    assert (sidecar.hits, sidecar.misses, len(parses)) == (2, 1, 1)
+    digest = SidecarCache.digest
+    monkeypatch.setattr(SidecarCache, 'digest', staticmethod(
+        lambda source: parses.append('hashed') or digest(source)))
+    assert load() == 'Joe'
+    assert 'hashed' not in parses
+    monkeypatch.setattr(SidecarCache, 'digest', staticmethod(digest))
+
+    write_json(path, {'nested': {'name': 'Robert'}})
+    os.utime(path, (st.st_atime, st.st_mtime + 20))
+    assert load() == 'Robert'
+    assert (sidecar.hits, sidecar.misses, len(parses)) == (3, 2, 2)
+
+    # corrupt sidecars are rebuilt
+    with open(sidecar.path(path), 'wb') as f:
+        f.write(b'garbage')
+    assert load() == 'Robert'
+    assert sidecar.misses == 3
+    assert load() == 'Robert'
+    assert sidecar.misses == 3
+
+
+def test_sidecar_next_to_source(tmpdir, monkeypatch):
+    monkeypatch.setattr(IniConfig, 'cache', None)
+    monkeypatch.setattr(IniConfig, 'sidecar', SidecarCache())
+    path = str(tmpdir.join('config.ini'))
+    with open(path, 'w') as f:
+        f.write('[hello]\nname = Joe\n')
+    for i in range(2):
+        config = IniConfig()
+        config.load(path)
+        assert config.get(('hello', 'name'), None) == 'Joe'
+    assert tmpdir.join('.config.ini.subparser-cache').check()
+    assert IniConfig.sidecar.hits == 1
@@ -0,0 +1,251 @@
+from __future__ import print_function
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from subparser import subparser
+from subparser.codegen import Unsupported, generate, main
+from subparser.subparser import Binder, ConfigFile, ImportDispatch
+
+CLI = '''
+from subparser import subparser, IniConfig
+
+subcommand = subparser(prog='cli', lazy=%(lazy)r)
+subcommand.add_argument('-v', '--verbose', action='count', default=0)
+subcommand.add_argument('-q', action='store_true')
+subcommand.add_config('-c', '--config', env='CLI_CONFIG')
+
+
+def port(value):
+    return int(value, 0)
+
+
+@subcommand
+def hello(name, times, ns):
+    return '%%s x%%d' %% (name, times)
+hello.add_argument('--name', default='John', env='CLI_NAME', config='name')
+hello.add_argument('-t', '--times', type=int, default='1', config='times')
+hello.add_argument('--port', type=port, default='0x10')
+
+
+@subcommand('add')
+def add(numbers, **kwargs):
+    return sum(numbers)
+add.add_argument('numbers', nargs='+', type=float)
+add.add_argument('-x', action='store_const', const=42)
+add.add_argument('-y', action='store_false')
+add.add_argument('--tag', action='append', choices=['a', 'b'])
+add.add_argument('--flag', action='append_const', const='f', dest='tag')
+add.add_argument('-n', nargs=2, default=[0, 0])
+add.add_argument('--opt', nargs='?', const='c', default='d')
+
+
+@subcommand('copy')
+def copy(src, dst, extra):
+    return (src, dst, extra)
+copy.add_argument('src')
+copy.add_argument('dst', nargs='?', default='.')
+copy.add_argument('extra', nargs='*')
+copy.add_argument('--mode', choices=['fast', 'safe'], default='safe',
+                  env='CLI_MODE')
+copy.set_defaults(retries=3)
+
+later = subcommand.lazy('later', 'cli_impl:main', aliases=['l'])
+later.add_argument('--name', config='name')
+'''
+
+IMPL = '''
+def main(name, ns):
+    return 'later %s' % name
+'''
+
+ARGVS = [
+    ['hello'],
+    ['-vv', 'hello', '--name', 'Joe', '-t', '3'],
+    ['-v', '-q', 'hello', '--name=Joe', '-t3', '--port', '8080'],
+    ['hello', '-t', '-1'],
+    ['add', '1', '2.5', '-x', '-y', '--tag', 'a', '--flag', '--tag=b'],
+    ['add', '-n', 'a', 'b', '3', '--opt'],
+    ['add', '3', '4', '--opt', 'x'],
+    ['add', '1', '-xy'],
+    ['copy', 'a'],
+    ['copy', 'a', 'b', 'c', 'd', '--mode', 'fast'],
+    ['copy', '--mode=fast', 'a', 'b'],
+    ['copy', 'has space', '-5'],
+    ['later', '--name', 'Joe'],
+    ['l', '--name', 'Joe'],
+    ['-c', 'CONFIG', 'later'],
+    ['hello', '--config=CONFIG'],
+    ['hello', '-cCONFIG', '--name', 'Joe'],
+]
+
+FALLBACKS = [
+    ['hello', '--nam', 'Joe'],
+    ['hello', '--', '--name'],
+    ['-h'],
+    ['hello', '--help'],
+    ['hello', '-t', 'three'],
+    ['hello', 'extra'],
+    ['add'],
+    ['add', '1', '--tag', 'c'],
+    ['add', '3', '--opt', 'x', '4'],
+    ['copy'],
+    ['missing'],
+    [],
+    ['--verb', 'hello'],
+]
+
+
+@pytest.fixture(params=[False, True], ids=['eager', 'lazy'])
+def cli(tmpdir, monkeypatch, request):
+    tmpdir.join('cli.py').write(CLI % {'lazy': request.param})
+    tmpdir.join('cli_impl.py').write(IMPL)
+    monkeypatch.syspath_prepend(str(tmpdir))
+    import cli
+    tmpdir.join('cli_fast.py').write(generate('cli:subcommand'))
+    import cli_fast
+    configfile = str(tmpdir.join('config.json'))
+    with open(configfile, 'w') as f:
+        json.dump({'name': 'Config', 'times': '7'}, f)
+    yield cli, cli_fast, configfile
+    for module in ('cli', 'cli_impl', 'cli_fast'):
+        sys.modules.pop(module, None)
+
+
+def normalize(ns):
+    values = dict(vars(ns))
+    func = values.pop('func')
+    if isinstance(func, Binder):
+        values['func'] = '%s:%s' % (func.func.__module__, func.func.__name__)
+    elif isinstance(func, ImportDispatch):
+        values['func'] = func.target
+    else:
+        values['func'] = func.path
+    config = values.get('config')
+    if isinstance(config, ConfigFile):
+        values['config'] = (config.configfile, type(config.config),
+                            config.config.source)
+    return values
+
+
+def resolve_both(cli, cli_fast, argv, env):
+    results = []
+    for subcommand in (cli.subcommand, cli_fast):
+        try:
+            results.append(normalize(subcommand.resolve(argv, env=env)))
+        except (Exception, SystemExit) as e:
+            results.append(type(e))
+    return results
+
+
+@pytest.mark.parametrize('env', [{}, {'CLI_NAME': 'Env', 'CLI_MODE': 'fast',
+                                      'CLI_CONFIG': 'CONFIG'}],
+                         ids=['noenv', 'env'])
+def test_generated_parser_matches(cli, env, capsys):
+    cli, cli_fast, configfile = cli
+    env = dict((k, v.replace('CONFIG', configfile)) for k, v in env.items())
+    for argv in ARGVS:
+        argv = [arg.replace('CONFIG', configfile) for arg in argv]
+        expected, actual = resolve_both(cli, cli_fast, argv, env)
+        assert actual == expected, argv
+        assert cli_fast.SPEC.fallbacks == 0, argv
+
+
+def test_generated_parser_falls_back(cli, capsys):
+    cli, cli_fast, configfile = cli
+    for i, argv in enumerate(FALLBACKS):
+        expected, actual = resolve_both(cli, cli_fast, argv, {})
+        assert actual == expected, argv
+        assert cli_fast.SPEC.fallbacks == i + 1, argv
+
+    # a missing config file given on the command-line
+    expected, actual = resolve_both(cli, cli_fast,
+                                    ['-c', 'missing.json', 'hello'], {})
+    assert actual == expected
+    assert cli_fast.SPEC.fallbacks == len(FALLBACKS) + 1
+
+
+def test_generated_dispatch(cli, capsys):
+    cli, cli_fast, configfile = cli
+    assert cli_fast.dispatch(['hello', '-t', '2'], env={}) == 'John x2'
+    assert cli_fast.dispatch(['add', '1', '2'], env={}) == 3
+    assert cli_fast.dispatch(['-c', configfile, 'later'], env={}) == \
+        'later Config'
+    assert cli_fast.SPEC.fallbacks == 0
+    with pytest.raises(SystemExit):
+        cli_fast.dispatch(['add'], env={})
+    assert cli_fast.SPEC.fallbacks == 1
+
+
+def test_generated_module_skips_argparse(cli, tmpdir):
+    script = ('import sys, cli_fast\n'
+              'assert cli_fast.resolve(["copy", "a"]).dst == "."\n'
+              'print(sorted(m for m in ("argparse", "inspect", "subparser", '
+              '"cli") if m in sys.modules))\n')
+    env = dict(os.environ,
+               PYTHONPATH=os.pathsep.join([str(tmpdir)] + sys.path))
+    output = subprocess.check_output([sys.executable, '-c', script], env=env)
+    assert output.decode().strip() == '[]'
+
+
+def test_generate_unsupported():
+    subcommand = subparser()
+
+    @subcommand
+    def run():
+        pass
+    group = run.parser.add_mutually_exclusive_group()
+    group.add_argument('--a')
+    with pytest.raises(Unsupported):
+        generate('tests:subcommand', subcommand)
+
+    subcommand = subparser()
+    subcommand.add_argument('--extend', action='extend', nargs='+')
+    with pytest.raises(Unsupported):
+        generate('tests:subcommand', subcommand)
+
+
+def test_codegen_main(cli, tmpdir):
+    output = str(tmpdir.join('out.py'))
+    main(['cli:subcommand', '-o', output])
+    with open(output) as f:
+        assert "SPEC = Spec(MAIN, 'cli:subcommand'" in f.read()
+
+
+PREFIXED = '''
+from subparser import subparser
+
+subcommand = subparser(prog='prefixed', env_prefix='PRE_')
+subcommand.add_argument('--level', type=int, default=0)
+
+
+@subcommand
+def run(ns):
+    return ns
+run.add_argument('--foo-bar')
+run.add_argument('--animal', env='ANIMAL')
+run.add_argument('--secret', env=False)
+'''
+
+
+def test_generated_env_prefix(tmpdir, monkeypatch):
+    tmpdir.join('prefixed.py').write(PREFIXED)
+    monkeypatch.syspath_prepend(str(tmpdir))
+    try:
+        tmpdir.join('prefixed_fast.py').write(generate('prefixed:subcommand'))
+        import prefixed
+        import prefixed_fast
+        env = {'PRE_LEVEL': '2', 'PRE_FOO_BAR': 'x', 'PRE_ANIMAL': 'cat',
+               'ANIMAL': 'pig', 'PRE_SECRET': 's'}
+        expected, actual = resolve_both(prefixed, prefixed_fast, ['run'], env)
+        assert actual == expected
+        assert (expected['level'], expected['foo_bar'], expected['animal'],
+                expected['secret']) == (2, 'x', 'pig', None)
+        assert prefixed_fast.SPEC.fallbacks == 0
+    finally:
+        for module in ('prefixed', 'prefixed_fast'):
+            sys.modules.pop(module, None)
@@ -0,0 +1,116 @@
+from __future__ import print_function
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from subparser import complete
+
+CLI = '''
+import argparse
+import os
+from subparser import subparser
+
+with open(os.path.join(os.path.dirname(__file__), 'imports.log'), 'a') as f:
+    f.write('imported\\n')
+
+subcommand = subparser(prog='cli', lazy=%(lazy)r)
+subcommand.add_argument('-v', '--verbose', action='store_true')
+subcommand.add_argument('--color', choices=['auto', 'never'])
+
+
+@subcommand
+def copy(src, dst, mode):
+    pass
+copy.add_argument('src')
+copy.add_argument('dst', choices=['here', 'there'])
+copy.add_argument('--mode', choices=['fast', 'safe'])
+copy.add_argument('-n', nargs=2)
+copy.add_argument('--secret', help=argparse.SUPPRESS)
+
+remote = subcommand.lazy('remote', 'cli_args:main', declare='cli_args:declare')
+'''
+
+ARGS = '''
+def declare(parser):
+    parser.add_argument('action', choices=['add', 'remove'])
+
+
+def main(action):
+    pass
+'''
+
+
+@pytest.fixture(params=[False, True], ids=['eager', 'lazy'])
+def cli(tmpdir, monkeypatch, request):
+    tmpdir.join('cli.py').write(CLI % {'lazy': request.param})
+    tmpdir.join('cli_args.py').write(ARGS)
+    monkeypatch.syspath_prepend(str(tmpdir))
+    import cli
+    cache = str(tmpdir.join('cache', 'cli.json'))
+    cli.subcommand.write_completion(cache, 'cli:subcommand')
+    yield cli, cache
+    for module in ('cli', 'cli_args'):
+        sys.modules.pop(module, None)
+
+
+@pytest.mark.parametrize('words, expected', [
+    (['cli', ''], ['copy', 'remote']),
+    (['cli', 'co'], ['copy']),
+    (['cli', '--'], ['--color', '--help', '--verbose']),
+    (['cli', '--color', ''], ['auto', 'never']),
+    (['cli', '--color', '=', 'a'], ['auto']),
+    (['cli', '--color', 'auto', 'r'], ['remote']),
+    (['cli', '-v', 'copy', '--m'], ['--mode']),
+    (['cli', 'copy', '--mode', 'f'], ['fast']),
+    (['cli', 'copy', 'a', ''], ['here', 'there']),
+    (['cli', 'copy', '-n', 'x', 'y', 'a', 't'], ['there']),
+    (['cli', 'copy', '--mode=safe', 'a', ''], ['here', 'there']),
+    (['cli', 'copy', '--s'], []),
+    (['cli', 'copy', ''], []),
+    (['cli', 'remote', 'r'], ['remove']),
+])
+def test_complete(cli, words, expected):
+    cli, cache = cli
+    data, fresh = complete.load(cache)
+    assert fresh
+    assert complete.complete(data, words, len(words) - 1) == expected
+
+
+def test_completion_cache_invalidation(cli, tmpdir):
+    cli, cache = cli
+    with open(cache) as f:
+        modules = json.load(f)['modules']
+    assert sorted(os.path.basename(path) for path in modules) == \
+        ['cli.py', 'cli_args.py']
+    st = os.stat(str(tmpdir.join('cli_args.py')))
+    os.utime(str(tmpdir.join('cli_args.py')), (st.st_atime, st.st_mtime + 10))
+    assert complete.load(cache)[1] is False
+
+
+def test_complete_script(cli, tmpdir):
+    cli, cache = cli
+    script = os.path.splitext(complete.__file__)[0] + '.py'
+    env = dict(os.environ,
+               PYTHONPATH=os.pathsep.join([str(tmpdir)] + sys.path))
+    log = tmpdir.join('imports.log')
+
+    def run(*words):
+        output = subprocess.check_output(
+            [sys.executable, script, cache, 'cli:subcommand',
+             str(len(words) - 1)] + list(words),
+            env=env, cwd=str(tmpdir))
+        return output.decode().split()
+
+    imports = len(log.readlines())
+    assert run('cli', 'copy', '--mode', '') == ['fast', 'safe']
+    assert len(log.readlines()) == imports
+
+    # a missing cache is rebuilt, importing the application once
+    os.unlink(cache)
+    assert run('cli', 're') == ['remote']
+    assert run('cli', 'co') == ['copy']
+    assert len(log.readlines()) == imports + 1
@@ -2,11 +2,19 @@ from __future__ import print_function
 
 import argparse
 import decorator
+import io
 import json
 import os
 import pytest
+import sys
 
-from subparser.subparser import ConfigArgumentParser, ConfigFacade, ns_dispatch
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from subparser.subparser import (Binder, ConfigArgumentParser, ConfigFacade,
+                                 ns_dispatch)
 from subparser import subparser, JsonConfig, IniConfig
 
 
@@ -21,21 +29,6 @@ def inifile(tmpdir):
     return str(p)
 
 
-@pytest.fixture
-def jsonfile(tmpdir):
-    p = tmpdir.join('config.json')
-    with open(str(p), 'w') as f:
-        json.dump({'name': 'Joe',
-                   'animal': 'pig',
-                   'nested': {
-                       'dict': {
-                           'test': 'value',
-                        }
-                    }
-                   }, f)
-    return str(p)
-
-
 @pytest.fixture
 def mockconfig():
     config = JsonConfig()
@@ -459,7 +452,9 @@ def test_argspec():
     def bar(a, b):
         pass
     import inspect
-    spec = inspect.getargspec(bar)
+    getargspec = getattr(inspect, 'getfullargspec',
+                         getattr(inspect, 'getargspec', None))
+    spec = getargspec(bar)
     assert spec.args == ['a', 'b']
 
 def test_nested_json(capsys, jsonfile):
@@ -474,3 +469,583 @@ def test_nested_json(capsys, jsonfile):
     subcommand.dispatch(['hello', '-c', jsonfile])
     out, err = capsys.readouterr()
     assert out == 'Hello value!\n'
+
+
+def test_lazy_subparser(capsys):
+    subcommand = subparser(lazy=True)
+
+    @subcommand
+    def hello(name):
+        print('Hello %s!' % name)
+    hello.add_argument('--name', default='John')
+
+    @subcommand('speak')
+    def blah(animal):
+        return animal
+    blah.add_argument('--animal', default='dog')
+
+    parsers = subcommand.subparser._name_parser_map
+    ns = subcommand.parse_args(['hello', '--name', 'Joe'])
+    assert ns.name == 'Joe'
+    assert ns.command == 'hello'
+    # only the selected subcommand was built
+    assert dict.__getitem__(parsers, 'hello') is hello.parser.parser
+    assert hello.parser.parser is not None
+    assert blah.parser.parser is None
+
+    # calls made after the parser is built go straight to it
+    hello.add_argument('--greeting', default='Hi')
+    assert subcommand.parse_args(['hello']).greeting == 'Hi'
+
+    # top level help does not need to build anything
+    with pytest.raises(SystemExit):
+        subcommand.parse_args(['-h'])
+    out, err = capsys.readouterr()
+    assert '{hello,speak}' in out
+    assert blah.parser.parser is None
+
+    with pytest.raises(SystemExit):
+        subcommand.parse_args(['shout'])
+    assert blah.parser.parser is None
+
+
+def test_lazy_subparser_forwards_unrecorded():
+    subcommand = subparser(lazy=True)
+
+    @subcommand
+    def hello(loud, quiet):
+        pass
+    group = hello.parser.add_mutually_exclusive_group()
+    group.add_argument('--loud', action='store_true')
+    group.add_argument('--quiet', action='store_true')
+    assert hello.parser.parser is not None
+    ns = subcommand.parse_args(['hello', '--loud'])
+    assert ns.loud and not ns.quiet
+
+
+@pytest.fixture
+def lazymodules(tmpdir, monkeypatch):
+    tmpdir.join('lazy_impl.py').write(
+        'def main(name, ns):\n'
+        '    return "%s from %s" % (name, ns.command)\n')
+    tmpdir.join('lazy_args.py').write(
+        'def declare(parser):\n'
+        '    parser.add_argument("--name", default="John")\n')
+    monkeypatch.syspath_prepend(str(tmpdir))
+    yield
+    for module in ('lazy_impl', 'lazy_args'):
+        sys.modules.pop(module, None)
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_lazy_import(lazymodules, lazy):
+    subcommand = subparser(lazy=lazy)
+    sync = subcommand.lazy('sync', 'lazy_impl:main')
+    sync.add_argument('--name', default='John')
+    subcommand.lazy('pull', 'lazy_impl:main', declare='lazy_args:declare')
+    assert 'lazy_impl' not in sys.modules
+    assert ('lazy_args' in sys.modules) is not lazy
+
+    assert subcommand.dispatch(['sync', '--name', 'Joe']) == 'Joe from sync'
+    assert 'lazy_impl' in sys.modules
+    assert subcommand.dispatch(['pull']) == 'John from pull'
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_lazy_aliases(lazymodules, lazy, capsys):
+    subcommand = subparser(lazy=lazy)
+    sync = subcommand.lazy('sync', 'lazy_impl:main', aliases=['s', 'sy'],
+                           help='sync things')
+    sync.add_argument('--name', default='John')
+    assert subcommand.dispatch(['s', '--name', 'Joe']) == 'Joe from s'
+    assert subcommand.dispatch(['sync']) == 'John from sync'
+    parsers = subcommand.subparser._name_parser_map
+    assert parsers['s'] is parsers['sync'] is parsers['sy']
+
+    with pytest.raises(SystemExit):
+        subcommand.parse_args(['-h'])
+    out, err = capsys.readouterr()
+    assert 'sync (s, sy)' in out and 'sync things' in out
+
+    with pytest.raises(argparse.ArgumentError):
+        subcommand.lazy('status', 'lazy_impl:main', aliases=['s'])
+
+
+def test_lazy_entry_points(lazymodules, monkeypatch):
+    groups = {
+        'app.commands': [('sync', 'lazy_impl:main')],
+        'app.arguments': [('sync', 'lazy_args:declare')],
+    }
+    monkeypatch.setattr(sys.modules['subparser.subparser'], 'entry_points',
+                        groups.get)
+    subcommand = subparser(lazy=True)
+    subcommand.load_entry_points('app.commands', declare_group='app.arguments')
+    assert 'lazy_impl' not in sys.modules
+    assert subcommand.dispatch(['sync', '--name', 'Joe']) == 'Joe from sync'
+
+
+def test_binder():
+    ns = argparse.Namespace(name='tommy', names=['tommy', 'john'], loud=True)
+
+    def greet(name, ns, *names, **kwargs):
+        return name, ns, names, kwargs
+    binder = Binder(greet)
+    assert binder(ns) == ('tommy', ns, ('tommy', 'john'),
+                          {'names': ['tommy', 'john'], 'loud': True})
+    # the binder can be reused
+    ns.name = 'john'
+    assert binder(ns)[0] == 'john'
+
+    # ns is just another dest when pass_ns is off
+    plain = argparse.Namespace(name=1, ns=2, names=3)
+    assert Binder(greet, pass_ns=False)(plain) == (1, 2, (3,), {'names': 3})
+
+    class Greeter(object):
+        def greet(self, name):
+            return name.upper()
+    assert Binder(Greeter().greet)(ns) == 'JOHN'
+
+
+@pytest.mark.skipif(sys.version_info < (3,), reason='keyword-only arguments')
+def test_binder_kwonly():
+    scope = {}
+    exec('def greet(name, *, loud, ns, times=1):\n'
+         '    return name, loud, ns, times\n', scope)
+    ns = argparse.Namespace(name='tommy', loud=True)
+    assert Binder(scope['greet'])(ns) == ('tommy', True, ns, 1)
+    ns.times = 3
+    assert ns_dispatch(scope['greet'], ns) == ('tommy', True, ns, 3)
+
+
+def batch_subcommand():
+    subcommand = subparser()
+
+    @subcommand
+    def speak(animal, times):
+        if animal == 'fish':
+            raise ValueError('fish do not speak')
+        return ' '.join([animal] * times)
+    speak.add_argument('--animal', env='ENV_ANIMAL', config='animal',
+                       default='dog')
+    speak.add_argument('--times', type=int, default=1)
+    return subcommand
+
+
+@clearenv
+def test_dispatch_many(capsys):
+    subcommand = batch_subcommand()
+    argvs = iter([['speak'], 'speak --animal "cat" --times 2',
+                  'speak --animal fish', 'bark', 'speak --times 3'])
+    results = subcommand.dispatch_many(argvs)
+
+    # argvs are consumed lazily
+    assert next(results) == (['speak'], 'dog', None)
+    assert next(argvs) == 'speak --animal "cat" --times 2'
+
+    results = list(results)
+    assert [r.argv for r in results] == \
+        [['speak', '--animal', 'fish'], ['bark'], ['speak', '--times', '3']]
+    assert isinstance(results[0].error, ValueError)
+    assert isinstance(results[1].error, SystemExit)
+    assert results[2] == (['speak', '--times', '3'], 'dog dog dog', None)
+    out, err = capsys.readouterr()
+    assert "invalid choice: 'bark'" in err
+
+
+@clearenv
+def test_dispatch_batch(capsys, monkeypatch, tmpdir, jsonfile):
+    subcommand = batch_subcommand()
+    subcommand.add_batch('--batch')
+    subcommand.add_config('-c', dest='config')
+    batch = tmpdir.join('batch.txt')
+    batch.write('# jobs\n'
+                'speak\n'
+                '\n'
+                'speak --animal fish\n'
+                'speak --times 2  # twice\n')
+
+    results = subcommand.dispatch(['--batch', str(batch), '-c', jsonfile])
+    assert [r.result for r in results] == ['pig', None, 'pig pig']
+    out, err = capsys.readouterr()
+    assert err == '-c %s speak --animal fish: fish do not speak\n' % jsonfile
+
+    monkeypatch.setattr(sys, 'stdin',
+                        io.StringIO(u'speak\nspeak --animal cat\n'))
+    results = subcommand.dispatch(['--batch', '-'])
+    assert [r.result for r in results] == ['dog', 'cat']
+
+    # env is used for every command-line of the batch
+    monkeypatch.setattr(sys, 'stdin',
+                        io.StringIO(u'speak\nspeak --times 2\n'))
+    monkeypatch.setenv('ENV_ANIMAL', 'pig')
+    results = subcommand.dispatch(['--batch', '-'],
+                                  env={'ENV_ANIMAL': 'cow'})
+    assert [r.result for r in results] == ['cow', 'cow cow']
+
+    # without --batch, dispatch behaves as usual
+    assert subcommand.dispatch(['speak', '--animal', 'duck']) == 'duck'
+    assert 'batch' not in vars(subcommand.parse_args(['speak']))
+
+
+def test_json_config_index(jsonfile):
+    config = JsonConfig()
+    config.load(jsonfile)
+    assert config.get('name', None) == 'Joe'
+    assert config.get(('nested', 'dict', 'test'), None) == 'value'
+    assert config.get(['nested', 'dict'], None) == {'test': 'value'}
+    assert config.get(('nested', 'missing', 'test'), 'default') == 'default'
+    assert config.get(('name', 'first'), 'default') == 'default'
+    # the raw document is still available
+    assert config.config['nested'] == {'dict': {'test': 'value'}}
+
+    # documents assigned directly are indexed on first lookup
+    config.config = {'animal': {'sound': 'oink'}}
+    assert config.get(('animal', 'sound'), None) == 'oink'
+    assert config.get('name', None) is None
+
+
+def test_ini_config_index(tmpdir):
+    p = str(tmpdir.join('config.ini'))
+    with open(p, 'w') as f:
+        f.write('[DEFAULT]\n')
+        f.write('animal = dog\n')
+        f.write('[hello]\n')
+        f.write('Name = Joe\n')
+    config = IniConfig()
+    config.load(p)
+    assert config.get(('hello', 'name'), None) == 'Joe'
+    assert config.get(('hello', 'NAME'), None) == 'Joe'
+    assert config.get(('hello', 'animal'), None) == 'dog'
+    assert config.get(('DEFAULT', 'animal'), None) == 'dog'
+    assert config.get(('hello', 'missing'), 'default') == 'default'
+    assert config.get(('missing', 'name'), 'default') == 'default'
+    assert config.config.get('hello', 'name') == 'Joe'
+
+
+@pytest.mark.parametrize('argv', [
+    [],
+    ['hello'],
+    ['-c', 'a.json', 'hello'],
+    ['hello', '--config', 'a.json', '--name', 'x'],
+    ['--config=a.json', 'hello', '-cb.json'],
+    ['-c=a.json', 'hello'],
+    ['-c', '-', 'hello'],
+    ['hello', '-xc', 'a.json'],
+    ['hello', '--', '-c', 'a.json'],
+    ['hello', '--configs', 'a.json'],
+    ['hello', '--conf', 'a.json'],
+    ['hello', '-c'],
+    ['hello', '-c', '--name'],
+    ['hello', '-c', '-5'],
+    ['-', '--name', '-c a.json', 'x y'],
+])
+def test_scan_config_option(argv):
+    subcommand = subparser()
+    subcommand.add_config('-c', '--config', dest='config',
+                          default='default.json')
+    parser, actions = subcommand.config_parser, [subcommand.config_action]
+
+    def parse(parse):
+        try:
+            ns, rest = parse(list(argv))
+        except SystemExit:
+            return 'error'
+        return vars(ns), rest
+
+    expected = parse(lambda args: parser.parse_known_args(args))
+    assert parse(lambda args: subcommand.parse_options(parser, actions,
+                                                       args)) == expected
+
+
+@clearenv
+def test_config_option_precedence(capsys, jsonfile, tmpdir):
+    subcommand = subparser()
+
+    @subcommand
+    def hello(name, count):
+        return name, count
+    hello.add_argument('--name', env='ENV_NAME', config='name', default='John')
+    hello.add_argument('--count', type=int, config='count', default=1)
+    subcommand.add_config('-c', '--config', dest='config', env='ENV_CONFIG')
+    other = str(tmpdir.join('other.json'))
+    with open(other, 'w') as f:
+        json.dump({'name': 'Ann', 'count': '3'}, f)
+
+    # the config option may be given in any form and place; the last one wins
+    for argv in (['-c', other, 'hello'], ['hello', '--config=%s' % other],
+                 ['-c%s' % jsonfile, 'hello', '-c', other]):
+        assert subcommand.dispatch(argv) == ('Ann', 3)
+    assert subcommand.dispatch(['hello', '-c', other, '--name', 'Bob',
+                                '--count', '2']) == ('Bob', 2)
+    os.environ['ENV_NAME'] = 'Eric'
+    assert subcommand.dispatch(['hello', '-c', other]) == ('Eric', 3)
+    del os.environ['ENV_NAME']
+    os.environ['ENV_CONFIG'] = other
+    assert subcommand.dispatch(['hello']) == ('Ann', 3)
+    assert subcommand.dispatch(['hello', '-c', jsonfile]) == ('Joe', 1)
+    del os.environ['ENV_CONFIG']
+    assert subcommand.dispatch(['hello']) == ('John', 1)
+    ns = subcommand.resolve(['hello', '-c', other])
+    assert ns.config.configfile == other
+
+
+def race(worker, count):
+    # runs worker(i) in count threads, switching between them often
+    import threading
+    barrier = threading.Barrier(count)
+
+    def run(i):
+        barrier.wait()
+        worker(i)
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+
+@clearenv
+@pytest.mark.parametrize('lazy', [False, True])
+def test_concurrent_dispatch(tmpdir, lazy):
+    subcommand = subparser(lazy=lazy)
+
+    @subcommand
+    def speak(name, animal, config=None):
+        return name, animal, config and config.configfile
+    speak.add_argument('--name', config='name', default='nobody')
+    speak.add_argument('--animal', env='ENV_ANIMAL', config='animal',
+                       default='dog')
+    subcommand.add_config('-c', dest='config')
+
+    configs = []
+    for i in range(8):
+        configs.append(str(tmpdir.join('config%d.json' % i)))
+        with open(configs[-1], 'w') as f:
+            json.dump({'name': 'name%d' % i, 'animal': 'config%d' % i}, f)
+
+    failures = []
+
+    def worker(i):
+        for j in range(100):
+            if j % 3 == 0:
+                expected = ('nobody', 'dog', None)
+                result = subcommand.dispatch(['speak'])
+            elif j % 3 == 1:
+                expected = ('name%d' % i, 'config%d' % i, configs[i])
+                result = subcommand.dispatch(['speak', '-c', configs[i]])
+            else:
+                expected = ('name%d' % i, 'env%d' % i, configs[i])
+                result = subcommand.dispatch(['speak', '-c', configs[i]],
+                                             env={'ENV_ANIMAL': 'env%d' % i})
+            if result != expected:
+                failures.append((result, expected))
+
+    race(worker, len(configs))
+    assert failures == []
+    # nothing from the dispatches is left behind on the parser
+    assert subcommand.parse_args(['speak']).animal == 'dog'
+
+
+def test_concurrent_first_dispatch():
+    # threads racing to build the same lazy parsers, in groups as well
+    failures = []
+    for trial in range(30):
+        subcommand = subparser(lazy=True)
+        group = subcommand.group('grp').group('sub')
+
+        @group
+        def cmd(name):
+            return name
+        cmd.add_argument('--name', default='x')
+
+        @subcommand
+        def top(name):
+            return name
+        top.add_argument('--name', default='y')
+
+        def worker(i):
+            if i % 2:
+                args, expected = ['grp', 'sub', 'cmd'], 'x'
+            else:
+                args, expected = ['top'], 'y'
+            try:
+                result = subcommand.dispatch(args)
+            except Exception as e:
+                result = e
+            if result != expected:
+                failures.append(result)
+        race(worker, 16)
+    assert failures == []
+
+
+@clearenv
+@pytest.mark.parametrize('lazy', [False, True])
+def test_slotted_namespaces(jsonfile, lazy):
+    import pickle
+    from subparser.subparser import SlottedNamespace
+
+    def make(slots):
+        subcommand = subparser(lazy=lazy, slots=slots)
+        subcommand.add_argument('--verbose', action='store_true')
+        subcommand.add_config('-c', dest='config')
+
+        @subcommand
+        def hello(name, ns, **kwargs):
+            return name, sorted(kwargs), ns
+        hello.add_argument('--name', env='ENV_NAME', config='name',
+                           default='John')
+
+        @subcommand
+        def speak(animal):
+            return animal
+        speak.add_argument('--animal', default='dog')
+        return subcommand, speak
+
+    subcommand, speak = make(True)
+    name, kwargs, ns = subcommand.dispatch(['hello', '-c', jsonfile])
+    assert (name, kwargs) == ('Joe', ['command', 'config', 'func', 'verbose'])
+    assert isinstance(ns, SlottedNamespace)
+    assert not hasattr(ns, 'animal')
+    with pytest.raises(AttributeError):
+        ns.animal = 'cat'
+    assert subcommand.dispatch(['speak', '--animal', 'cat']) == 'cat'
+
+    # the same namespaces as without slots
+    def values(ns):
+        values = vars(ns)
+        values.pop('func')
+        if values['config'] is not None:
+            values['config'] = values['config'].configfile
+        return values
+    plain, _ = make(False)
+    for argv in (['--verbose', 'hello', '-c', jsonfile], ['speak']):
+        ns = subcommand.resolve(argv)
+        assert values(ns) == values(plain.resolve(argv))
+    ns = type(ns)(command='speak', animal='cat')
+    assert pickle.loads(pickle.dumps(ns)) == ns
+    assert type(subcommand.resolve(['speak'])) is \
+        type(subcommand.resolve(['speak', '--animal', 'pig']))
+    assert 'animal' in subcommand.resolve(['speak'])
+
+    # dests that cannot be slots keep the namespace as it is
+    speak.set_defaults(**{'not-a-slot': True})
+    assert isinstance(subcommand.resolve(['speak']), argparse.Namespace)
+
+
+def test_env_prefix():
+    subcommand = subparser(env_prefix='MYAPP_')
+    subcommand.add_argument('--level', type=int, default=0)
+    subcommand.add_argument('--quiet', action='store_true')
+    subcommand.add_config('-c', dest='config')
+
+    @subcommand
+    def hello(ns, **kwargs):
+        return dict((k, v) for k, v in kwargs.items()
+                    if k not in ('command', 'func', 'config'))
+    hello.add_argument('--foo-bar')
+    hello.add_argument('--animal', env='ANIMAL', default='dog')
+    hello.add_argument('--secret', env=False)
+    hello.add_argument('--count', type=int, default=1)
+    hello.add_argument('files', nargs='*')
+
+    env = {
+        'MYAPP_LEVEL': '3',
+        'MYAPP_QUIET': '1',
+        'MYAPP_FOO_BAR': 'baz',
+        'MYAPP_ANIMAL': 'cat',
+        'ANIMAL': 'pig',
+        'MYAPP_SECRET': 'x',
+        'MYAPP_COUNT': '',
+        'MYAPP_FILES': 'a',
+        'MYAPP_CONFIG': 'missing.json',
+        'OTHER_FOO_BAR': 'other',
+    }
+    assert subcommand.dispatch(['hello'], env=env) == {
+        'level': 3, 'quiet': False, 'foo_bar': 'baz', 'animal': 'pig',
+        'secret': None, 'count': 1, 'files': [],
+    }
+    # the command-line wins over the environment
+    argv = ['--level', '1', 'hello', '--foo-bar', 'cmd']
+    assert subcommand.dispatch(argv, env=env)['foo_bar'] == 'cmd'
+    assert subcommand.dispatch(['--level', '1', 'hello'],
+                               env=env)['level'] == 1
+    assert subcommand.dispatch(['hello'], env={})['foo_bar'] is None
+
+    # a command's own prefix
+    later = subcommand.subparser.add_parser('later', env_prefix='LATER_')
+    later.add_argument('--name')
+    env = {'LATER_NAME': 'Joe', 'MYAPP_NAME': 'Jim'}
+    assert subcommand.resolve(['later'], env=env).name == 'Joe'
+
+
+class CountingEnviron(Mapping):
+    '''
+    an environment counting its lookups and scans
+    '''
+    def __init__(self, *args, **kwargs):
+        self.environ = dict(*args, **kwargs)
+        self.gets = 0
+        self.scans = 0
+
+    def __getitem__(self, key):
+        return self.environ[key]
+
+    def __setitem__(self, key, value):
+        self.environ[key] = value
+
+    def __iter__(self):
+        self.scans += 1
+        return iter(self.environ)
+
+    def __len__(self):
+        return len(self.environ)
+
+    def get(self, key, default=None):
+        self.gets += 1
+        return self.environ.get(key, default)
+
+
+def test_env_single_scan():
+    from subparser.subparser import EnvSnapshot
+    environ = CountingEnviron(('VAR%d' % i, str(i)) for i in range(5))
+    snapshot = EnvSnapshot(environ)
+    assert snapshot.get('VAR0') == '0'
+    assert snapshot.get('MISSING') is None
+    environ['VAR0'], environ['MISSING'] = 'changed', 'added'
+
+    # more names than variables: a single scan, agreeing with earlier reads
+    names = dict(('VAR%d' % i, i) for i in range(0, 100, 2))
+    names['MISSING'] = None
+    assert sorted(snapshot.matching(names)) == \
+        [('VAR0', '0'), ('VAR2', '2'), ('VAR4', '4')]
+    assert sorted(snapshot.matching(set(['VAR1', 'VAR3', 'MISSING']))) == \
+        [('VAR1', '1'), ('VAR3', '3')]
+    assert (environ.scans, environ.gets) == (1, 2)
+    assert snapshot.get('VAR0') == '0'
+    assert snapshot.get('MISSING') is None
+
+    # a few names are looked up
+    environ = CountingEnviron(('VAR%d' % i, str(i)) for i in range(50))
+    snapshot = EnvSnapshot(environ)
+    assert list(snapshot.matching(['VAR1', 'NONE'])) == [('VAR1', '1')]
+    assert (environ.scans, environ.gets) == (0, 2)
+
+    # parsers with many env options share the scan of their dispatch
+    subcommand = subparser(env_prefix='APP_')
+    for i in range(20):
+        subcommand.add_argument('--main%d' % i)
+
+    @subcommand
+    def run(ns):
+        return ns
+    for i in range(20):
+        run.add_argument('--option%d' % i, type=int)
+    environ = CountingEnviron(APP_MAIN3='x', APP_OPTION7='7', HOME='/')
+    ns = subcommand.dispatch(['run'], env=environ)
+    assert (ns.main3, ns.option7, ns.option8) == ('x', 7, None)
+    assert (environ.scans, environ.gets) == (1, 0)
@@ -0,0 +1,142 @@
+from __future__ import print_function
+
+import pytest
+
+from subparser import subparser
+from subparser.codegen import Unsupported, generate
+from subparser.completion import export, registering_modules
+from subparser.subparser import CommandTrie, LazyParser
+
+
+def make(**kwargs):
+    subcommand = subparser(prog='app', **kwargs)
+    subcommand.add_argument('--verbose', action='store_true')
+    cluster = subcommand.group('cluster', help='manage clusters')
+    cluster.add_argument('--region', default='eu')
+    node = cluster.group('node')
+
+    @node
+    def drain(name, region, verbose, command):
+        return name, region, verbose, command
+    drain.add_argument('name')
+
+    @node
+    def describe(command):
+        return command
+
+    @cluster
+    def status(region, command):
+        return region, command
+
+    @subcommand
+    def hello(command):
+        return command
+
+    @subcommand
+    def help_(command):
+        return command
+    return subcommand
+
+
+def unbuilt(action, name):
+    parser = dict.__getitem__(action._name_parser_map, name)
+    return isinstance(parser, LazyParser)
+
+
+def test_nested_dispatch():
+    for kwargs in ({}, {'lazy': True}, {'slots': True}):
+        subcommand = make(**kwargs)
+        assert subcommand.dispatch(['cluster', 'node', 'drain', 'n1']) == \
+            ('n1', 'eu', False, 'cluster node drain')
+        assert subcommand.dispatch(['--verbose', 'cluster', '--region', 'us',
+                                    'node', 'drain', 'n1']) == \
+            ('n1', 'us', True, 'cluster node drain')
+        assert subcommand.dispatch(['cluster', 'status']) == \
+            ('eu', 'cluster status')
+        assert subcommand.dispatch(['hello']) == 'hello'
+        with pytest.raises(SystemExit):
+            subcommand.dispatch(['cluster'])
+        with pytest.raises(SystemExit):
+            subcommand.dispatch(['cluster', 'node', 'missing'])
+
+
+def test_levels_built_when_reached():
+    subcommand = make()
+    action = subcommand.subparser
+    assert unbuilt(action, 'cluster')
+    subcommand.dispatch(['hello'])
+    assert unbuilt(action, 'cluster')
+    subcommand.dispatch(['cluster', 'status'])
+    assert not unbuilt(action, 'cluster')
+    cluster = action._name_parser_map['cluster']
+    actions = [a for a in cluster._actions if a.dest == 'command']
+    assert unbuilt(actions[0], 'node')
+    assert unbuilt(actions[0], 'status') is False
+
+
+def test_abbreviations(capsys):
+    subcommand = make(abbrev_commands=True)
+    assert subcommand.dispatch(['cl', 'no', 'dr', 'n1'])[3] == \
+        'cluster node drain'
+    assert subcommand.dispatch(['cluster', 'node', 'des']) == \
+        'cluster node describe'
+    assert subcommand.dispatch(['hello']) == 'hello'
+    with pytest.raises(SystemExit):
+        subcommand.dispatch(['he'])
+    assert "ambiguous choice: 'he' could match hello, help_" in \
+        capsys.readouterr().err
+    with pytest.raises(SystemExit):
+        subcommand.dispatch(['cluster', 'node', 'd'])
+    assert 'could match describe, drain' in capsys.readouterr().err
+    # only on request
+    with pytest.raises(SystemExit):
+        make().dispatch(['cl', 'status'])
+
+
+def test_group_aliases():
+    for kwargs in ({}, {'lazy': True}):
+        subcommand = subparser(prog='app', **kwargs)
+        cluster = subcommand.group('cluster', aliases=['c'])
+
+        @cluster
+        def status(command):
+            return command
+        assert subcommand.dispatch(['c', 'status']) == 'cluster status'
+        assert subcommand.dispatch(['cluster', 'status']) == \
+            'cluster status'
+
+
+def test_trie():
+    names = ['node%d' % i for i in range(5000)] + ['nodes', 'status']
+    trie = CommandTrie(names)
+    assert trie.matches('s') == ['status']
+    assert trie.matches('node4999') == ['node4999']
+    assert trie.matches('node499') == \
+        ['node499'] + ['node499%d' % i for i in range(10)]
+    assert trie.matches('x') == []
+    assert len(trie.matches('')) == len(names)
+
+    # names registered after the trie is built are matched too
+    subcommand = subparser(abbrev_commands=True)
+
+    @subcommand
+    def first():
+        return 'first'
+    assert subcommand.dispatch(['fi']) == 'first'
+
+    @subcommand
+    def second():
+        return 'second'
+    assert subcommand.dispatch(['sec']) == 'second'
+
+
+def test_group_tools():
+    subcommand = make()
+    data = export(subcommand)
+    node = data[data[data[0]['commands']['cluster']]['commands']['node']]
+    assert sorted(node['commands']) == ['describe', 'drain']
+    nested = subparser()
+    nested.group('outer').group('inner')(test_group_tools)
+    assert registering_modules(nested, 'app:subcommand') == ['app', __name__]
+    with pytest.raises(Unsupported):
+        generate('tests:subcommand', subcommand)
@@ -0,0 +1,83 @@
+import ast
+import os
+import subprocess
+import sys
+
+import pytest
+
+# microseconds importing subparser may add to importing argparse
+BUDGET = 15000
+
+HEAVY = ['configparser', 'decorator', 'hashlib', 'inspect', 'json', 'mmap',
+         'pickle', 'six']
+
+CODE = '''
+import sys
+import subparser
+print(sorted(sys.modules))
+print('subcommand' in vars(sys.modules['subparser.subparser']))
+'''
+
+
+def import_subparser():
+    env = dict(os.environ)
+    # as installed, with compiled modules cached
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([root] + sys.path)
+    command = [sys.executable, '-X', 'importtime', '-c', CODE]
+    subprocess.check_call(command, env=env, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE)
+    process = subprocess.Popen(command, env=env, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, universal_newlines=True)
+    out, err = process.communicate()
+    assert process.returncode == 0, err
+    cumulative = {}
+    for line in err.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, total, name = line.split('|')
+            if total.strip().isdigit():
+                cumulative[name.strip()] = int(total)
+    modules, subcommand = out.splitlines()
+    return cumulative, ast.literal_eval(modules), subcommand == 'True'
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7),
+                    reason='-X importtime and lazy attributes need 3.7')
+def test_import_budget():
+    cumulative, modules, subcommand = import_subparser()
+    assert [module for module in HEAVY if module in modules] == []
+    assert not subcommand
+    assert cumulative['subparser'] - cumulative.get('argparse', 0) < BUDGET
+
+
+def test_lazy_attributes():
+    import subparser
+    from subparser import subcommand, LazyJsonConfig
+    from subparser.subparser import Subcommand
+    assert isinstance(subcommand, Subcommand)
+    assert subparser.subcommand is subcommand
+    assert sys.modules['subparser.subparser'].subcommand is subcommand
+    assert LazyJsonConfig.__module__ == 'subparser.lazyjson'
+    with pytest.raises(AttributeError):
+        subparser.missing
+    with pytest.raises(ImportError):
+        from subparser.subparser import missing  # noqa: F401
+
+
+def test_signature_preserved():
+    from subparser import subparser
+    import inspect
+    subcommand = subparser()
+
+    def hello(name, times=1, *args, **kwargs):
+        '''says hello'''
+        return name * times
+    wrapper = subcommand(hello)
+    assert wrapper is not hello
+    assert wrapper('a', 2) == 'aa'
+    assert wrapper.__doc__ == 'says hello'
+    assert wrapper.__wrapped__ is hello
+    assert inspect.signature(wrapper) == inspect.signature(hello)
+    assert callable(wrapper.add_argument)
+    assert not hasattr(hello, 'add_argument')
@@ -0,0 +1,186 @@
+from __future__ import print_function
+
+import os
+import pickle
+import threading
+
+import pytest
+
+from conftest import write_json
+from subparser import (subparser, IniConfig, JsonConfig, LayeredConfig,
+                       LazyJsonConfig)
+from subparser.layered import layered_config
+
+SYSTEM = {'name': 'system', 'times': 1,
+          'db': {'host': 'localhost', 'port': 5432}, 'tags': ['a']}
+USER = {'name': 'user', 'db': {'port': 6432, 'pool': {'size': 5}}}
+PROJECT = {'times': 3, 'tags': 'b', 'db': {'pool': 'none'}}
+
+
+def touch(path, document):
+    # a new size, so the change shows whatever the mtime resolution
+    document = dict(document, padding='x' * (os.path.getsize(path) + 1))
+    write_json(path, document)
+
+
+@pytest.fixture
+def layers(tmpdir):
+    paths = [str(tmpdir.join(name))
+             for name in ('system.json', 'user.json', 'project.json')]
+    for path, document in zip(paths, (SYSTEM, USER, PROJECT)):
+        write_json(path, document)
+    return paths
+
+
+class CountingConfig(JsonConfig):
+    cache = None
+    parsed = []
+
+    def parse(self, source):
+        self.parsed.append(os.path.basename(source))
+        return super(CountingConfig, self).parse(source)
+
+
+def test_merged_view(layers, tmpdir):
+    config = LayeredConfig(layers + [str(tmpdir.join('missing.json'))])
+    assert config.refresh()
+    assert config.get('name', None) == 'user'
+    assert config.get('times', None) == 3
+    assert config.get('tags', None) == 'b'
+    assert config.get(('db', 'host'), None) == 'localhost'
+    assert config.get(('db', 'port'), None) == 6432
+    assert config.get(('db', 'pool'), None) == 'none'
+    assert config.get(('db', 'pool', 'size'), 'default') == 'default'
+    assert config.get(('db',), None) == \
+        {'host': 'localhost', 'port': 6432, 'pool': 'none'}
+    assert config.get('missing', 'default') == 'default'
+    assert config.config['db'] == config.get('db', None)
+
+    system, user, project = layers
+    assert config.source_of('name') == user
+    assert config.source_of(('db', 'host')) == system
+    assert config.source_of(('db', 'pool')) == project
+    assert config.source_of(('db', 'pool', 'size')) is None
+    assert config.source_of('missing') is None
+    assert config.source == project
+
+    # the layers' own documents are left alone
+    merged = JsonConfig.merge([(system, SYSTEM), (user, USER)])[0]
+    assert merged['db']['port'] == 6432
+    assert SYSTEM['db'] == {'host': 'localhost', 'port': 5432}
+
+
+def test_lazy_json_layers(layers):
+    config = LayeredConfig(layers, LazyJsonConfig)
+    assert config.refresh()
+    assert config.get('name', None) == 'user'
+    assert config.get(('db', 'port'), None) == 6432
+    assert config.source_of(('db', 'host')) == layers[0]
+
+    subcommand = subparser()
+    subcommand.add_config('-c', dest='config', layers=layers,
+                          config_class=LazyJsonConfig)
+
+    @subcommand
+    def hello(name, port):
+        return name, port
+    hello.add_argument('--name', config='name')
+    hello.add_argument('--port', type=int, config=('db', 'port'))
+    assert subcommand.dispatch(['hello'], env={}) == ('user', 6432)
+
+
+def test_refresh_changed_layers(layers, tmpdir):
+    del CountingConfig.parsed[:]
+    extra = str(tmpdir.join('extra.json'))
+    config = LayeredConfig(layers + [extra], CountingConfig)
+    config.refresh()
+    assert sorted(CountingConfig.parsed) == \
+        ['project.json', 'system.json', 'user.json']
+    assert not config.refresh()
+    assert len(CountingConfig.parsed) == 3
+
+    touch(layers[0], dict(SYSTEM, name='changed', times=9))
+    view = config._state[1]
+    assert config.refresh()
+    assert CountingConfig.parsed[3:] == ['system.json']
+    assert config.get('times', None) == 3
+    assert config.get('padding', None).startswith('x')
+    # a new view rather than the old one updated
+    assert 'padding' not in view
+
+    write_json(extra, {'times': 4})
+    os.remove(layers[2])
+    assert config.refresh()
+    assert CountingConfig.parsed[4:] == ['extra.json']
+    assert (config.get('times', None), config.source_of('times')) == (4, extra)
+    assert config.get('tags', None) == ['a']
+
+
+def test_layers_load_concurrently(layers):
+    barrier = threading.Barrier(len(layers), timeout=5)
+
+    class BarrierConfig(JsonConfig):
+        cache = None
+
+        def parse(self, source):
+            # every layer has to be parsing at once to get past the barrier
+            barrier.wait()
+            return super(BarrierConfig, self).parse(source)
+
+    config = LayeredConfig(layers, BarrierConfig)
+    assert config.refresh()
+    assert config.get('name', None) == 'user'
+
+
+def test_ini_layers(tmpdir):
+    system, user = str(tmpdir.join('system.ini')), str(tmpdir.join('user.ini'))
+    with open(system, 'w') as f:
+        f.write('[DEFAULT]\ncolor = red\n[hello]\nname = Joe\ntimes = 1\n'
+                '[speak]\nanimal = pig\n')
+    with open(user, 'w') as f:
+        f.write('[hello]\nName = Jim\n')
+    config = LayeredConfig([system, user], IniConfig)
+    config.refresh()
+    assert config.get(('hello', 'NAME'), None) == 'Jim'
+    assert config.get(('hello', 'times'), None) == '1'
+    assert config.get(('speak', 'color'), None) == 'red'
+    assert config.get(('speak', 'missing'), None) is None
+    assert config.source_of(('hello', 'name')) == user
+    assert config.config.get('speak', 'animal') == 'pig'
+
+
+def test_layered_dispatch(layers, tmpdir):
+    subcommand = subparser()
+    subcommand.add_config('-c', '--config', dest='config', layers=layers)
+
+    @subcommand
+    def hello(name, times, port, config):
+        return name, times, port, config
+    hello.add_argument('--name', config='name', env='LAYERED_NAME')
+    hello.add_argument('--times', type=int, config='times')
+    hello.add_argument('--port', type=int, config=('db', 'port'))
+
+    name, times, port, config = subcommand.dispatch(['hello'], env={})
+    assert (name, times, port) == ('user', 3, 6432)
+    assert config.configfile == layers[2]
+    assert config.config.source_of('name') == layers[1]
+
+    run = str(tmpdir.join('run.json'))
+    write_json(run, {'name': 'run'})
+    assert subcommand.dispatch(['hello', '-c', run, '--times', '5'],
+                               env={})[:3] == ('run', 5, 6432)
+    assert subcommand.dispatch(['hello', '-c', run],
+                               env={'LAYERED_NAME': 'env'})[0] == 'env'
+
+    # the same config is shared by dispatches, and survives pickling
+    first = subcommand.dispatch(['hello'], env={})[3].config
+    assert subcommand.dispatch(['hello'], env={})[3].config is first
+    assert pickle.loads(pickle.dumps(first)) is first
+    assert layered_config(layers) is first
+
+    with pytest.raises(EnvironmentError):
+        subcommand.dispatch(['hello', '-c', str(tmpdir.join('missing.json'))],
+                            env={})
+
+    with pytest.raises(ValueError):
+        subparser().add_config('-c', layers=layers, watch=True)
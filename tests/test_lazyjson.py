@@ -0,0 +1,84 @@
+from __future__ import print_function
+
+import json
+import pickle
+
+import pytest
+
+from subparser import JsonConfig, LazyJsonConfig, SidecarCache
+
+DOC = {
+    'name': 'Joe',
+    'tricky': 'braces } ] { [ and "quotes" \\ in strings',
+    'empty': {},
+    'list': [1, [2, {'three': 3}], '}'],
+    'numbers': {'int': -12, 'float': 1.5e3, 'true': True, 'null': None},
+    'nested': {'dict': {'test': 'value', u'unicodé': u'☃'}},
+    'hosts': dict(('host%d' % i, {'address': '10.0.0.%d' % i})
+                  for i in range(50)),
+}
+
+
+@pytest.fixture(params=[None, 2])
+def jsonfile(tmpdir, request):
+    p = str(tmpdir.join('config.json'))
+    with open(p, 'w') as f:
+        json.dump(DOC, f, indent=request.param)
+    return p
+
+
+def test_lazy_json_matches_json(jsonfile):
+    lazy = LazyJsonConfig()
+    lazy.load(jsonfile)
+    eager = JsonConfig()
+    eager.load(jsonfile)
+    keys = [('name',), ('tricky',), ('empty',), ('list',),
+            ('numbers', 'float'), ('numbers', 'null'),
+            ('nested', 'dict', u'unicodé'), ('hosts', 'host7', 'address'),
+            ('missing',), ('name', 'first'), ('list', 'three'),
+            ('nested', 'missing', 'test')]
+    for key in keys:
+        assert lazy.get(key, 'default') == eager.get(key, 'default')
+    assert lazy.get('name', None) == 'Joe'
+    assert sorted(lazy.config.keys()) == sorted(DOC)
+    assert lazy.config['nested'] == DOC['nested']
+
+
+def test_lazy_json_only_scans_touched_objects(jsonfile):
+    config = LazyJsonConfig()
+    config.load(jsonfile)
+    document = config.config
+    assert list(document.objects) == [()]
+    config.get(('hosts', 'host3', 'address'), None)
+    assert sorted(document.objects) == [(), ('hosts',), ('hosts', 'host3')]
+
+    # offsets survive pickling, the mapping is reopened
+    copy = pickle.loads(pickle.dumps(document))
+    assert copy.objects == document.objects
+    assert copy.lookup(('hosts', 'host3', 'address')) == '10.0.0.3'
+
+
+def test_lazy_json_sidecar(jsonfile, tmpdir, monkeypatch):
+    monkeypatch.setattr(LazyJsonConfig, 'cache', None)
+    monkeypatch.setattr(LazyJsonConfig, 'sidecar',
+                        SidecarCache(str(tmpdir.join('cache'))))
+    for i in range(2):
+        config = LazyJsonConfig()
+        config.load(jsonfile)
+        assert config.get(('nested', 'dict', 'test'), None) == 'value'
+    assert LazyJsonConfig.sidecar.hits == 1
+
+
+@pytest.mark.parametrize('text', ['', '[1, 2]', '{"a": "unterminated}'])
+def test_lazy_json_odd_documents(tmpdir, text):
+    p = str(tmpdir.join('config.json'))
+    with open(p, 'w') as f:
+        f.write(text)
+    if text.startswith('{'):
+        with pytest.raises(ValueError):
+            LazyJsonConfig().load(p)
+    elif text:
+        config = LazyJsonConfig()
+        config.load(p)
+        assert config.get('a', 'default') == 'default'
+        assert config.get((), None) == [1, 2]
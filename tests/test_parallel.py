@@ -0,0 +1,99 @@
+from __future__ import print_function
+
+import os
+import pickle
+import sys
+
+import pytest
+
+from subparser import subparser
+from subparser.subparser import Binder
+
+subcommand = subparser()
+
+
+@subcommand
+def square(number, animal):
+    return number * number, animal, os.getpid()
+
+
+square.add_argument('--number', type=int)
+square.add_argument('--animal', config='animal', default='dog')
+
+
+@subcommand
+def fail(number):
+    raise ValueError(number)
+
+
+fail.add_argument('--number', type=int)
+
+
+@subcommand
+def bye(code):
+    sys.exit(code)
+
+
+bye.add_argument('--code', type=int, default=3)
+
+subcommand.add_config('-c', dest='config')
+
+watched = subparser()
+
+
+@watched
+def animal(animal):
+    return animal
+
+
+animal.add_argument('--animal', config='animal', default='dog')
+
+watched.add_config('-c', dest='config', watch=True)
+
+
+def test_binder_pickles_by_reference():
+    binder = pickle.loads(pickle.dumps(Binder(square.__wrapped__)))
+    assert binder.func is square
+    assert binder.args == ('number', 'animal')
+
+
+@pytest.mark.parametrize('context', [None, 'spawn'])
+def test_dispatch_parallel(jsonfile, context):
+    argvs = ['square --number %d -c %s' % (i, jsonfile) for i in range(20)]
+    argvs[3] = 'fail --number 3'
+    argvs[5] = ['bogus']
+    results = list(subcommand.dispatch_parallel(argvs, processes=2,
+                                                chunksize=3, context=context))
+    assert [r.argv[:2] for r in results] == \
+        [a.split()[:2] if not isinstance(a, list) else a for a in argvs]
+    assert isinstance(results[3].error, ValueError)
+    assert isinstance(results[5].error, SystemExit)
+    numbers = [r.result[:2] for i, r in enumerate(results) if i not in (3, 5)]
+    assert numbers == [(i * i, 'pig') for i in range(20) if i not in (3, 5)]
+    assert os.getpid() not in set(r.result[2] for r in results if r.result)
+
+
+def test_dispatch_parallel_unordered():
+    argvs = (['square', '--number', str(i)] for i in range(10))
+    results = subcommand.dispatch_parallel(argvs, processes=2, ordered=False)
+    assert sorted(r.result[0] for r in results) == [i * i for i in range(10)]
+
+
+def test_dispatch_parallel_exit():
+    argvs = [['square', '--number', '2'], ['bye'], ['square', '--number', '3']]
+    results = list(subcommand.dispatch_parallel(argvs, processes=2))
+    assert [r.result and r.result[0] for r in results] == [4, None, 9]
+    assert isinstance(results[1].error, SystemExit)
+    assert results[1].error.code == 3
+
+
+def test_dispatch_parallel_watched(jsonfile):
+    ns = watched.resolve(['animal', '-c', jsonfile])
+    try:
+        config = pickle.loads(pickle.dumps(ns)).config.config
+        assert config.get('animal', None) == 'pig'
+        argvs = [['animal', '-c', jsonfile]] * 4
+        results = list(watched.dispatch_parallel(argvs, processes=2))
+        assert [r.result for r in results] == ['pig'] * 4
+    finally:
+        watched.config_watcher.stop()
@@ -0,0 +1,129 @@
+from __future__ import print_function
+
+import json
+import threading
+import time
+
+import pytest
+
+from subparser import subparser, JsonConfig
+
+# seconds to open a config file, and to check an argument, on the simulated
+# slow filesystem
+DELAY = 0.2
+
+
+class SlowConfig(JsonConfig):
+    cache = None
+
+    def parse(self, source):
+        time.sleep(DELAY)
+        return super(SlowConfig, self).parse(source)
+
+
+def slow_path(value):
+    # an argument type checking its value on the slow filesystem
+    time.sleep(DELAY)
+    return value
+
+
+def make(prefetch, config_class=JsonConfig, default=None, slow=False):
+    subcommand = subparser()
+    subcommand.add_config('-c', '--config', dest='config',
+                          env='PREFETCH_CONFIG', default=default,
+                          config_class=config_class, prefetch=prefetch)
+    subcommand.add_argument('--output', type=slow_path if slow else str,
+                            default='out')
+
+    @subcommand
+    def hello(name, times, config, output):
+        return name, times, config and config.configfile, output
+    hello.add_argument('--name', config='name', default='John')
+    hello.add_argument('--times', type=int, config='times', default=1)
+
+    @subcommand
+    def plain(config):
+        return config and config.configfile
+    return subcommand
+
+
+@pytest.fixture
+def configs(tmpdir):
+    paths = []
+    for name, document in (('a.json', {'name': 'A', 'times': '2'}),
+                           ('b.json', {'name': 'B'})):
+        path = str(tmpdir.join(name))
+        with open(path, 'w') as f:
+            json.dump(document, f)
+        paths.append(path)
+    return paths + [str(tmpdir.join('missing.json'))]
+
+
+def outcome(subcommand, argv, env):
+    try:
+        return subcommand.dispatch(argv, env=env)
+    except (Exception, SystemExit) as e:
+        return type(e)
+
+
+def test_prefetch_matches(configs):
+    a, b, missing = configs
+    cases = [
+        (['hello'], {}),
+        (['hello', '-c', a], {}),
+        (['hello', '--config', b, '--times', '5'], {'PREFETCH_CONFIG': a}),
+        (['hello'], {'PREFETCH_CONFIG': a}),
+        (['--output', 'x', 'hello', '--name', 'cmd', '-c', a], {}),
+        (['hello', '-c', missing], {}),
+        (['hello'], {'PREFETCH_CONFIG': missing}),
+        (['plain', '-c', a], {}),
+        (['plain'], {}),
+        (['hello', '--times', 'x', '-c', a], {}),
+    ]
+    for default in (None, b, missing):
+        expected = make(False, default=default)
+        actual = make(True, default=default)
+        for argv, env in cases:
+            assert outcome(actual, argv, env) == \
+                outcome(expected, argv, env), (default, argv, env)
+
+
+def test_prefetch_slots(configs):
+    subcommand = subparser(slots=True)
+    subcommand.add_config('-c', dest='config', prefetch=True)
+
+    @subcommand
+    def hello(name, config):
+        return name, config.configfile
+    hello.add_argument('--name', config='name')
+    assert subcommand.dispatch(['hello', '-c', configs[0]]) == \
+        ('A', configs[0])
+
+
+def test_prefetch_speculative(configs, monkeypatch):
+    a, b, _ = configs
+    started = []
+    original = threading.Thread.start
+
+    def start(thread):
+        started.append(thread.name)
+        return original(thread)
+    monkeypatch.setattr(threading.Thread, 'start', start)
+    subcommand = make(True, default=a)
+    assert subcommand.dispatch(['hello'], env={})[:2] == ('A', 2)
+    assert started == ['subparser-prefetch']
+    # the speculative load is discarded when args name another file
+    assert subcommand.dispatch(['hello', '-c', b], env={})[:2] == ('B', 1)
+    assert len(started) == 3
+
+
+def test_prefetch_overlaps_parsing(configs):
+    argv = ['--output', 'x', 'hello', '-c', configs[0]]
+    timings = {}
+    for prefetch in (False, True):
+        subcommand = make(prefetch, SlowConfig, slow=True)
+        start = time.time()
+        assert subcommand.dispatch(argv, env={}) == ('A', 2, configs[0], 'x')
+        timings[prefetch] = time.time() - start
+    assert timings[False] >= 2 * DELAY
+    assert timings[True] < 1.5 * DELAY
@@ -0,0 +1,113 @@
+from __future__ import print_function
+
+import pstats
+import sys
+
+import pytest
+
+from subparser import subparser as make_subparser
+from subparser.codegen import generate
+
+CLI = '''
+from subparser import subparser
+
+subcommand = subparser(prog='cli')
+subcommand.add_profiling()
+
+
+@subcommand
+def run(count, **kwargs):
+    return sorted(kwargs), [str(i) for i in range(count)][-1]
+run.add_argument('--count', type=int, default=1000)
+'''
+
+
+@pytest.fixture(params=[False, True], ids=['dict', 'slots'])
+def subcommand(request):
+    subcommand = make_subparser(slots=request.param)
+    subcommand.add_profiling()
+
+    @subcommand
+    def run(count, **kwargs):
+        return sorted(kwargs), [str(i) for i in range(count)][-1]
+    run.add_argument('--count', type=int, default=1000)
+    return subcommand
+
+
+def test_unprofiled(subcommand, capsys):
+    assert subcommand.dispatch(['run'], env={}) == \
+        (['command', 'func', 'ns'], '999')
+    ns = subcommand.resolve(['--profile', '--tracemalloc-top', '3', 'run'],
+                            env={})
+    assert sorted(vars(ns)) == ['command', 'count', 'func']
+    assert capsys.readouterr().err == ''
+
+
+def test_profile(subcommand, capsys):
+    assert subcommand.dispatch(['--profile', 'run'], env={}) == \
+        (['command', 'func', 'ns'], '999')
+    err = capsys.readouterr().err
+    assert 'function calls' in err
+    assert 'cumulative' in err
+    assert 'test_profiling.py' in err
+
+
+def test_profile_file(subcommand, tmpdir, capsys):
+    output = str(tmpdir.join('run.prof'))
+    argv = ['--profile-output=%s' % output, '--profile-sort', 'tottime', 'run']
+    assert subcommand.dispatch(argv, env={}) == \
+        (['command', 'func', 'ns'], '999')
+    assert capsys.readouterr().err == ''
+    stats = pstats.Stats(output)
+    assert any(name == 'run' for _, _, name in stats.stats)
+
+
+def test_tracemalloc(subcommand, capsys):
+    argv = ['--tracemalloc-top', '3', 'run', '--count', '100000']
+    assert subcommand.dispatch(argv, env={}) == \
+        (['command', 'func', 'ns'], '99999')
+    lines = capsys.readouterr().err.splitlines()
+    assert lines[0].startswith('top 3 allocations by line')
+    # only allocations still alive after the command are reported
+    assert 1 < len(lines) <= 4
+    assert [line[:3] for line in lines[1:]] == \
+        ['#%d:' % i for i in range(1, len(lines))]
+    assert any('test_profiling.py' in line for line in lines)
+
+    subcommand.dispatch(['--tracemalloc', 'run'], env={})
+    assert 1 < len(capsys.readouterr().err.splitlines()) <= 11
+
+
+def test_generated_fallback(tmpdir, monkeypatch, capsys):
+    tmpdir.join('cli.py').write(CLI)
+    monkeypatch.syspath_prepend(str(tmpdir))
+    try:
+        tmpdir.join('cli_fast.py').write(generate('cli:subcommand'))
+        import cli_fast
+        assert cli_fast.dispatch(['run']) == (['command', 'func', 'ns'], '999')
+        assert cli_fast.SPEC.fallbacks == 0
+        ns = cli_fast.resolve(['--profile', 'run'])
+        assert sorted(vars(ns)) == ['command', 'count', 'func']
+        assert cli_fast.dispatch(['--profile', 'run']) == \
+            (['command', 'func', 'ns'], '999')
+        assert cli_fast.SPEC.fallbacks == 2
+        assert 'function calls' in capsys.readouterr().err
+    finally:
+        for module in ('cli', 'cli_fast'):
+            sys.modules.pop(module, None)
+
+
+def test_profile_async(subcommand, capsys):
+    import asyncio
+    result = asyncio.run(
+        subcommand.dispatch_async(['--profile', '--tracemalloc', 'run']))
+    assert result == (['command', 'func', 'ns'], '999')
+    err = capsys.readouterr().err
+    assert 'function calls' in err
+    assert 'top 10 allocations by line' in err
+
+
+def test_profile_parallel_rejected(subcommand):
+    results = list(subcommand.dispatch_parallel([['--profile', 'run']],
+                                                processes=1))
+    assert isinstance(results[0].error, ValueError)
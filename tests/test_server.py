@@ -0,0 +1,150 @@
+from __future__ import print_function
+
+import contextlib
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from subparser import subparser
+from subparser.server import DispatchServer
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(os, 'fork') or sys.version_info < (3, 3),
+    reason='requires fork and socket.sendmsg')
+
+
+def server_subcommand():
+    subcommand = subparser()
+
+    @subcommand
+    def hello(name):
+        print('Hello %s from %s!' % (name, os.path.basename(os.getcwd())))
+    hello.add_argument('--name', env='ENV_NAME', config='name', default='John')
+
+    @subcommand
+    def echo():
+        print(sys.stdin.read().upper(), end='')
+
+    @subcommand
+    def fail(code):
+        if code:
+            sys.exit(code)
+        raise ValueError('broken')
+    fail.add_argument('--code', type=int, default=0)
+
+    @subcommand
+    def wait(seconds):
+        time.sleep(seconds)
+    wait.add_argument('--seconds', type=float)
+
+    subcommand.add_config('-c', dest='config')
+    return subcommand
+
+
+@contextlib.contextmanager
+def running(path):
+    process = multiprocessing.get_context('fork').Process(
+        target=server_subcommand().serve, args=(path,))
+    process.start()
+    for i in range(100):
+        if os.path.exists(path):
+            break
+        time.sleep(0.05)
+    try:
+        yield path
+    finally:
+        process.terminate()
+        process.join(5)
+    assert not os.path.exists(path)
+
+
+@pytest.fixture
+def server(tmpdir):
+    with running(str(tmpdir.join('dispatch.sock'))) as path:
+        yield path
+
+
+def client(path, *args, **kwargs):
+    env = dict(os.environ, PYTHONPATH=os.getcwd(), **kwargs.pop('env', {}))
+    command = [sys.executable, '-m', 'subparser.client', path] + list(args)
+    return subprocess.run(command, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, env=env,
+                          universal_newlines=True, **kwargs)
+
+
+def test_server_forwards_context(server, tmpdir):
+    workdir = tmpdir.mkdir('workdir')
+    result = client(server, 'hello', cwd=str(workdir),
+                    env={'ENV_NAME': 'Eric'})
+    assert (result.returncode, result.stdout) == \
+        (0, 'Hello Eric from workdir!\n')
+
+    result = client(server, 'hello',
+                    env={'ENV_NAME': 'Eric', 'SUBPARSER_ENV': 'PATH,HOME'})
+    assert result.stdout.startswith('Hello John')
+
+    result = client(server, 'echo', input='quack')
+    assert result.stdout == 'QUACK'
+
+
+def test_server_replaces_env(tmpdir, monkeypatch):
+    monkeypatch.setenv('ENV_NAME', 'fromserver')
+    with running(str(tmpdir.join('dispatch.sock'))) as path:
+        monkeypatch.delenv('ENV_NAME')
+        assert client(path, 'hello').stdout.startswith('Hello John')
+        result = client(path, 'hello', env={'SUBPARSER_ENV': 'ENV_*,PATH'})
+        assert result.stdout.startswith('Hello John')
+        # variables outside the patterns are left as the server has them
+        result = client(path, 'hello', env={'SUBPARSER_ENV': 'PATH'})
+        assert result.stdout.startswith('Hello fromserver')
+
+
+def test_server_socket(server, tmpdir):
+    # only the owner may connect
+    assert os.stat(server).st_mode & 0o777 == 0o600
+
+    # a file that is not a socket is never replaced
+    path = tmpdir.join('notasocket')
+    path.write('data')
+    with pytest.raises(OSError):
+        DispatchServer(server_subcommand(), str(path),
+                       warm=False).serve_forever()
+    assert path.read() == 'data'
+
+
+def test_server_exit_codes(server):
+    assert client(server, 'fail', '--code', '3').returncode == 3
+    result = client(server, 'fail')
+    assert result.returncode == 1
+    assert 'ValueError: broken' in result.stderr
+    result = client(server, 'bogus')
+    assert result.returncode == 2
+    assert "invalid choice: 'bogus'" in result.stderr
+
+
+def test_server_reloads_config(server, tmpdir):
+    path = str(tmpdir.join('config.json'))
+    with open(path, 'w') as f:
+        json.dump({'name': 'Joe'}, f)
+    assert client(server, 'hello', '-c', path).stdout.startswith('Hello Joe')
+    with open(path, 'w') as f:
+        json.dump({'name': 'Robert'}, f)
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + 1))
+    result = client(server, 'hello', '-c', path)
+    assert result.stdout.startswith('Hello Robert')
+
+
+def test_server_concurrent_clients(server):
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    started = time.time()
+    command = [sys.executable, '-m', 'subparser.client', server, 'wait',
+               '--seconds', '1']
+    clients = [subprocess.Popen(command, env=env) for i in range(5)]
+    assert [c.wait() for c in clients] == [0] * 5
+    assert time.time() - started < 4
@@ -0,0 +1,99 @@
+from __future__ import print_function
+
+import io
+import json
+import sys
+
+import pytest
+
+from subparser import (subparser as make_subparser, JsonLinesExporter,
+                       PercentileAggregator)
+
+
+@pytest.fixture
+def subcommand(tmpdir):
+    configfile = str(tmpdir.join('config.json'))
+    with open(configfile, 'w') as f:
+        json.dump({'count': '3'}, f)
+    subcommand = make_subparser()
+    subcommand.add_config('-c', default=configfile)
+
+    @subcommand
+    def run(name, count):
+        if name == 'fail':
+            raise ValueError(name)
+        return count
+    run.add_argument('--name', env='TIMING_NAME')
+    run.add_argument('--count', type=int, config='count')
+    return subcommand
+
+
+def test_dispatch_timings(subcommand):
+    recorded = []
+    assert subcommand.on_dispatch(recorded.append) == recorded.append
+    assert subcommand.dispatch(['run'], env={'TIMING_NAME': 'Joe'}) == 3
+
+    timings, = recorded
+    assert timings.argv == ['run']
+    assert timings.command == 'run'
+    assert timings.error is None
+    assert set(timings.phases) == set(['config_scan', 'config_load', 'env',
+                                       'config', 'coerce', 'parse',
+                                       'dispatch'])
+    # the main parser and run's parser both read env
+    assert timings.phases['env'][1] == 2
+    assert sum(seconds for seconds, count in timings.phases.values()) <= \
+        timings.total
+
+
+def test_dispatch_timings_errors(subcommand):
+    recorded = []
+    subcommand.on_dispatch(recorded.append)
+    with pytest.raises(ValueError):
+        subcommand.dispatch(['run', '--name', 'fail'], env={})
+    assert isinstance(recorded[0].error, ValueError)
+    assert 'dispatch' in recorded[0].phases
+
+
+def test_untimed_dispatch(subcommand, monkeypatch):
+    def fail(*args):
+        raise AssertionError('timed without hooks')
+    # the package exports the subparser function under the module's name
+    monkeypatch.setattr(sys.modules['subparser.subparser'], 'Timings', fail)
+    assert subcommand.dispatch(['run'], env={}) == 3
+
+
+def test_timing_exporters(subcommand):
+    out = io.StringIO()
+    subcommand.on_dispatch(JsonLinesExporter(out))
+    percentiles = subcommand.on_dispatch(PercentileAggregator())
+    argvs = [['run', '--count', str(i)] for i in range(20)]
+    results = subcommand.dispatch_many(argvs + [['run', '--count', 'x']])
+    assert [r.result for r in results] == list(range(20)) + [None]
+
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert len(lines) == 21
+    assert lines[0]['argv'] == ['run', '--count', '0']
+    assert lines[0]['phases']['parse']['count'] == 1
+    assert lines[-1]['error'].startswith('SystemExit')
+
+    summary = percentiles.summary((50, 100))
+    assert summary['total']['count'] == 21
+    assert summary['dispatch']['count'] == 20
+    assert summary['parse']['p50'] <= summary['parse']['p100']
+    report = io.StringIO()
+    percentiles.report(report)
+    assert report.getvalue().splitlines()[-1].startswith('total')
+
+
+def test_dispatch_async_timings(subcommand):
+    import asyncio
+    recorded = []
+    subcommand.on_dispatch(recorded.append)
+    assert asyncio.run(subcommand.dispatch_async(['run'])) == 3
+    with pytest.raises(ValueError):
+        asyncio.run(subcommand.dispatch_async(['run', '--name', 'fail']))
+    ok, failed = recorded
+    assert (ok.command, ok.error) == ('run', None)
+    assert set(['config_load', 'parse', 'dispatch']) <= set(ok.phases)
+    assert isinstance(failed.error, ValueError)
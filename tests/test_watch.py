@@ -0,0 +1,73 @@
+from __future__ import print_function
+
+import os
+import threading
+
+from conftest import write_json
+from subparser import subparser, JsonConfig
+from subparser.subparser import ConfigFacade
+from subparser.watch import ConfigWatcher
+
+
+def loaded(path):
+    facade = ConfigFacade()
+    facade.impl = JsonConfig()
+    facade.load(path)
+    return facade
+
+
+def test_watcher_check(tmpdir):
+    path = str(tmpdir.join('config.json'))
+    write_json(path, {'name': 'Joe'})
+    facade = loaded(path)
+    first = facade.impl
+    changes = []
+    watcher = ConfigWatcher(facade)
+    watcher.subscribe(lambda old, new: changes.append((old, new)))
+    assert not watcher.check()
+
+    write_json(path, {'name': 'Robert'}, bump=1)
+    assert watcher.check()
+    assert facade.get('name', None) == 'Robert'
+    # the previous snapshot is left untouched
+    assert first.get('name', None) == 'Joe'
+    assert changes == [(first, facade.impl)]
+
+    # a broken file keeps the last good config
+    with open(path, 'w') as f:
+        f.write('{"name": ')
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + 2))
+    assert not watcher.check()
+    assert isinstance(watcher.error, ValueError)
+    assert facade.get('name', None) == 'Robert'
+
+
+def test_watched_dispatch(tmpdir):
+    path = str(tmpdir.join('config.json'))
+    write_json(path, {'name': 'Joe'})
+    subcommand = subparser()
+
+    @subcommand
+    def hello(config):
+        return config.config
+    subcommand.add_config('-c', dest='config', watch=0.01)
+
+    reloaded = threading.Event()
+    subcommand.on_config_change(lambda old, new: reloaded.set())
+    config = subcommand.dispatch(['hello', '-c', path])
+    try:
+        assert config.get('name', None) == 'Joe'
+        watcher = subcommand.config_watcher
+        assert watcher.running
+
+        # dispatching the same file again keeps the running watcher
+        subcommand.dispatch(['hello', '-c', path])
+        assert subcommand.config_watcher is watcher
+
+        write_json(path, {'name': 'Robert'}, bump=1)
+        assert reloaded.wait(5)
+        assert config.get('name', None) == 'Robert'
+    finally:
+        subcommand.config_watcher.stop()
+    assert not subcommand.config_watcher.running